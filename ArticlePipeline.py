@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+# parse the stored articles that a parser hasn't parsed yet. articles are
+# streamed from the database through a bounded queue of worker threads and
+# the results are written in batches together with a checkpoint, so a run can
+# be stopped at any point and resumed later. with skip_duplicates articles
+# that are near duplicates of an earlier article aren't parsed
+class ArticlePipeline(object):
+    def __init__(self, db, parser, parser_name, workers=8, batch_size=100,
+                 skip_duplicates=False):
+        assert workers > 0 and batch_size > 0
+
+        self._db = db
+        self._skip_duplicates = skip_duplicates
+        self._parser = parser
+        self._parser_name = parser_name
+        self._workers = workers
+        self._batch_size = batch_size
+        self._checkpoint_name = f"parse-articles:{parser_name}"
+
+    # returns a tuple with the number of parsed and failed articles
+    def run(self, restart=False):
+        after = 0
+
+        if not restart:
+            after = int(self._db.get_checkpoint(self._checkpoint_name) or 0)
+
+        articles = self._iter_unparsed(after)
+        active = {}
+        batch = []
+        last_rowid = after
+        parsed = 0
+        failed = 0
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            while True:
+                # keep the queue bounded so memory use doesn't depend on the
+                # size of the backlog
+                while len(active) < 2 * self._workers:
+                    article = next(articles, None)
+
+                    if article is None:
+                        break
+
+                    future = executor.submit(self._parser.parse, article[1])
+                    active[future] = article
+                    last_rowid = article[0]
+
+                if not active:
+                    break
+
+                done, _ = wait(active, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    rowid, url = active.pop(future)
+
+                    # a bug parsing one article shouldn't stop the run
+                    try:
+                        res = future.result()
+                    except Exception as e:
+                        print(f"\t{type(e).__name__}: {e} {url}")
+                        failed += 1
+                        continue
+
+                    if res.status_code == 200:
+                        batch.append((url, self._parser_name, res.text))
+                    else:
+                        print(f"\t{res.status_code} {url}")
+                        failed += 1
+
+                if len(batch) >= self._batch_size:
+                    parsed += self._write(batch, active, last_rowid)
+                    batch = []
+
+            parsed += self._write(batch, active, last_rowid)
+
+        return parsed, failed
+
+    # write a batch, everything before the oldest article still in flight has
+    # been handled so that is where a resumed run starts from
+    def _write(self, batch, active, last_rowid):
+        if active:
+            checkpoint = min(x[0] for x in active.values()) - 1
+        else:
+            checkpoint = last_rowid
+
+        inserted = self._db.insert_parsed_articles(
+            batch, (self._checkpoint_name, str(checkpoint)))
+        print(f"Parsed {inserted} articles, checkpoint at rowid {checkpoint}")
+        return inserted
+
+    def _iter_unparsed(self, after):
+        while True:
+            articles = self._db.get_unparsed_articles(
+                self._parser_name, after,
+                skip_duplicates=self._skip_duplicates)
+
+            if not articles:
+                return
+
+            yield from articles
+            after = articles[-1][0]
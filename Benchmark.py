@@ -0,0 +1,489 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from FullText import strip_html
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from Sharding import find_shards
+from SQLite3 import Database
+
+import argparse
+import contextlib
+import FeedParser
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# publishing time of the first synthetic entry
+_epoch = 1546300800
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+# builds the synthetic feeds, the feed with a given index always has the same
+# entries in a given round and churn entries are replaced in every new round
+class Corpus(object):
+    def __init__(self, feeds, entries, churn, hosts, port, seed=0):
+        self.feeds = feeds
+        self.entries = entries
+        self.new_per_round = max(1, int(round(entries * churn)))
+        self.hosts = hosts
+        self.port = port
+        self.seed = seed
+
+    # every feed is served from one of the 127.0.0.x loopback addresses so the
+    # per-host limits of the crawler behave like they would for real hosts
+    def host(self, feed):
+        return f"127.0.0.{1 + feed % self.hosts}"
+
+    def feed_url(self, feed):
+        return f"http://{self.host(feed)}:{self.port}/feed/{feed}"
+
+    def website_url(self, feed):
+        return f"http://{self.host(feed)}:{self.port}/"
+
+    def article_url(self, feed, entry):
+        return f"http://{self.host(feed)}:{self.port}/article/{feed}/{entry}"
+
+    # get the feed document, newest entry first, even feeds are RSS and odd
+    # feeds are Atom
+    def render(self, feed, round_):
+        newest = self.entries + round_ * self.new_per_round
+        ids = range(newest - 1, newest - 1 - self.entries, -1)
+
+        if feed % 2 == 0:
+            return self._render_rss(feed, ids)
+
+        return self._render_atom(feed, ids)
+
+    def _entry(self, feed, entry):
+        rng = random.Random(f"{self.seed}:{feed}:{entry}")
+        length = rng.randint(20, 80)
+        words = " ".join(rng.choice(_words) for _ in range(length))
+        url = self.article_url(feed, entry)
+        published = _epoch + entry * 3600 + feed
+        return url, f"Article {entry} of feed {feed}", words, published
+
+    # get the page of an article, surrounded by the usual navigation, sharing
+    # links, comments and sidebars, and the text of just the article that a
+    # perfect extractor would return
+    def render_article(self, feed, entry):
+        rng = random.Random(f"{self.seed}:{feed}:{entry}:page")
+        _, title, summary, _ = self._entry(feed, entry)
+        paragraphs = [self._paragraph(rng, 2, 6)
+                      for _ in range(rng.randint(4, 10))]
+        comments = "".join(f'<div class="comment"><p>'
+                           f"{self._paragraph(rng, 1, 2)}</p></div>"
+                           for _ in range(rng.randint(0, 6)))
+        links = "".join(f'<li><a href="/article/{feed}/{rng.randint(0, 99)}">'
+                        f"{self._sentence(rng)}</a></li>" for _ in range(8))
+        sections = "".join(f'<a href="/section/{i}">Section {i}</a> '
+                           for i in range(10))
+
+        page = (f"<html><head><title>{title} | Site {feed}</title>"
+                f'<meta name="description" content="{summary[:120]}">'
+                "<script>var tracking = {id: 1};</script>"
+                "<style>body { margin: 0; }</style></head><body>"
+                f'<div class="site-header"><nav>{sections}</nav></div>'
+                '<div id="cookie-banner"><p>We use cookies to improve your '
+                "experience, by using the site you accept them.</p></div>"
+                '<div class="layout"><div class="main-column"><article>'
+                f'<h1>{title}</h1><p class="byline">By Reporter {feed}</p>'
+                f"{''.join(f'<p>{x}</p>' for x in paragraphs)}</article>"
+                '<div class="share-tools"><a href="#">Share</a> '
+                '<a href="#">Email</a></div><div class="comments">'
+                f"<h3>Comments</h3>{comments}"
+                '</div></div><div class="sidebar"><h3>Most read</h3>'
+                f"<ul>{links}</ul><p>Advertisement</p></div></div>"
+                '<footer><p>Copyright Site.</p><a href="/about">About</a>'
+                "</footer></body></html>")
+        return page, " ".join(paragraphs)
+
+    def _sentence(self, rng):
+        words = [rng.choice(_words) for _ in range(rng.randint(6, 18))]
+        words[len(words) // 2] += ","
+        return " ".join(words).capitalize() + "."
+
+    def _paragraph(self, rng, fewest, most):
+        return " ".join(self._sentence(rng)
+                        for _ in range(rng.randint(fewest, most)))
+
+    def _render_rss(self, feed, ids):
+        items = []
+
+        for entry in ids:
+            url, title, summary, published = self._entry(feed, entry)
+            items.append(f"<item><title>{title}</title><link>{url}</link>"
+                         f"<guid>{url}</guid><description>{summary}"
+                         f"</description><pubDate>"
+                         f"{formatdate(published, usegmt=True)}</pubDate>"
+                         "</item>")
+
+        return ('<?xml version="1.0" encoding="utf-8"?><rss version="2.0">'
+                f"<channel><title>Feed {feed}</title>{''.join(items)}"
+                "</channel></rss>")
+
+    def _render_atom(self, feed, ids):
+        entries = []
+
+        for entry in ids:
+            url, title, summary, published = self._entry(feed, entry)
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(published))
+            entries.append(f"<entry><title>{title}</title>"
+                           f'<link rel="alternate" href="{url}"/>'
+                           f"<id>{url}</id><updated>{stamp}</updated>"
+                           f"<summary>{summary}</summary></entry>")
+
+        return ('<?xml version="1.0" encoding="utf-8"?>'
+                '<feed xmlns="http://www.w3.org/2005/Atom">'
+                f"<title>Feed {feed}</title>{''.join(entries)}</feed>")
+
+
+_words = ("the of and to in is that for it as was with be by on not he this "
+          "are or his from at which but have an they you were her she there "
+          "market election storm league council report minister court record "
+          "season police energy health school water price growth").split()
+
+
+# serve the corpus on every host address, round is a shared value the
+# benchmark bumps between crawls. latency is the mean injected delay in
+# seconds and error_rate the share of requests answered with a 503, both are
+# drawn from the corpus seed so a run can be repeated
+def _serve(corpus, round_, latency, error_rate, ready):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            rng = random.Random(f"{corpus.seed}:{self.path}:{round_.value}")
+
+            if latency > 0:
+                time.sleep(rng.expovariate(1 / latency))
+
+            if rng.random() < error_rate:
+                self.send_error(503)
+                return
+
+            if len(parts) == 3 and parts[0] == "article":
+                page, _ = corpus.render_article(int(parts[1]), int(parts[2]))
+                body = page.encode("utf-8")
+                content_type = "text/html; charset=utf-8"
+            elif len(parts) == 2 and parts[0] == "feed":
+                body = corpus.render(int(parts[1]), round_.value)
+                body = body.encode("utf-8")
+                content_type = "application/rss+xml"
+            else:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    servers = [_ThreadingHTTPServer((corpus.host(i), corpus.port), Handler)
+               for i in range(corpus.hosts)]
+
+    for server in servers[1:]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    ready.set()
+    servers[0].serve_forever()
+
+
+def _percentile(values, p):
+    values = sorted(x for x in values if x is not None)
+
+    if not values:
+        return None
+
+    index = int(round(p / 100 * (len(values) - 1)))
+    return values[min(len(values) - 1, index)]
+
+
+def _db_size(db_filename):
+    return sum(os.path.getsize(db_filename + x)
+               for x in ("", "-wal", "-journal")
+               if os.path.exists(db_filename + x))
+
+
+# start serving the synthetic corpus, returns the corpus, the shared round
+# number and the server process
+def _start_server(args):
+    corpus = Corpus(args.feeds, args.entries, args.churn, args.hosts,
+                    args.port, args.seed)
+    round_ = multiprocessing.Value("i", 0)
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=_serve,
+                                     args=(corpus, round_, args.latency,
+                                           args.error_rate, ready),
+                                     daemon=True)
+    server.start()
+    ready.wait()
+    return corpus, round_, server
+
+
+# run the benchmark and return the results
+def run(args, crawler_argv):
+    corpus, round_, server = _start_server(args)
+    tmp_dir = tempfile.mkdtemp(prefix="news-parser-bench-")
+    db_filename = os.path.join(tmp_dir, "bench.db")
+    rounds = []
+
+    try:
+        db = Database(db_filename)
+
+        for i in range(args.feeds):
+            db.update_website(corpus.website_url(i), f"Website {i}", "en",
+                              "gb")
+            db.update_feed(corpus.feed_url(i), corpus.website_url(i),
+                           f"Feed {i}")
+
+        del db
+        crawler_args = FeedParser.argparse_init(["-db", db_filename] +
+                                                crawler_argv)
+        crawler_args.shard_dir = os.path.join(tmp_dir, "shards")
+        metrics = None
+
+        # the metrics port can only be bound once, shards bind their own
+        if crawler_args.shard_count == 0:
+            metrics = FeedParser.init_metrics(crawler_args)
+
+        for i in range(args.rounds):
+            round_.value = i
+
+            # the seeded 503s of a round would leave feeds backing off in
+            # the next one, every round crawls every feed
+            for filename in [db_filename] + find_shards(
+                    crawler_args.shard_dir):
+                Database(filename).reset_health()
+
+            # the crawler's per-feed output would only measure the terminal
+            with open(os.devnull, "w") as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    summary = FeedParser.parse_all_feeds(crawler_args,
+                                                         metrics)
+
+            elapsed = max(summary["elapsed"], 1e-9)
+            rounds.append({
+                "round": i,
+                "feeds": summary["feeds"],
+                "new_articles": summary["new_articles"],
+                "elapsed": summary["elapsed"],
+                "feeds_per_second": summary["feeds"] / elapsed,
+                "articles_per_second": summary["new_articles"] / elapsed,
+                "latency_p50": _percentile(summary["latencies"], 50),
+                "latency_p99": _percentile(summary["latencies"], 99),
+                "db_bytes": _db_size(db_filename)})
+            print(json.dumps(rounds[-1]), file=sys.stderr)
+
+        # ru_maxrss is in kilobytes on linux. the children are the shard
+        # processes, measured before the feed server process ends
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        peak_child_rss = resource.getrusage(
+            resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    finally:
+        server.terminate()
+        shutil.rmtree(tmp_dir)
+
+    return {"config": vars(args), "crawler_args": crawler_argv,
+            "rounds": rounds, "peak_rss_bytes": peak_rss,
+            "peak_shard_rss_bytes": peak_child_rss,
+            "db_bytes": rounds[-1]["db_bytes"] if rounds else 0}
+
+
+# get the text of an article parser's response
+def _article_text(res):
+    article = json.loads(res.text)
+    return article.get("textContent") or strip_html(article.get("content"))
+
+
+# get the f1 score of the words of an extracted text against a reference
+def _token_f1(text, reference):
+    words = Counter(text.lower().split())
+    reference_words = Counter(reference.lower().split())
+    common = sum((words & reference_words).values())
+
+    if common == 0:
+        return 0.0
+
+    precision = common / sum(words.values())
+    recall = common / sum(reference_words.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+# extract the synthetic article pages with each parser and report their
+# throughput and how well their text matches the article text (token f1).
+# with both parsers the python parser is also scored against Readability.js
+def run_extraction(args, crawler_argv):
+    corpus, _, server = _start_server(args)
+    parser_args = FeedParser.argparse_init(crawler_argv)
+    articles = [(i % args.feeds, i) for i in range(args.extraction_articles)]
+    urls = [corpus.article_url(*x) for x in articles]
+    truth = {corpus.article_url(*x): corpus.render_article(*x)[1]
+             for x in articles}
+    results = {}
+    texts = {}
+
+    try:
+        for name in args.extraction_parsers.split(","):
+            module = importlib.import_module(FeedParser.ARTICLE_PARSERS[name])
+
+            try:
+                parser = module.ArticleParser(parser_args)
+            except (OSError, RuntimeError) as e:
+                print(f"Skipping the {name} parser: {e}", file=sys.stderr)
+                continue
+
+            start = time.monotonic()
+
+            with ThreadPoolExecutor(parser_args.parse_workers) as executor:
+                responses = list(executor.map(parser.parse, urls))
+
+            elapsed = time.monotonic() - start
+            del parser
+
+            texts[name] = {url: _article_text(res)
+                           for url, res in zip(urls, responses)
+                           if res.status_code == 200}
+            scores = [_token_f1(texts[name].get(x, ""), truth[x])
+                      for x in urls]
+            results[name] = {"articles": len(urls),
+                             "failed": len(urls) - len(texts[name]),
+                             "elapsed": elapsed,
+                             "articles_per_second": len(urls) / elapsed,
+                             "f1_mean": _mean(scores),
+                             "f1_p10": _percentile(scores, 10)}
+            print(json.dumps({name: results[name]}), file=sys.stderr)
+    finally:
+        server.terminate()
+
+    agreement = None
+
+    if "python" in texts and "readability" in texts:
+        agreement = _mean([_token_f1(texts["python"][x],
+                                     texts["readability"][x])
+                           for x in texts["python"]
+                           if x in texts["readability"]])
+
+    return {"config": vars(args), "crawler_args": crawler_argv,
+            "extraction": results, "python_vs_readability_f1": agreement}
+
+
+# print how each metric changed between two saved results
+def compare(baseline_filename, candidate_filename):
+    with open(baseline_filename, "r") as f:
+        baseline = json.load(f)
+
+    with open(candidate_filename, "r") as f:
+        candidate = json.load(f)
+
+    if "extraction" in baseline:
+        for name in baseline["extraction"]:
+            for metric in ("articles_per_second", "f1_mean", "f1_p10"):
+                _print_change(f"{name} {metric}",
+                              baseline["extraction"][name][metric],
+                              candidate["extraction"].get(name, {}).get(
+                                  metric))
+
+        return
+
+    metrics = ["feeds_per_second", "articles_per_second", "latency_p50",
+               "latency_p99"]
+
+    for old, new in zip(baseline["rounds"], candidate["rounds"]):
+        for metric in metrics:
+            _print_change(f"round {old['round']} {metric}", old[metric],
+                          new[metric])
+
+    for metric in ("peak_rss_bytes", "peak_shard_rss_bytes", "db_bytes"):
+        _print_change(metric, baseline.get(metric), candidate.get(metric))
+
+
+def _print_change(name, old, new):
+    if not old or new is None:
+        print(f"{name:32} {old} -> {new}")
+        return
+
+    change = (new - old) / old * 100
+    print(f"{name:32} {old:14.4f} -> {new:14.4f} ({change:+.1f}%)")
+
+
+# parse command line arguments, anything not recognised is passed on to the
+# crawler (e.g. --workers 16 --seen-index exact)
+def argparse_init():
+    parser = argparse.ArgumentParser(description="Crawl benchmark")
+
+    parser.add_argument("-f", "--feeds", default=500, type=int,
+                        help="Number of synthetic feeds")
+    parser.add_argument("-e", "--entries", default=20, type=int,
+                        help="Number of entries in each feed")
+    parser.add_argument("-ch", "--churn", default=0.1, type=float,
+                        help="Share of each feed's entries replaced per round")
+    parser.add_argument("-r", "--rounds", default=3, type=int,
+                        help="Number of crawls of the corpus")
+    parser.add_argument("-ho", "--hosts", default=16, type=int,
+                        help="Number of loopback hosts to spread feeds over")
+    parser.add_argument("-p", "--port", default=8901, type=int,
+                        help="Port of the synthetic feed server")
+    parser.add_argument("-l", "--latency", default=0.02, type=float,
+                        help="Mean injected response latency in seconds")
+    parser.add_argument("-er", "--error-rate", default=0.01, type=float,
+                        help="Share of requests answered with a 503")
+    parser.add_argument("-s", "--seed", default=0, type=int,
+                        help="Seed of the synthetic corpus")
+    parser.add_argument("-x", "--extraction", action="store_true",
+                        help="Benchmark the article parsers on synthetic "
+                             "article pages instead of crawling")
+    parser.add_argument("-xa", "--extraction-articles", default=200,
+                        type=int, help="Number of article pages to extract")
+    parser.add_argument("-xp", "--extraction-parsers",
+                        default="python,readability", type=str,
+                        help="Comma separated article parsers to compare")
+    parser.add_argument("-o", "--output", default="(none)", type=str,
+                        help="Save the results as JSON to this file")
+    parser.add_argument("-cmp", "--compare", nargs=2, default=None,
+                        metavar=("BASELINE", "CANDIDATE"),
+                        help="Compare two saved results instead of running")
+
+    return parser.parse_known_args()
+
+
+def main():
+    args, crawler_argv = argparse_init()
+
+    if args.compare is not None:
+        compare(*args.compare)
+        return
+
+    if args.extraction:
+        results = run_extraction(args, crawler_argv)
+    else:
+        results = run(args, crawler_argv)
+    print(json.dumps(results, indent=2))
+
+    if args.output != "(none)":
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
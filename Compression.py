@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# compressed values are stored as blobs that start with one of these format
+# bytes, anything stored as text is uncompressed
+_ZLIB = 1
+_ZSTD = 2
+_ZSTD_DICT = 3
+
+
+# compresses article content for storage and transparently decompresses
+# whatever format a stored value is in. zstd needs the zstandard module, zlib
+# is used instead when it isn't installed
+class Codec(object):
+    def __init__(self, method="none", level=None):
+        assert method in ("none", "zlib", "zstd")
+
+        if method == "zstd" and zstandard is None:
+            method = "zlib"
+
+        self.method = method
+        self._level = level
+        self._dicts = {}
+        self._dict_id = None
+        self._compressors = {}
+        self._decompressors = {}
+
+    # register a zstd dictionary, the last one added is used for compression
+    def add_dictionary(self, dict_id, data):
+        if zstandard is None:
+            return
+
+        self._dicts[dict_id] = zstandard.ZstdCompressionDict(data)
+        self._dict_id = dict_id
+
+    def compress(self, text):
+        if self.method == "none" or text is None:
+            return text
+
+        if self.method == "zlib":
+            return self._compress(text, _ZLIB)
+
+        if self._dict_id is None:
+            return self._compress(text, _ZSTD)
+
+        return self._compress(text, _ZSTD_DICT, self._dict_id)
+
+    # compress text in the format of a stored value (with the same zstd
+    # dictionary), so rewriting a value keeps the way it was stored whatever
+    # the codec's own method is
+    def compress_like(self, value, text):
+        if not isinstance(value, bytes) or text is None:
+            return text
+
+        if value[0] == _ZSTD_DICT:
+            return self._compress(text, _ZSTD_DICT,
+                                  struct.unpack(">I", value[1:5])[0])
+
+        return self._compress(text, value[0])
+
+    def _compress(self, text, content_format, dict_id=None):
+        data = text.encode("utf-8")
+
+        if content_format == _ZLIB:
+            level = 6 if self._level is None else self._level
+            return bytes([_ZLIB]) + zlib.compress(data, level)
+
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to write zstd content")
+
+        if content_format == _ZSTD:
+            return bytes([_ZSTD]) + self._compressor(None).compress(data)
+
+        if content_format == _ZSTD_DICT:
+            return (bytes([_ZSTD_DICT]) + struct.pack(">I", dict_id) +
+                    self._compressor(dict_id).compress(data))
+
+        raise ValueError(f"Unknown content format {content_format}")
+
+    def decompress(self, value):
+        if not isinstance(value, bytes):
+            return value
+
+        if value[0] == _ZLIB:
+            return zlib.decompress(value[1:]).decode("utf-8")
+
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read zstd content")
+
+        if value[0] == _ZSTD:
+            data = self._decompressor(None).decompress(value[1:])
+        elif value[0] == _ZSTD_DICT:
+            dict_id = struct.unpack(">I", value[1:5])[0]
+            data = self._decompressor(dict_id).decompress(value[5:])
+        else:
+            raise ValueError(f"Unknown content format {value[0]}")
+
+        return data.decode("utf-8")
+
+    def _compressor(self, dict_id):
+        if dict_id not in self._compressors:
+            level = 3 if self._level is None else self._level
+            self._compressors[dict_id] = zstandard.ZstdCompressor(
+                level=level, dict_data=self._dicts.get(dict_id))
+
+        return self._compressors[dict_id]
+
+    def _decompressor(self, dict_id):
+        if dict_id not in self._decompressors:
+            self._decompressors[dict_id] = zstandard.ZstdDecompressor(
+                dict_data=self._dicts.get(dict_id))
+
+        return self._decompressors[dict_id]
+
+
+# train a zstd dictionary on sample content, returns its (id, data) or None
+# if zstandard isn't installed
+def train_dictionary(samples, dict_size=112640):
+    if zstandard is None:
+        return None
+
+    samples = [x.encode("utf-8") for x in samples]
+    dictionary = zstandard.train_dictionary(dict_size, samples)
+    return dictionary.dict_id(), dictionary.as_bytes()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+
+# fetch feeds concurrently while keeping all database writes on the calling
+# thread, which is the only thread allowed to use the sqlite connection
+class Crawler(object):
+    def __init__(self, feed_parser, max_workers=8, max_per_host=2):
+        assert max_workers > 0 and max_per_host > 0
+
+        self._feed_parser = feed_parser
+        self._max_workers = max_workers
+        self._max_per_host = max_per_host
+
+    # fetch and store all the given feeds, returns the number of feeds crawled
+    def crawl(self, feed_urls, callback=None):
+        # group the feeds by host so a single host can't take up every worker
+        pending = OrderedDict()
+
+        for url in feed_urls:
+            host = urlparse(url).netloc.lower()
+            pending.setdefault(host, deque()).append(url)
+
+        active = {}
+        host_load = Counter()
+        crawled = 0
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            while pending or active:
+                # hand out work round robin across hosts until either the
+                # global or every per-host limit is reached
+                for host in list(pending):
+                    queue = pending[host]
+
+                    while (queue and len(active) < self._max_workers and
+                           host_load[host] < self._max_per_host):
+                        url = queue.popleft()
+                        cache = self._feed_parser.get_feed_cache(url)
+                        future = executor.submit(self._feed_parser.fetch_feed,
+                                                 url, cache)
+                        active[future] = (host, url)
+                        host_load[host] += 1
+
+                    if not queue:
+                        del pending[host]
+
+                done, _ = wait(active, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    host, url = active.pop(future)
+                    host_load[host] -= 1
+
+                    # a bug fetching one feed shouldn't stop the crawl
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = self._feed_parser.error_result(url, e)
+
+                    inserted = self._feed_parser.store_feed(result)
+                    crawled += 1
+
+                    if callback is not None:
+                        callback(result, inserted)
+
+        return crawled
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# keys of a feedparser entry that only repeat another key or one of the
+# article columns, the compact schema doesn't store them. authors,
+# author_detail and the published string hold more than the columns (every
+# author, emails and the original date with its time zone) so they're kept
+_redundant = {"title", "title_detail", "summary_detail", "author", "id",
+              "guidislink", "link", "published_parsed", "updated_parsed",
+              "created_parsed", "expired_parsed"}
+
+
+# serialize a value as compact json, with orjson if it is installed
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value, default=_default).decode("utf-8")
+
+    return json.dumps(value, separators=(",", ":"))
+
+
+# orjson doesn't serialize time.struct_time, json writes it as a list
+def _default(value):
+    if isinstance(value, tuple):
+        return list(value)
+
+    raise TypeError
+
+
+# format a parsed feedparser date (always utc) like sqlite's CURRENT_TIMESTAMP
+def _format_time(parsed):
+    if not parsed:
+        return None
+
+    return time.strftime("%Y-%m-%d %H:%M:%S", tuple(parsed))
+
+
+# get the values of the title, published, author and guid article columns
+def entry_columns(entry):
+    published = entry.get("published_parsed") or entry.get("updated_parsed")
+    return {"title": entry.get("title"), "published": _format_time(published),
+            "author": entry.get("author"), "guid": entry.get("id")}
+
+
+# drop the keys of an entry that the article columns or other keys already
+# hold. the alternate link is the article url, other links (e.g. enclosures)
+# are kept
+def compact_entry(entry):
+    compact = {k: v for k, v in entry.items() if k not in _redundant}
+    links = [x for x in entry.get("links", [])
+             if x.get("rel") != "alternate" or x.get("href") != entry.get(
+                 "link")]
+
+    if links:
+        compact["links"] = links
+    else:
+        compact.pop("links", None)
+
+    return compact
+
+
+# split an entry into its column values and the json content stored with them,
+# the full schema keeps the whole entry in the content
+def serialize_entry(entry, schema="full"):
+    assert schema in ("full", "compact")
+
+    article = entry_columns(entry)
+
+    if schema == "compact":
+        entry = compact_entry(entry)
+
+    article["content"] = dumps(entry)
+    return article
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import bz2
+import gzip
+import io
+import json
+import lzma
+import sys
+
+_openers = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+_stream_openers = {"gz": lambda f: gzip.GzipFile(fileobj=f, mode="wb"),
+                   "bz2": lambda f: bz2.BZ2File(f, "wb"),
+                   "xz": lambda f: lzma.LZMAFile(f, "wb")}
+
+
+# open an export destination for writing text, "-" is stdout and the file
+# extension selects the compression
+def open_output(path, compress=None):
+    if path == "-":
+        if compress is None:
+            return sys.stdout
+
+        # closing the wrapper finishes the stream but leaves stdout open
+        stream = _stream_openers[compress](sys.stdout.buffer)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+
+    for extension, opener in _openers.items():
+        if path.endswith(extension):
+            return opener(path, "wt", encoding="utf-8")
+
+    return open(path, "w", encoding="utf-8")
+
+
+# parse a "time,rowid" cursor as written by export_articles
+def parse_cursor(cursor):
+    fst, _, rowid = cursor.rpartition(",")
+    return fst, int(rowid)
+
+
+# stream the articles in a time range to out as json lines, keeping memory
+# use constant. returns the number of articles written and the cursor of the
+# last one, or None if nothing was written. by is the time column ("time" or
+# "published") the range and cursor refer to
+def export_articles(db, out, fst, lst, after=None, chunk_size=1000,
+                    by="time"):
+    count = 0
+    cursor = None
+
+    for article in db.iter_articles(fst, lst, chunk_size, after, by):
+        out.write(json.dumps(article))
+        out.write("\n")
+        count += 1
+        cursor = f"{article[by]},{article['rowid']}"
+
+    return count, cursor
@@ -1,68 +1,402 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from HTTPRequest import HTTPRequest
+from ArticlePipeline import ArticlePipeline
+from collections import Counter, namedtuple
+from Crawler import Crawler
+from EntrySchema import serialize_entry
+from Export import export_articles, open_output, parse_cursor
+from HTTPRequest import CircuitBreaker, HTTPRequest
+from Import import read_feeds
+from Metrics import Metrics
+from Scheduler import Scheduler
+from SeenIndex import SeenIndex
+from Sharding import find_shards, shard_feed_urls, shard_filename
 from SQLite3 import Database
+from StreamParser import StreamParseError, iter_entries
 
 import argparse
+import cProfile
 import feedparser as fp
+import hashlib
+import importlib
 import json
+import multiprocessing
+import os
+import pstats
+import sqlite3
+import sys
+import time
+
+# the outcome of fetching and parsing a single feed, skipped is set to
+# "not_modified" or "unchanged" when the feed didn't need to be parsed,
+# elapsed is the number of seconds the fetch and parse took and stream is set
+# to "stopped_early" or "stream_fallback" by the stream parser
+FeedResult = namedtuple("FeedResult", ["url", "status_code", "text",
+                                       "entries", "cache", "skipped",
+                                       "elapsed", "stream"])
+FeedResult.__new__.__defaults__ = (None, None)
+
+# the module with the ArticleParser of each --parse-articles choice
+ARTICLE_PARSERS = {"mercury": "MercuryParser", "python": "PythonParser",
+                   "readability": "ReadabilityParser"}
 
 
 class FeedParser(object):
-    def __init__(self, db, user_agent=None):
+    # with stream feeds are parsed incrementally and, if there is a seen index,
+    # parsing stops after stop_after_known consecutive known entries.
+    # entry_schema is "full" to store whole entries or "compact" to drop the
+    # keys the article columns already hold
+    def __init__(self, db, user_agent=None, seen=None, http=None,
+                 stream=False, stop_after_known=3, metrics=None,
+                 entry_schema="full"):
         self._db = db
-        self._user_agent = user_agent
+        self._entry_schema = entry_schema
+        self._seen = seen
+        self._metrics = metrics if metrics is not None else Metrics(False)
+        self._stream = stream
+        self._stop_after_known = stop_after_known
 
-    def parse_feed(self, feed_url):
-        assert self._db is not None
+        if http is None:
+            http = HTTPRequest(2500, 3, user_agent)
+
+        self._http = http
+
+        # only updated by the thread that stores feeds
+        self.stats = Counter()
+
+    # get the cache validators for a feed, must be called from the thread that
+    # owns the database connection
+    def get_feed_cache(self, feed_url):
+        return self._db.get_feed_cache(feed_url)
+
+    # fetch and parse a feed, this doesn't touch the database so it is safe to
+    # call from worker threads
+    def fetch_feed(self, feed_url, cache=None):
+        start = time.monotonic()
+        result = self._fetch_feed(feed_url, cache)
+        return result._replace(elapsed=time.monotonic() - start)
+
+    def _fetch_feed(self, feed_url, cache):
+        headers = {}
+
+        # only download the feed if it changed since the last fetch
+        if cache is not None:
+            if cache["etag"]:
+                headers["If-None-Match"] = cache["etag"]
+
+            if cache["last_modified"]:
+                headers["If-Modified-Since"] = cache["last_modified"]
 
         # get raw feed
-        res = HTTPRequest(2500, 3, self._user_agent).get(feed_url)
+        with self._metrics.timer("fetch", feed_url):
+            res = self._http.get(feed_url, headers)
+
+        self._metrics.incr("bytes", len(res.content), feed_url)
+
+        if res.status_code == 304:
+            return FeedResult(feed_url, res.status_code, None, None, None,
+                              "not_modified")
 
         if res.status_code != 200:
-            print(f"\t{res.status_code}")
-            print(f"\t{res.text}".replace("\n", "\n\t"))
-            return
+            self._metrics.incr("errors", 1, feed_url)
+            return FeedResult(feed_url, res.status_code, res.text, None, None,
+                              None)
+
+        new_cache = {"etag": res.headers.get("ETag"),
+                     "last_modified": res.headers.get("Last-Modified"),
+                     "hash": hashlib.sha1(res.content).hexdigest()}
+
+        if cache is not None and cache["hash"] == new_cache["hash"]:
+            return FeedResult(feed_url, res.status_code, None, None,
+                              new_cache, "unchanged")
 
         # parse feed
-        feed = fp.parse(res.text)
+        with self._metrics.timer("parse", feed_url):
+            entries = stream = None
+
+            if self._stream:
+                entries, stream = self._stream_entries(res.content)
+
+            if entries is None:
+                entries = fp.parse(res.text).entries
+
+        return FeedResult(feed_url, res.status_code, None, entries, new_cache,
+                          None, stream=stream)
+
+    # parse a feed incrementally, feeds are newest first so a run of entries we
+    # already know means the rest is known too. returns the entries, or None
+    # if the feed has to be parsed by feedparser, and "stopped_early",
+    # "stream_fallback" or None. the outcome is counted in stats by the
+    # thread that stores the feed, this runs in worker threads
+    def _stream_entries(self, content):
+        entries = []
+        known = 0
+
+        try:
+            for entry in iter_entries(content):
+                entries.append(entry)
+
+                if self._seen is None:
+                    continue
+
+                if not self._seen.might_contain(entry.link):
+                    known = 0
+                    continue
+
+                known += 1
+
+                if known >= self._stop_after_known:
+                    return entries, "stopped_early"
+        except StreamParseError:
+            return None, "stream_fallback"
+
+        return entries, None
+
+    # get the result of a feed whose fetch raised an unexpected exception,
+    # status 604 is an error of the fetch or parse rather than the server
+    def error_result(self, feed_url, error):
+        self._metrics.incr("errors", 1, feed_url)
+        return FeedResult(feed_url, 604, f"{type(error).__name__}: {error}",
+                          None, None, None)
+
+    # store the new entries of a fetched feed, returns the number of new
+    # articles
+    def store_feed(self, result):
+        assert self._db is not None
+
+        print(f"Parsing {result.url}")
+        self._metrics.incr("feeds")
+
+        if result.stream is not None:
+            self.stats[result.stream] += 1
+
+        if result.skipped is not None:
+            print(f"\t{result.status_code} ({result.skipped})")
+            self.stats[result.skipped] += 1
+
+            # the validators may still have changed for an unchanged body
+            if result.cache is not None:
+                self._store_feed_cache(result.url, result.cache)
+
+            return 0
+
+        if result.entries is None:
+            print(f"\t{result.status_code}")
+            print(f"\t{result.text}".replace("\n", "\n\t"))
+            return 0
 
-        for entry in feed.entries:
-            # check if the feed item is already in the database
-            if self._db.check_if_article_exists(entry.link):
-                continue
+        entries = result.entries
+        skipped = 0
 
-            # pass the article to the article parser and store any response
-            print(f"\t{entry.link}")
-            website_url = self._db.get_website_for_feed(feed_url)
-            self._db.insert_article(entry.link, feed_url, website_url,
-                                    json.dumps(entry))
+        # drop the entries the seen index knows about before going to sqlite
+        if self._seen is not None:
+            with self._metrics.timer("dedup", result.url):
+                entries = [x for x in entries
+                           if not self._seen.check(x.link)]
 
+            skipped = len(result.entries) - len(entries)
 
-# add rss feeds from a json file to the database
+        inserted = 0
+
+        # dedup and write all the entries of the feed in one transaction
+        if entries:
+            with self._metrics.timer("insert", result.url):
+                website_url = self._db.get_website_for_feed(result.url)
+                articles = (dict(serialize_entry(entry, self._entry_schema),
+                                 url=entry.link, feed=result.url,
+                                 website=website_url)
+                            for entry in entries)
+                inserted, db_skipped = self._db.insert_articles(articles)
+
+            skipped += db_skipped
+
+            if self._seen is not None:
+                for entry in entries:
+                    self._seen.add(entry.link)
+
+        print(f"\t{inserted} new, {skipped} already stored")
+        self._metrics.incr("new_entries", inserted, result.url)
+
+        # only remember the feed once its entries have been stored
+        self._store_feed_cache(result.url, result.cache)
+        return inserted
+
+    def _store_feed_cache(self, feed_url, cache):
+        self._db.update_feed_cache(feed_url, cache["etag"],
+                                   cache["last_modified"], cache["hash"])
+
+    def parse_feed(self, feed_url):
+        cache = self.get_feed_cache(feed_url)
+        return self.store_feed(self.fetch_feed(feed_url, cache))
+
+
+# add or update rss feeds and their websites from a json, json lines or csv
+# file in a single transaction, nothing is imported from a malformed file
 def add_feeds(args):
-    with open(args.add_feeds, "r") as f:
-        feeds = json.loads(f.read())
+    db = Database(args.db_filename, args.wal, args.compression)
+    file_format = None if args.add_format == "auto" else args.add_format
+
+    try:
+        counts = db.import_feeds(read_feeds(args.add_feeds, file_format))
+    except ValueError as e:
+        print(f"Invalid feeds file: {e}", file=sys.stderr)
+        return
+
+    for table in ("websites", "feeds"):
+        x = counts[table]
+        print(f"Imported {table}: {x['inserted']} inserted, "
+              f"{x['updated']} updated ({x['moved']} to another protocol), "
+              f"{x['unchanged']} unchanged")
+
+
+# stream the articles in a time range to a json lines file
+def export(args):
+    db = Database(args.db_filename, args.wal, args.compression)
+    after = None
+
+    if args.export_after != "(none)":
+        after = parse_cursor(args.export_after)
+
+    compress = None if args.export_compress == "none" else args.export_compress
+    out = open_output(args.export, compress)
+
+    try:
+        count, cursor = export_articles(db, out, args.export_from,
+                                        args.export_to, after,
+                                        args.export_chunk_size, args.export_by)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    # report on stderr so it doesn't end up in an export written to stdout
+    print(f"Exported {count} articles", file=sys.stderr)
+
+    if cursor is not None:
+        print(f"Resume with --export-after '{cursor}'", file=sys.stderr)
+
+
+# search the stored articles and print a page of results as json lines
+def search(args):
+    db = Database(args.db_filename, args.wal, args.compression)
+    filters = [None if x == "(none)" else x
+               for x in (args.search_website, args.search_language,
+                         args.search_country)]
+    offset = (args.search_page - 1) * args.search_limit
+
+    try:
+        results = db.search_articles(args.search, args.search_from,
+                                     args.search_to, *filters,
+                                     limit=args.search_limit, offset=offset)
+    except sqlite3.OperationalError as e:
+        print(f"Invalid search query: {e}", file=sys.stderr)
+        return
+
+    for result in results:
+        print(json.dumps(result))
+
+    print(f"Page {args.search_page}: {len(results)} results", file=sys.stderr)
+
+
+# fingerprint the stored articles again and cluster their near duplicates
+def rebuild_fingerprints(args):
+    db = Database(args.db_filename, args.wal, args.compression)
+    duplicates = db.rebuild_fingerprints()
+    print(f"Found {duplicates} near duplicate articles")
+
+
+# print the near duplicates of an article
+def show_duplicates(args):
+    db = Database(args.db_filename, args.wal, args.compression)
+
+    for url in db.get_near_duplicates(args.duplicates_of):
+        print(url)
+
+
+# rebuild the full text index of the stored articles
+def rebuild_fts(args):
+    db = Database(args.db_filename, args.wal, args.compression)
+    indexed = db.rebuild_full_text_index()
+
+    if indexed is None:
+        print("No full text index (sqlite was built without fts5)")
+    else:
+        print(f"Indexed {indexed} articles")
+
 
-    db = Database(args.db_filename)
+# print the failing hosts and the failing or inactive feeds as json, after
+# reactivating the inactive feeds if asked to
+def health_report(args):
+    db = Database(args.db_filename, args.wal, args.compression)
 
-    for feed in feeds:
-        print(f"Updating {feed}")
+    if args.reactivate_feeds:
+        print(f"Reactivated {db.reactivate_feeds()} feeds")
 
-        feed_url = feed["url"]
-        feed_name = feed["name"]
-        website_url = feed["website_url"]
-        website_name = feed["website_name"]
-        website_lang = feed["website_language"]
-        website_country = feed["website_country"]
+    if args.health_report:
+        print(json.dumps(db.get_health_report(), indent=2))
 
-        db.update_website(website_url, website_name, website_lang,
-                          website_country)
-        db.update_feed(feed_url, website_url, feed_name)
 
+# move old articles to monthly archive partitions and give the space they
+# took back to the file system
+def archive(args):
+    db = Database(args.db_filename, args.wal, args.compression)
+    archived = db.archive_articles(args.archive_dir, args.archive_older_than,
+                                   args.archive_compression)
 
-# parse command line arguments
-def argparse_init():
+    for month, count in archived.items():
+        print(f"Archived {count} articles from {month}")
+
+    print(f"Freed {db.incremental_vacuum()} pages")
+
+
+# compress or compact stored content and report on how well it compresses
+def compress_content(args):
+    db = Database(args.db_filename, args.wal, args.compression)
+
+    if args.train_dictionary:
+        dict_id = db.train_compression_dictionary()
+
+        if dict_id is None:
+            print("No dictionary trained (needs zstandard and articles)")
+        else:
+            print(f"Trained compression dictionary {dict_id}")
+
+    if args.compress_content:
+        try:
+            compressed = db.compress_existing_content(
+                pause=args.compress_pause)
+            print(f"Compressed {compressed} rows")
+        except ValueError as e:
+            print(f"Content not compressed: {e}, see --compression",
+                  file=sys.stderr)
+
+    if args.compact_entries:
+        compacted = db.compact_existing_articles(pause=args.compress_pause)
+        print(f"Compacted {compacted} articles")
+
+    if args.content_stats:
+        print(json.dumps(db.get_content_stats(), indent=2))
+
+
+# parse the stored articles that haven't been parsed by a parser yet
+def parse_articles(args):
+    db = Database(args.db_filename, args.wal, args.compression)
+    module = ARTICLE_PARSERS[args.parse_articles]
+    parser = importlib.import_module(module).ArticleParser(args)
+    pipeline = ArticlePipeline(db, parser, args.parse_articles,
+                               args.parse_workers, args.parse_batch_size,
+                               args.parse_skip_duplicates)
+
+    start = time.monotonic()
+    parsed, failed = pipeline.run(args.parse_restart)
+    elapsed = time.monotonic() - start
+
+    rate = parsed / elapsed if elapsed > 0 else 0.0
+    print(f"Parsed {parsed} articles ({failed} failed) in {elapsed:.1f}s "
+          f"({rate:.2f} articles/s)")
+
+
+# parse command line arguments, argv defaults to sys.argv
+def argparse_init(argv=None):
     parser = argparse.ArgumentParser(description="Feed parser")
 
     parser.add_argument("-db", "--db-filename", default="articles.db",
@@ -70,9 +404,216 @@ def argparse_init():
     parser.add_argument("-ua", "--user-agent", default="(none)", type=str,
                         help="A custom user agent to use for HTTP requests")
     parser.add_argument("-add", "--add-feeds", default="(none)", type=str,
-                        help="Parse a JSON file and add RSS feeds to the db")
+                        help="Add or update RSS feeds from a JSON, JSON lines "
+                             "(.jsonl) or CSV (.csv) file, - for stdin")
+    parser.add_argument("-af", "--add-format", default="auto",
+                        choices=["auto", "json", "jsonl", "csv"],
+                        help="Format of the feeds file, by default taken "
+                             "from its extension")
+    parser.add_argument("-exp", "--export", default="(none)", type=str,
+                        help="Export articles as JSON lines to a file (- for "
+                             "stdout), .gz/.bz2/.xz files are compressed")
+    parser.add_argument("-ef", "--export-from", default="0000-00-00 00:00:00",
+                        type=str, help="Export articles stored at or after "
+                                       "this time")
+    parser.add_argument("-et", "--export-to", default="9999-12-31 23:59:59",
+                        type=str, help="Export articles stored at or before "
+                                       "this time")
+    parser.add_argument("-ea", "--export-after", default="(none)", type=str,
+                        help="Resume an export after a 'time,rowid' cursor")
+    parser.add_argument("-ec", "--export-compress", default="none",
+                        choices=["none", "gz", "bz2", "xz"],
+                        help="Compression for an export written to stdout")
+    parser.add_argument("-ecs", "--export-chunk-size", default=1000, type=int,
+                        help="Number of articles read from the db at a time")
+    parser.add_argument("-eb", "--export-by", default="time",
+                        choices=["time", "published"],
+                        help="Select and order exported articles by the time "
+                             "they were stored or published at")
+    parser.add_argument("-q", "--search", default="(none)", type=str,
+                        help="Search the articles' title, summary and parsed "
+                             "text with an FTS5 query, best matches first")
+    parser.add_argument("-qf", "--search-from", default="0000-00-00 00:00:00",
+                        type=str, help="Only search articles stored at or "
+                                       "after this time")
+    parser.add_argument("-qt", "--search-to", default="9999-12-31 23:59:59",
+                        type=str, help="Only search articles stored at or "
+                                       "before this time")
+    parser.add_argument("-qw", "--search-website", default="(none)", type=str,
+                        help="Only search articles of this website")
+    parser.add_argument("-ql", "--search-language", default="(none)",
+                        type=str, help="Only search articles of websites in "
+                                       "this language")
+    parser.add_argument("-qc", "--search-country", default="(none)", type=str,
+                        help="Only search articles of websites from this "
+                             "country")
+    parser.add_argument("-qn", "--search-limit", default=20, type=int,
+                        help="Number of search results per page")
+    parser.add_argument("-qp", "--search-page", default=1, type=int,
+                        help="Page of search results to show")
+    parser.add_argument("-rfts", "--rebuild-fts", action="store_true",
+                        help="Rebuild the full text index, e.g. after "
+                             "upgrading an existing db")
+    parser.add_argument("-nd", "--near-duplicates", action="store_true",
+                        help="Fingerprint new articles and cluster the near "
+                             "duplicates of stored articles")
+    parser.add_argument("-rfp", "--rebuild-fingerprints", action="store_true",
+                        help="Fingerprint and cluster all stored articles")
+    parser.add_argument("-dup", "--duplicates-of", default="(none)",
+                        type=str, help="Print the near duplicates of an "
+                                       "article")
+    parser.add_argument("-arc", "--archive", action="store_true",
+                        help="Move old articles to compressed monthly "
+                             "partition databases")
+    parser.add_argument("-aot", "--archive-older-than", default=90, type=int,
+                        help="Archive the articles stored more than this "
+                             "many days ago")
+    parser.add_argument("-ad", "--archive-dir", default="archive", type=str,
+                        help="Directory of the archive partitions")
+    parser.add_argument("-ac", "--archive-compression", default="zstd",
+                        choices=["zlib", "zstd"],
+                        help="Compression of archived content, zstd falls "
+                             "back to zlib if zstandard isn't installed")
+    parser.add_argument("-c", "--compression", default="none",
+                        choices=["none", "zlib", "zstd"],
+                        help="Compress newly stored content, zstd falls back "
+                             "to zlib if zstandard isn't installed")
+    parser.add_argument("-cc", "--compress-content", action="store_true",
+                        help="Compress existing content in small batches")
+    parser.add_argument("-cp", "--compress-pause", default=0, type=float,
+                        help="Seconds to pause between compression or "
+                             "compaction batches")
+    parser.add_argument("-td", "--train-dictionary", action="store_true",
+                        help="Train a zstd dictionary on stored articles")
+    parser.add_argument("-es", "--entry-schema", default="full",
+                        choices=["full", "compact"],
+                        help="Store whole feed entries or only the fields "
+                             "that aren't in the article columns")
+    parser.add_argument("-ce", "--compact-entries", action="store_true",
+                        help="Rewrite stored entries with the compact schema "
+                             "in small batches")
+    parser.add_argument("-cs", "--content-stats", action="store_true",
+                        help="Report the compression ratio of stored content")
+    parser.add_argument("-wal", "--wal", action="store_true",
+                        help="Use the WAL journal with relaxed syncing for "
+                             "faster writes")
+    parser.add_argument("-si", "--seen-index", default="none",
+                        choices=["none", "exact", "bloom"],
+                        help="Keep an in-memory index of stored article urls "
+                             "to avoid database lookups")
+    parser.add_argument("-be", "--bloom-error-rate", default=0.01,
+                        type=float, help="False positive rate of the bloom "
+                                         "filter seen index")
+    parser.add_argument("-ct", "--connect-timeout", default=5, type=float,
+                        help="Seconds to wait for an HTTP connection")
+    parser.add_argument("-rt", "--read-timeout", default=30, type=float,
+                        help="Seconds to wait for data from an HTTP server")
+    parser.add_argument("-mrs", "--max-response-size", default=16777216,
+                        type=int, help="Largest HTTP response body in bytes")
+    parser.add_argument("-w", "--workers", default=8, type=int,
+                        help="Maximum number of feeds to fetch at once")
+    parser.add_argument("-ph", "--per-host", default=2, type=int,
+                        help="Maximum number of feeds to fetch at once from "
+                             "a single host")
+    parser.add_argument("-pa", "--parse-articles", default="(none)",
+                        choices=["(none)"] + sorted(ARTICLE_PARSERS),
+                        help="Parse the stored articles that haven't been "
+                             "parsed with this parser yet")
+    parser.add_argument("-pw", "--parse-workers", default=8, type=int,
+                        help="Maximum number of articles to parse at once")
+    parser.add_argument("-pb", "--parse-batch-size", default=100, type=int,
+                        help="Number of parsed articles written per "
+                             "transaction")
+    parser.add_argument("-psd", "--parse-skip-duplicates",
+                        action="store_true",
+                        help="Don't parse articles that are near duplicates "
+                             "of an earlier article")
+    parser.add_argument("-pr", "--parse-restart", action="store_true",
+                        help="Ignore the checkpoint of previous runs, e.g. "
+                             "to retry failed articles")
+    parser.add_argument("-ppw", "--python-parser-workers",
+                        default=os.cpu_count() or 1, type=int,
+                        help="Number of processes extracting articles with "
+                             "the python parser")
+    parser.add_argument("-mk", "--mercury-api-key", default=None, type=str,
+                        help="API key for the Mercury Web Parser")
+    parser.add_argument("-rp", "--readability-port", default=3000, type=int,
+                        help="First port of the Readability.js servers")
+    parser.add_argument("-rl", "--readability-log-file",
+                        default="readability.log", type=str,
+                        help="Log file of the Readability.js servers")
+    parser.add_argument("-rw", "--readability-workers",
+                        default=os.cpu_count() or 1, type=int,
+                        help="Number of Readability.js servers to run")
+    parser.add_argument("-rst", "--readability-startup-timeout", default=30,
+                        type=float, help="Seconds to wait for a "
+                                         "Readability.js server to start")
+    parser.add_argument("-ra", "--readability-attach", action="store_true",
+                        help="Use Readability.js servers that are already "
+                             "running instead of launching new ones")
+    parser.add_argument("-rk", "--readability-keep-running",
+                        action="store_true",
+                        help="Leave the Readability.js servers running when "
+                             "done so later runs can attach to them")
+    parser.add_argument("-sp", "--stream-parser", action="store_true",
+                        help="Parse feeds incrementally with lxml, falling "
+                             "back to feedparser for malformed feeds")
+    parser.add_argument("-sak", "--stop-after-known", default=3, type=int,
+                        help="Stop parsing a feed after this many consecutive "
+                             "known entries (needs --seen-index)")
+    parser.add_argument("-mf", "--metrics-file", default="(none)", type=str,
+                        help="Write Prometheus metrics to this file after "
+                             "every crawl")
+    parser.add_argument("-ms", "--metrics-summary", default="(none)",
+                        type=str, help="Write a JSON summary with per-feed "
+                                       "metrics to this file after every "
+                                       "crawl")
+    parser.add_argument("-mp", "--metrics-port", default=0, type=int,
+                        help="Serve Prometheus metrics on "
+                             "http://localhost:PORT/metrics")
+    parser.add_argument("-pf", "--profile-feed", default="(none)", type=str,
+                        help="Profile parsing a single feed with cProfile")
+    parser.add_argument("-po", "--profile-output", default="(none)",
+                        type=str, help="Save the profile to this file "
+                                       "instead of printing it")
+    parser.add_argument("-sc", "--shard-count", default=0, type=int,
+                        help="Split the feeds over this many shard databases "
+                             "and crawl them in parallel processes")
+    parser.add_argument("-sx", "--shard-index", default=-1, type=int,
+                        help="Only crawl this shard (e.g. on another host), "
+                             "by default all shards are crawled locally")
+    parser.add_argument("-sd", "--shard-dir", default="shards", type=str,
+                        help="Directory of the shard databases")
+    parser.add_argument("-msh", "--merge-shards", action="store_true",
+                        help="Merge the shard databases into the db")
+    parser.add_argument("-cbt", "--circuit-threshold", default=5, type=int,
+                        help="Stop requesting from a host after this many "
+                             "failed requests in a row")
+    parser.add_argument("-cbr", "--circuit-reset", default=300, type=float,
+                        help="Seconds before a failed host is tried again, "
+                             "doubling with every further failure")
+    parser.add_argument("-mbo", "--max-backoff", default=604800, type=int,
+                        help="Longest time in seconds between two polls of "
+                             "a failing feed")
+    parser.add_argument("-ga", "--gone-after", default=3, type=int,
+                        help="Stop polling a feed after this many 404 or 410 "
+                             "responses in a row")
+    parser.add_argument("-hr", "--health-report", action="store_true",
+                        help="Report the failing hosts and the failing or "
+                             "inactive feeds")
+    parser.add_argument("-raf", "--reactivate-feeds", action="store_true",
+                        help="Poll the inactive feeds again")
+    parser.add_argument("-d", "--daemon", action="store_true",
+                        help="Keep running and poll each feed when the "
+                             "scheduler says it is due")
+    parser.add_argument("-mini", "--min-interval", default=900, type=int,
+                        help="Shortest time in seconds between two polls of "
+                             "a feed")
+    parser.add_argument("-maxi", "--max-interval", default=86400, type=int,
+                        help="Longest time in seconds between two polls of "
+                             "a feed")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.user_agent == "(none)":
         args.user_agent = None
@@ -80,25 +621,253 @@ def argparse_init():
     return args
 
 
-# parse all RSS feeds and store the articles in the database
-def parse_all_feeds(args):
-    db = Database(args.db_filename)
-    feed_parser = FeedParser(db, args.user_agent)
+# everything needed to crawl feeds into the database
+CrawlContext = namedtuple("CrawlContext", ["db", "seen", "feed_parser",
+                                           "crawler", "scheduler", "metrics",
+                                           "breaker"])
+
+
+# set up the metrics of a run and serve them if args.metrics_port is set
+def init_metrics(args):
+    metrics = Metrics(args.metrics_file != "(none)" or
+                      args.metrics_summary != "(none)" or
+                      args.metrics_port > 0)
+
+    if args.metrics_port > 0:
+        metrics.serve(args.metrics_port)
+
+    return metrics
+
+
+# set up the database and everything needed to crawl feeds into it, metrics
+# are set up from args unless already running ones are given
+def _init_crawler(args, metrics=None):
+    if metrics is None:
+        metrics = init_metrics(args)
+
+    if args.shard_count > 0:
+        db, seen_db = _open_shard(args, metrics)
+    else:
+        db = seen_db = Database(args.db_filename, args.wal, args.compression,
+                                metrics, args.near_duplicates)
+
+    seen = None
+
+    # a shard's seen index knows the articles of the main db too
+    if args.seen_index != "none":
+        seen = SeenIndex(seen_db, args.seen_index, args.bloom_error_rate)
+
+    # hosts that failed in earlier runs stay skipped until their timeout
+    breaker = CircuitBreaker(args.circuit_threshold, args.circuit_reset)
+    breaker.load(db.get_host_health())
+
+    http = HTTPRequest(2500, 3, args.user_agent, args.connect_timeout,
+                       args.read_timeout, args.max_response_size,
+                       args.per_host, metrics, breaker)
+    feed_parser = FeedParser(db, args.user_agent, seen, http,
+                             args.stream_parser, args.stop_after_known,
+                             metrics, args.entry_schema)
+    crawler = Crawler(feed_parser, args.workers, args.per_host)
+    scheduler = Scheduler(db, args.min_interval, args.max_interval,
+                          max_backoff=args.max_backoff,
+                          gone_after=args.gone_after)
+    return CrawlContext(db, seen, feed_parser, crawler, scheduler, metrics,
+                        breaker)
+
+
+# open the shard database of args.shard_index and seed it with the shard's
+# feeds, returns the shard and the main database
+def _open_shard(args, metrics):
+    main_db = Database(args.db_filename, args.wal, args.compression)
+    feed_urls = shard_feed_urls(main_db.get_all_feed_urls(), args.shard_count,
+                                args.shard_index)
+
+    os.makedirs(args.shard_dir, exist_ok=True)
+    db = Database(shard_filename(args.shard_dir, args.shard_index), args.wal,
+                  args.compression, metrics)
+    db.seed_shard(args.db_filename, feed_urls)
+    return db, main_db
+
+
+# run target in a process for every shard, each shard gets its own metrics
+# port and files. returns the results of the processes in shard order
+def _launch_shards(args, target):
+    # migrate the main db once rather than in every process at the same time
+    Database(args.db_filename, args.wal, args.compression)
+    shard_args = []
+
+    for i in range(args.shard_count):
+        x = argparse.Namespace(**vars(args))
+        x.shard_index = i
+
+        if args.metrics_port > 0:
+            x.metrics_port = args.metrics_port + i
+
+        for name in ("metrics_file", "metrics_summary"):
+            if getattr(args, name) != "(none)":
+                root, ext = os.path.splitext(getattr(args, name))
+                setattr(x, name, f"{root}.{i}{ext}")
 
-    for url in db.get_all_feed_urls():
-        print(f"Parsing {url}")
-        feed_parser.parse_feed(url)
+        shard_args.append(x)
+
+    with multiprocessing.Pool(args.shard_count) as pool:
+        return pool.map(target, shard_args)
+
+
+# merge the shard databases into the main database, shards don't fingerprint
+# their articles so near duplicates are found while merging
+def merge_shards(args):
+    db = Database(args.db_filename, args.wal, args.compression,
+                  near_duplicates=args.near_duplicates)
+
+    for filename in find_shards(args.shard_dir):
+        merged, skipped = db.merge_shard(filename)
+        print(f"Merged {filename}: {merged} new, {skipped} already stored")
+
+
+# crawl the given feeds once and report on the run, returns a summary with
+# the number of feeds and new articles, the run time and per-feed latencies
+def _crawl(args, context, feed_urls):
+    feed_parser = context.feed_parser
+    feed_parser.stats.clear()
+    summary = {"new_articles": 0, "latencies": []}
+
+    def on_result(result, inserted):
+        context.scheduler.reschedule(result, inserted)
+        summary["new_articles"] += inserted
+        summary["latencies"].append(result.elapsed)
+
+    start = time.monotonic()
+    summary["feeds"] = context.crawler.crawl(feed_urls, on_result)
+    summary["elapsed"] = time.monotonic() - start
+    context.db.update_host_health(context.breaker.snapshot())
+
+    elapsed = summary["elapsed"]
+    rate = summary["feeds"] / elapsed if elapsed > 0 else 0.0
+    print(f"Parsed {summary['feeds']} feeds in {elapsed:.1f}s "
+          f"({rate:.2f} feeds/s), {summary['new_articles']} new articles")
+    print(f"Skipped {feed_parser.stats['not_modified']} not modified and "
+          f"{feed_parser.stats['unchanged']} unchanged feeds")
+
+    if feed_parser.stats["stopped_early"] or feed_parser.stats[
+            "stream_fallback"]:
+        print(f"Stopped {feed_parser.stats['stopped_early']} feeds early, "
+              f"{feed_parser.stats['stream_fallback']} fell back to "
+              f"feedparser")
+
+    if context.seen is not None:
+        print(f"Seen index: {json.dumps(context.seen.metrics())}")
+
+    if args.metrics_file != "(none)":
+        context.metrics.write_prometheus(args.metrics_file)
+
+    if args.metrics_summary != "(none)":
+        context.metrics.write_summary(args.metrics_summary)
+
+    return summary
+
+
+# parse all active RSS feeds, except failing ones that are backing off, and
+# store the articles in the database. with shards and no shard index every
+# shard is crawled in its own process and merged into the database
+# afterwards, the summaries of the shards are combined. metrics lets repeated
+# runs share the metrics from init_metrics, shards set up their own
+def parse_all_feeds(args, metrics=None):
+    if args.shard_count > 0 and args.shard_index < 0:
+        start = time.monotonic()
+        summaries = _launch_shards(args, parse_all_feeds)
+        merge_shards(args)
+        return {"feeds": sum(x["feeds"] for x in summaries),
+                "new_articles": sum(x["new_articles"] for x in summaries),
+                "elapsed": time.monotonic() - start,
+                "latencies": [y for x in summaries for y in x["latencies"]]}
+
+    context = _init_crawler(args, metrics)
+    return _crawl(args, context, context.db.get_active_feed_urls())
+
+
+# keep polling feeds as they become due until interrupted, with shards and no
+# shard index every shard is polled by its own process. shards are only
+# merged by --merge-shards
+def run_daemon(args):
+    if args.shard_count > 0 and args.shard_index < 0:
+        _launch_shards(args, run_daemon)
+        return
+
+    context = _init_crawler(args)
+
+    try:
+        while True:
+            due = context.db.get_due_feed_urls()
+
+            if due:
+                _crawl(args, context, due)
+
+            # wake up at least once a minute to pick up newly added feeds
+            sleep = context.scheduler.seconds_until_next_poll()
+            time.sleep(min(max(sleep, 1), 60))
+    except KeyboardInterrupt:
+        print("Stopping")
+
+
+# fetch, parse and store a single feed under cProfile
+def profile_feed(args):
+    context = _init_crawler(args)
+    profiler = cProfile.Profile()
+    profiler.runcall(context.feed_parser.parse_feed, args.profile_feed)
+
+    if args.profile_output != "(none)":
+        profiler.dump_stats(args.profile_output)
+    else:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
 
 
 def main():
     args = argparse_init()
 
-    if args.add_feeds == "(none)":
-        # parse feeds
-        parse_all_feeds(args)
-    else:
+    if args.add_feeds != "(none)":
         # add/update feeds
         add_feeds(args)
+    elif args.merge_shards:
+        # merge shard databases
+        merge_shards(args)
+    elif args.export != "(none)":
+        # export articles
+        export(args)
+    elif args.search != "(none)":
+        # search stored articles
+        search(args)
+    elif args.rebuild_fingerprints:
+        # fingerprint stored articles
+        rebuild_fingerprints(args)
+    elif args.duplicates_of != "(none)":
+        # show near duplicates
+        show_duplicates(args)
+    elif args.rebuild_fts:
+        # rebuild the full text index
+        rebuild_fts(args)
+    elif args.health_report or args.reactivate_feeds:
+        # report on or reactivate failing feeds
+        health_report(args)
+    elif args.archive:
+        # archive old articles
+        archive(args)
+    elif args.parse_articles != "(none)":
+        # parse stored articles
+        parse_articles(args)
+    elif (args.compress_content or args.train_dictionary or
+          args.compact_entries or args.content_stats):
+        # compress or compact stored content
+        compress_content(args)
+    elif args.profile_feed != "(none)":
+        # profile a single feed
+        profile_feed(args)
+    elif args.daemon:
+        # parse feeds as they become due
+        run_daemon(args)
+    else:
+        # parse feeds
+        parse_all_feeds(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from html.parser import HTMLParser
+
+import json
+
+# elements whose text isn't part of what a reader sees
+_hidden_tags = {"script", "style", "noscript", "template"}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _hidden_tags:
+            self._hidden += 1
+
+    def handle_endtag(self, tag):
+        if tag in _hidden_tags and self._hidden > 0:
+            self._hidden -= 1
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self.parts.append(data)
+
+
+# get the visible text of an html fragment with whitespace collapsed
+def strip_html(html):
+    if not html:
+        return ""
+
+    if "<" not in html and "&" not in html:
+        return " ".join(html.split())
+
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return " ".join(" ".join(extractor.parts).split())
+
+
+def _loads(content):
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+# get the title and summary text of a stored feed entry, title is the value
+# of the article's title column if it has one
+def entry_text(content, title=None):
+    entry = _loads(content)
+
+    if not isinstance(entry, dict):
+        return title or "", ""
+
+    summary = entry.get("summary")
+
+    # some feeds only have the full content
+    if not summary:
+        summary = " ".join(x.get("value", "") for x in entry.get("content", [])
+                           if isinstance(x, dict))
+
+    return title or entry.get("title") or "", strip_html(summary)
+
+
+# get the text of a parsed article, parsers return json with the article's
+# html (and sometimes its text) or just the html
+def parsed_text(content):
+    parsed = _loads(content)
+
+    if not isinstance(parsed, dict):
+        return strip_html(content)
+
+    if parsed.get("textContent"):
+        return " ".join(parsed["textContent"].split())
+
+    return strip_html(parsed.get("content") or "")
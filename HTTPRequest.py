@@ -1,35 +1,212 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from collections import namedtuple
+from Metrics import Metrics
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from urllib3.util.request import ACCEPT_ENCODING
 
+import random
 import requests
+import threading
 import time
 
+RequestError = namedtuple("response", ["status_code", "text", "headers",
+                                       "content"])
 
+# statuses that mean a host as a whole is failing rather than a single url
+_host_failure_statuses = {502, 503, 504}
+
+
+# per-host circuit breakers. a host's circuit opens after threshold
+# consecutive failed requests (connection failures or 502/503/504 responses)
+# and requests to it are refused until it has been open for reset_timeout
+# seconds, which doubles every time a probe request fails, up to
+# max_reset_timeout. then a single probe request is let through and the
+# circuit closes again if it succeeds. it is thread safe and its state can be
+# saved and restored so a dead host stays skipped across runs
+class CircuitBreaker(object):
+    def __init__(self, threshold=5, reset_timeout=300,
+                 max_reset_timeout=86400):
+        assert threshold > 0 and reset_timeout > 0
+
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self._max_reset_timeout = max(max_reset_timeout, reset_timeout)
+        self._lock = threading.Lock()
+
+        # host -> [consecutive failures, open until (epoch seconds) or None,
+        # last error]
+        self._hosts = {}
+        self._probing = set()
+
+        # hosts whose state changed since they were loaded or last saved
+        self._updated = set()
+
+    @staticmethod
+    def host(url):
+        return urlparse(url).netloc.lower()
+
+    # check if a request to a host may be made, only one request at a time is
+    # let through to a host whose reset timeout has passed
+    def allow(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+
+            if state is None or state[1] is None:
+                return True
+
+            if time.time() < state[1] or host in self._probing:
+                return False
+
+            self._probing.add(host)
+            return True
+
+    def record_success(self, host):
+        with self._lock:
+            self._probing.discard(host)
+
+            if self._hosts.get(host) != [0, None, None]:
+                self._hosts[host] = [0, None, None]
+                self._updated.add(host)
+
+    def record_failure(self, host, error):
+        with self._lock:
+            self._probing.discard(host)
+            state = self._hosts.setdefault(host, [0, None, None])
+            state[0] += 1
+            state[2] = error
+            self._updated.add(host)
+
+            if state[0] >= self._threshold:
+                timeout = self._reset_timeout * 2 ** (state[0] -
+                                                      self._threshold)
+                timeout = min(timeout, self._max_reset_timeout)
+                state[1] = time.time() + timeout
+
+    # get (host, failures, open until, last error) for every host whose state
+    # changed since it was loaded or the last snapshot, so saving a snapshot
+    # doesn't overwrite hosts another process updated
+    def snapshot(self):
+        with self._lock:
+            hosts = [(x, *self._hosts[x]) for x in self._updated]
+            self._updated.clear()
+            return hosts
+
+    # restore hosts from (host, failures, open until, last error) tuples
+    def load(self, hosts):
+        with self._lock:
+            for host, failures, open_until, error in hosts:
+                self._hosts[host] = [failures, open_until, error]
+
+
+# a long lived http client, connections are pooled per host and kept alive
+# between requests so create one instance and share it (it is thread safe)
 class HTTPRequest(object):
-    def __init__(self, delay=0, tries=3, user_agent=None):
+    def __init__(self, delay=0, tries=3, user_agent=None, connect_timeout=5,
+                 read_timeout=30, max_response_size=16 * 1024 * 1024,
+                 pool_size=10, metrics=None, breaker=None):
+        self._metrics = metrics if metrics is not None else Metrics(False)
+        self._breaker = breaker
         self._delay = delay
         self._tries = tries
         self._user_agent = user_agent
+        self._timeout = (connect_timeout, read_timeout)
+        self._max_response_size = max_response_size
 
-    # returns http status code 600 for a connection failure
-    def get(self, url, additional_headers=None):
-        remaining_tries = self._tries
+        # pool_size is the number of connections kept alive for each host
+        adapter = HTTPAdapter(pool_connections=100, pool_maxsize=pool_size)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
 
+        # only ask for the encodings urllib3 can decode, br is only there when
+        # both urllib3 (1.25 or later) and the brotli package support it
+        self._session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+    # returns http status code 600 for a connection failure, 601 when the
+    # response is larger than max_response_size and 602 when the circuit
+    # breaker of the host is open
+    def get(self, url, additional_headers=None):
         if additional_headers is None:
             additional_headers = {}
 
         additional_headers["User-Agent"] = self._user_agent
+        host = CircuitBreaker.host(url)
 
-        while remaining_tries > 0:
-            try:
-                response = requests.get(url, headers=additional_headers)
-                return response
-            except:
-                remaining_tries -= 1
+        for attempt in range(self._tries):
+            # a host may fail while a request to it is retried
+            if self._breaker is not None and not self._breaker.allow(host):
+                self._metrics.incr("http_circuit_open")
+                return RequestError(status_code=602, text="Circuit open",
+                                    headers={}, content=b"")
+
+            if attempt > 0:
+                self._metrics.incr("http_retries")
 
                 if self._delay > 0:
-                    time.sleep(self._delay/1000)
+                    # exponential backoff with full jitter, delay is the base
+                    # in ms
+                    backoff = self._delay * 2 ** (attempt - 1) / 1000
+                    time.sleep(random.uniform(0, backoff))
+
+            self._metrics.incr("http_requests")
+
+            try:
+                with self._metrics.timer("http"):
+                    response = self._session.get(url,
+                                                 headers=additional_headers,
+                                                 timeout=self._timeout,
+                                                 stream=True)
+                    response = self._read_body(response)
+
+                self._metrics.incr("http_bytes", len(response.content))
+            except requests.RequestException:
+                self._metrics.incr("http_errors")
+                self._record(host, "Connection failure")
+                continue
+
+            if response.status_code in _host_failure_statuses:
+                self._record(host, f"HTTP {response.status_code}")
+            else:
+                self._record(host)
+
+            return response
+
+        return RequestError(status_code=600, text="Connection failure",
+                            headers={}, content=b"")
+
+    # record the outcome of a request with the circuit breaker, error is None
+    # if the host responded normally
+    def _record(self, host, error=None):
+        if self._breaker is None:
+            return
+
+        if error is None:
+            self._breaker.record_success(host)
+        else:
+            self._breaker.record_failure(host, error)
+
+    # read the (decompressed) body, giving up once it gets too large
+    def _read_body(self, response):
+        with response:
+            length = response.headers.get("Content-Length")
+
+            if (length is not None and length.isdigit() and
+                    int(length) > self._max_response_size):
+                return self._too_large()
+
+            body = bytearray()
+
+            for chunk in response.iter_content(64 * 1024):
+                body.extend(chunk)
+
+                if len(body) > self._max_response_size:
+                    return self._too_large()
+
+            response._content = bytes(body)
+            return response
 
-        RequestError = namedtuple("response", ["status_code", "text"])
-        return RequestError(status_code=600, text="Connection failure")
+    def _too_large(self):
+        return RequestError(status_code=601, text="Response too large",
+                            headers={}, content=b"")
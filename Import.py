@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import os
+import re
+import sys
+
+_openers = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+_formats = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+_whitespace_re = re.compile(r"[ \t\n\r]*")
+
+# keys every imported feed has, e.g. the columns of a csv file
+feed_keys = ("url", "name", "website_url", "website_name", "website_language",
+             "website_country")
+
+
+# open an import source for reading text, "-" is stdin and the file extension
+# selects the compression
+def open_input(path):
+    if path == "-":
+        return sys.stdin
+
+    for extension, opener in _openers.items():
+        if path.endswith(extension):
+            return opener(path, "rt", encoding="utf-8", newline="")
+
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+# get the format of an import file ("json", "jsonl" or "csv") from its
+# extension without the compression one, stdin and other files are json
+def input_format(path):
+    for extension in _openers:
+        if path.endswith(extension):
+            path = path[:-len(extension)]
+
+    return _formats.get(os.path.splitext(path)[1].lower(), "json")
+
+
+# iterate over the values of a json array without loading it all at once
+def _iter_json_array(f, chunk_size=65536):
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size)
+    pos = _whitespace_re.match(buffer).end()
+
+    if buffer[pos:pos + 1] != "[":
+        raise ValueError("Expected a JSON array")
+
+    pos += 1
+
+    while True:
+        pos = _whitespace_re.match(buffer, pos).end()
+        char = buffer[pos:pos + 1]
+
+        if char == "]":
+            return
+
+        if char == ",":
+            pos += 1
+            continue
+
+        try:
+            value, pos = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            # the value may continue in the next chunk
+            more = f.read(chunk_size)
+
+            if not more:
+                raise
+
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+
+        yield value
+
+
+def _iter_json_lines(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+# stream the feeds of a json array, json lines or csv file (or stdin in the
+# given format), each feed is a dict with at least the feed_keys. raises
+# ValueError for a malformed file
+def read_feeds(path, file_format=None):
+    if file_format is None:
+        file_format = input_format(path)
+
+    f = open_input(path)
+
+    try:
+        if file_format == "csv":
+            rows = csv.DictReader(f)
+        elif file_format == "jsonl":
+            rows = _iter_json_lines(f)
+        else:
+            rows = _iter_json_array(f)
+
+        for i, feed in enumerate(rows, 1):
+            missing = [x for x in feed_keys
+                       if not isinstance(feed, dict) or feed.get(x) is None]
+
+            if missing:
+                raise ValueError(f"Feed {i} has no {', '.join(missing)}")
+
+            yield feed
+    except csv.Error as e:
+        raise ValueError(str(e))
+    finally:
+        if f is not sys.stdin:
+            f.close()
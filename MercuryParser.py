@@ -7,9 +7,10 @@ from HTTPRequest import HTTPRequest
 class ArticleParser(object):
     def __init__(self, args):
         self._api_key = args.mercury_api_key
-        self._user_agent = args.user_agent
+        self._http = HTTPRequest(2500, 3, args.user_agent,
+                                 args.connect_timeout, args.read_timeout)
 
     def parse(self, url):
         api_url = f"https://mercury.postlight.com/parser?url={url}"
         req_headers = {"x-api-key": self._api_key}
-        return HTTPRequest(2500, 3, self._user_agent).get(api_url, req_headers)
+        return self._http.get(api_url, req_headers)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import json
+import threading
+import time
+
+_prefix = "news_parser"
+
+
+# collects per-stage timings and counters, overall and per feed. it is thread
+# safe and does nothing when disabled, so it can be passed around
+# unconditionally
+class Metrics(object):
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._counters = Counter()
+        self._stage_counts = Counter()
+        self._stage_seconds = Counter()
+        self._feeds = defaultdict(Counter)
+
+    # add to a counter, e.g. bytes, new_entries or errors
+    def incr(self, name, value=1, feed=None):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._counters[name] += value
+
+            if feed is not None:
+                self._feeds[feed][name] += value
+
+    # record the time spent in a stage, e.g. fetch, parse, dedup or insert
+    def observe(self, stage, seconds, feed=None):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._stage_counts[stage] += 1
+            self._stage_seconds[stage] += seconds
+
+            if feed is not None:
+                self._feeds[feed][f"{stage}_seconds"] += seconds
+
+    # time the body of a with statement as a stage
+    @contextmanager
+    def timer(self, stage, feed=None):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, feed)
+
+    # get the metrics in the prometheus text exposition format
+    def prometheus(self):
+        with self._lock:
+            lines = [f"# TYPE {_prefix}_stage_seconds summary"]
+
+            for stage in sorted(self._stage_counts):
+                labels = f'{{stage="{stage}"}}'
+                lines.append(f"{_prefix}_stage_seconds_sum{labels} "
+                             f"{self._stage_seconds[stage]:.6f}")
+                lines.append(f"{_prefix}_stage_seconds_count{labels} "
+                             f"{self._stage_counts[stage]}")
+
+            for name in sorted(self._counters):
+                lines.append(f"# TYPE {_prefix}_{name}_total counter")
+                lines.append(f"{_prefix}_{name}_total {self._counters[name]}")
+
+        lines.append(f"# TYPE {_prefix}_start_time_seconds gauge")
+        lines.append(f"{_prefix}_start_time_seconds {self._started:.3f}")
+        return "\n".join(lines) + "\n"
+
+    # get a json serializable summary of the run, including every feed
+    def summary(self):
+        with self._lock:
+            stages = {x: {"count": self._stage_counts[x],
+                          "seconds": self._stage_seconds[x]}
+                      for x in self._stage_counts}
+            return {"started": self._started,
+                    "duration": time.time() - self._started,
+                    "stages": stages, "counters": dict(self._counters),
+                    "feeds": {k: dict(v) for k, v in self._feeds.items()}}
+
+    def write_prometheus(self, filename):
+        with open(filename, "w") as f:
+            f.write(self.prometheus())
+
+    def write_summary(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    # serve the metrics on http://localhost:port/metrics from a daemon thread
+    def serve(self, port):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("localhost", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib
+import re
+import struct
+
+# minhash signatures have BANDS * ROWS = 32 values. two texts land in the same
+# bucket of at least one lsh band with a probability of 1 - (1 - j^ROWS)^BANDS
+# for a jaccard similarity j of their shingles, i.e. the lookup finds over 98%
+# of the texts with j >= 0.8 and under 20% of the ones with j < 0.4
+BANDS = 8
+ROWS = 4
+THRESHOLD = 0.6
+
+# number of words in a shingle and the fewest shingles worth fingerprinting,
+# shorter texts (e.g. just a title) would match too many unrelated articles
+_SHINGLE_SIZE = 3
+_MIN_SHINGLES = 8
+
+_signature = struct.Struct(">32I")
+_word_re = re.compile(r"\w+", re.UNICODE)
+
+
+# get the minhash signature of the word shingles of a text, or None if the
+# text is too short to tell duplicates apart
+def signature(text):
+    words = _word_re.findall(text.lower())
+    shingles = {" ".join(words[i:i + _SHINGLE_SIZE])
+                for i in range(len(words) - _SHINGLE_SIZE + 1)}
+
+    if len(shingles) < _MIN_SHINGLES:
+        return None
+
+    return tuple(map(min, zip(*map(_hash_values, shingles))))
+
+
+# get the 32 independent 32 bit hashes of a shingle from two 64 byte blake2b
+# digests, they stand in for the random permutations of textbook minhash
+def _hash_values(shingle):
+    data = shingle.encode("utf-8")
+    return _signature.unpack(hashlib.blake2b(data, salt=b"0").digest() +
+                             hashlib.blake2b(data, salt=b"1").digest())
+
+
+# get the lsh bucket of each band of a signature as a signed 64 bit integer,
+# the band number is part of the key so the buckets of the bands don't mix
+def band_keys(signature):
+    keys = []
+
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        data = struct.pack(f">B{ROWS}I", band, *rows)
+        digest = hashlib.blake2b(data, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+
+    return keys
+
+
+# estimate the jaccard similarity of the texts of two signatures
+def similarity(a, b):
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def pack(signature):
+    return _signature.pack(*signature)
+
+
+def unpack(data):
+    return _signature.unpack(data)
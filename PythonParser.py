@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from HTTPRequest import HTTPRequest
+
+import copy
+import json
+import multiprocessing
+import re
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+# the result of parsing a page, text is the extracted article as json like the
+# Readability.js server returns it. status 603 means the page was fetched but
+# no article content was found in it
+ParseResult = namedtuple("ParseResult", ["status_code", "text"])
+
+# elements that never hold article content
+_removed_tags = ("script", "style", "noscript", "iframe", "form", "svg",
+                 "nav", "footer", "aside", "button", "input", "select",
+                 "textarea", "object", "embed")
+
+# class and id patterns of boilerplate, a positive match keeps an element
+_unlikely_re = re.compile(r"banner|breadcrumb|combx|comment|community|cookie|"
+                          r"disqus|extra|footer|gdpr|header|legends|menu|"
+                          r"modal|related|remark|replies|rss|shoutbox|"
+                          r"sidebar|skyscraper|social|sponsor|ad-break|"
+                          r"agegate|pagination|pager|popup|share|subscribe|"
+                          r"newsletter", re.I)
+_maybe_re = re.compile(r"and|article|body|column|content|main|shadow|story",
+                       re.I)
+_positive_re = re.compile(r"article|body|content|entry|hentry|h-entry|main|"
+                          r"page|post|text|blog|story", re.I)
+_negative_re = re.compile(r"-ad-|hidden|banner|combx|comment|com-|contact|"
+                          r"foot|footnote|gdpr|masthead|media|meta|outbrain|"
+                          r"promo|related|scroll|share|shoutbox|sidebar|"
+                          r"skyscraper|sponsor|shopping|tags|tool|widget",
+                          re.I)
+_byline_re = re.compile(r"byline|author|dateline|writtenby", re.I)
+_title_separator_re = re.compile(r"\s[|\-–—:»/]\s")
+_block_tags = {"address", "article", "aside", "blockquote", "div", "dl",
+               "fieldset", "figure", "footer", "form", "h1", "h2", "h3", "h4",
+               "h5", "h6", "header", "hr", "main", "nav", "ol", "p", "pre",
+               "section", "table", "ul"}
+
+
+# extract the main content of an html page with readability's approach:
+# boilerplate is removed, paragraphs score their parent and grandparent by
+# length and commas, the best scoring element wins and its siblings that score
+# well enough or look like article text are added to it. html is bytes in
+# the given encoding, lxml looks for it in the page if it is None. returns a
+# dict with the same keys as the Readability.js server or None without content
+def extract(html, url=None, encoding=None):
+    parser = lxml.html.HTMLParser(encoding=encoding)
+
+    try:
+        doc = lxml.html.document_fromstring(html, parser=parser)
+    except (etree.ParserError, LookupError):
+        return None
+
+    if url is not None:
+        doc.make_links_absolute(url, resolve_base_href=True,
+                                handle_failures="ignore")
+
+    title = _title(doc)
+    byline = _meta(doc, "author", "article:author")
+    excerpt = _meta(doc, "description", "og:description")
+    site_name = _meta(doc, "og:site_name")
+    _remove_boilerplate(doc)
+
+    scores = _score_paragraphs(doc)
+
+    if not scores:
+        return None
+
+    top = max(scores, key=scores.get)
+    article = _collect_article(top, scores)
+    byline = _remove_byline(article) or byline
+    _remove_title(article, title)
+    _clean(article)
+
+    # separate the text of neighbouring elements, e.g. paragraphs
+    text = " ".join(" ".join(article.itertext()).split())
+
+    if not text:
+        return None
+
+    return {"title": title, "byline": byline, "excerpt": excerpt,
+            "siteName": site_name, "url": url,
+            "content": lxml.html.tostring(article, encoding="unicode"),
+            "textContent": text, "length": len(text)}
+
+
+def _meta(doc, *names):
+    for name in names:
+        for element in doc.iter("meta"):
+            if name in (element.get("name"), element.get("property")):
+                content = (element.get("content") or "").strip()
+
+                if content:
+                    return content
+
+    return None
+
+
+# get the page title without the site name, sites add it before or after the
+# title separated by e.g. " | "
+def _title(doc):
+    title = _meta(doc, "og:title")
+
+    if title is None:
+        element = doc.find(".//title")
+        title = element.text_content().strip() if element is not None else ""
+
+        parts = _title_separator_re.split(title)
+
+        if len(parts) > 1:
+            title = max(parts, key=len).strip()
+
+    return title
+
+
+def _class_weight(element):
+    weight = 0
+
+    for value in (element.get("class"), element.get("id")):
+        if not value:
+            continue
+
+        if _negative_re.search(value):
+            weight -= 25
+
+        if _positive_re.search(value):
+            weight += 25
+
+    return weight
+
+
+def _remove_boilerplate(doc):
+    for element in list(doc.iter(etree.Comment, *_removed_tags)):
+        if element.getparent() is not None:
+            element.drop_tree()
+
+    for element in list(doc.iter()):
+        if (not isinstance(element.tag, str) or element.getparent() is None or
+                element.tag in ("body", "article", "main")):
+            continue
+
+        match = f"{element.get('class', '')} {element.get('id', '')}"
+
+        if _unlikely_re.search(match) and not _maybe_re.search(match):
+            element.drop_tree()
+
+
+def _link_density(element):
+    length = len(element.text_content())
+
+    if length == 0:
+        return 0.0
+
+    links = sum(len(x.text_content()) for x in element.iter("a"))
+    return links / length
+
+
+def _initial_score(element):
+    score = {"div": 5, "pre": 3, "td": 3, "blockquote": 3, "address": -3,
+             "ol": -3, "ul": -3, "dl": -3, "dd": -3, "dt": -3, "li": -3,
+             "form": -3, "h1": -5, "h2": -5, "h3": -5, "h4": -5, "h5": -5,
+             "h6": -5, "th": -5}.get(element.tag, 0)
+    return score + _class_weight(element)
+
+
+# score the ancestors of the paragraphs, divs without block children count as
+# paragraphs. scores are scaled by how little of an element's text is links
+def _score_paragraphs(doc):
+    scores = {}
+
+    for element in doc.iter("p", "pre", "td", "div"):
+        if element.tag == "div" and any(x.tag in _block_tags
+                                        for x in element.iterchildren()):
+            continue
+
+        text = element.text_content().strip()
+
+        if len(text) < 25:
+            continue
+
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        parent = element.getparent()
+        ancestors = [(parent, 1.0)]
+
+        if parent is not None:
+            ancestors.append((parent.getparent(), 0.5))
+
+        for ancestor, share in ancestors:
+            if ancestor is None or not isinstance(ancestor.tag, str):
+                continue
+
+            if ancestor not in scores:
+                scores[ancestor] = _initial_score(ancestor)
+
+            scores[ancestor] += score * share
+
+    return {k: v * (1 - _link_density(k)) for k, v in scores.items()}
+
+
+# put the top candidate and its related siblings in a new div
+def _collect_article(top, scores):
+    threshold = max(10, scores[top] * 0.2)
+    parent = top.getparent()
+    siblings = [top] if parent is None else list(parent)
+    article = lxml.html.Element("div")
+
+    for sibling in siblings:
+        if not isinstance(sibling.tag, str):
+            continue
+
+        append = sibling is top or scores.get(sibling, 0) >= threshold
+
+        if not append and sibling.tag == "p":
+            text = sibling.text_content()
+            density = _link_density(sibling)
+            append = (len(text) > 80 and density < 0.25 or
+                      density == 0 and re.search(r"\.( |$)", text))
+
+        if append:
+            sibling = copy.deepcopy(sibling)
+            sibling.tail = None
+            article.append(sibling)
+
+    return article
+
+
+# remove the byline of the article and return its text
+def _remove_byline(article):
+    for element in article.iter():
+        match = f"{element.get('class', '')} {element.get('id', '')}"
+
+        if element.getparent() is None or not _byline_re.search(match):
+            continue
+
+        byline = " ".join(element.text_content().split())
+
+        if 0 < len(byline) < 100:
+            element.drop_tree()
+            return byline
+
+    return None
+
+
+# remove the headline at the start of the article if it repeats the title
+def _remove_title(article, title):
+    for element in article.iter("h1", "h2"):
+        if " ".join(element.text_content().split()) == title:
+            element.drop_tree()
+
+        return
+
+
+# drop lists, tables and sections of the article that are mostly links or
+# look like boilerplate
+def _clean(article):
+    for element in list(article.iter("ul", "ol", "table", "div", "section")):
+        if element.getparent() is None:
+            continue
+
+        text = element.text_content()
+        density = _link_density(element)
+
+        if (_class_weight(element) < 0 or density > 0.5 or
+                len(text) < 25 and not len(element.findall(".//img"))):
+            element.drop_tree()
+
+
+# parse HTML pages in-process without Node or an external API. pages are
+# fetched with a shared http client on the calling thread and their content is
+# extracted in a pool of processes, so parse can be called from many threads
+class ArticleParser(object):
+    def __init__(self, args):
+        if lxml is None:
+            raise RuntimeError("the python parser needs lxml")
+
+        self._http = HTTPRequest(2500, 3, args.user_agent,
+                                 args.connect_timeout, args.read_timeout,
+                                 pool_size=args.parse_workers)
+
+        # the processes are started here, before the caller starts threads
+        self._pool = multiprocessing.Pool(args.python_parser_workers)
+
+    def __del__(self):
+        self._pool.terminate()
+
+    def parse(self, url):
+        res = self._http.get(url)
+
+        if res.status_code != 200:
+            return ParseResult(res.status_code, res.text)
+
+        # without a charset in the headers let lxml find it in the page
+        content_type = res.headers.get("Content-Type", "")
+        encoding = res.encoding if "charset" in content_type else None
+        article = self._pool.apply(extract, (res.content, res.url, encoding))
+
+        if article is None:
+            return ParseResult(603, "No article content found")
+
+        return ParseResult(200, json.dumps(article))
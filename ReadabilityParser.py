@@ -3,28 +3,151 @@
 from HTTPRequest import HTTPRequest
 
 import os
+import requests
 import signal
 import subprocess
+import threading
 import time
 import urllib
 
 
-# parse HTML pages with the Readability.js server
+# a single Readability.js server process, either one we launched or an
+# already running one we attached to
+class _Server(object):
+    def __init__(self, readability_dir, port, log_file, startup_timeout=30,
+                 keep_running=False, stop_timeout=10):
+        self._readability_dir = readability_dir
+        self._log_file = log_file
+        self._startup_timeout = startup_timeout
+        self._stop_timeout = stop_timeout
+        self._keep_running = keep_running
+        self._process = None
+        self.port = port
+        self.outstanding = 0
+        self.generation = 0
+        self.restarting = False
+        self.attached = False
+        self.failed = False
+        self.startup_time = None
+
+    # check if something is serving http on the server's port, any response
+    # (even a 404) means the server is up
+    def is_healthy(self):
+        try:
+            requests.get(f"http://localhost:{self.port}/", timeout=1)
+            return True
+        except requests.RequestException:
+            return False
+
+    # use an already running server, returns false if there isn't one
+    def attach(self):
+        if not self.is_healthy():
+            return False
+
+        self.attached = True
+        self.startup_time = 0.0
+        return True
+
+    # launch the Readablity.js server and wait until it answers requests
+    def launch(self):
+        cmd = ["node", f"{self._readability_dir}/main.js"]
+        cwd = "./"
+        env = os.environ.copy()
+        env["LOGFILE"] = self._log_file
+        env["PORT"] = str(self.port)
+
+        # a server that is kept running outlives our process group
+        start = time.monotonic()
+        self._process = subprocess.Popen(cmd, cwd=cwd, env=env,
+                                         start_new_session=self._keep_running)
+        self._wait_for_launch(start)
+        self.startup_time = time.monotonic() - start
+
+    def stop(self):
+        if self._process is not None and self._process.poll() is None:
+            self._stop_process(signal.SIGINT)
+
+    def restart(self):
+        self.stop()
+        self.launch()
+
+    # poll the server until it answers, fails or the startup timeout expires
+    def _wait_for_launch(self, start):
+        while not self.is_healthy():
+            if self._process.poll() is not None:
+                raise RuntimeError(f"Readability.js server on port "
+                                   f"{self.port} exited with code "
+                                   f"{self._process.returncode}")
+
+            if time.monotonic() - start > self._startup_timeout:
+                self._stop_process(signal.SIGKILL)
+                raise RuntimeError(f"Readability.js server on port "
+                                   f"{self.port} didn't start within "
+                                   f"{self._startup_timeout}s")
+
+            time.sleep(0.05)
+
+    # send a signal to the launched process and wait for it to exit, killing
+    # it if it's still running after the stop timeout
+    def _stop_process(self, sig):
+        self._process.send_signal(sig)
+
+        try:
+            self._process.wait(timeout=self._stop_timeout)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+    # stop the server when the parser is done with it, unless it was attached
+    # to or should be kept running for the next run
+    def close(self):
+        if not self._keep_running:
+            self.stop()
+
+
+# parse HTML pages with a pool of Readability.js servers, each request goes to
+# the server with the fewest requests in flight and servers that crash or hang
+# are restarted. with readability_attach servers that are already running on
+# the pool's ports are reused, and with readability_keep_running the servers
+# are left running for the next run to attach to
 class ArticleParser(object):
     _git_url = "https://github.com/joejacobs/readability.js-server"
     _readability_dir = "./readability.js-server"
 
     def __init__(self, args):
-        self._log_file = args.readability_log_file
-        self._port = args.readability_port
-        self._user_agent = args.user_agent
+        self._http = HTTPRequest(2500, 3, args.user_agent,
+                                 args.connect_timeout, args.read_timeout)
+        self._lock = threading.Lock()
+        self._servers = []
 
         self._install_server()
-        self._launch_server()
+
+        # servers listen on consecutive ports starting at readability_port
+        root, ext = os.path.splitext(args.readability_log_file)
+
+        for i in range(args.readability_workers):
+            log_file = args.readability_log_file
+
+            if args.readability_workers > 1:
+                log_file = f"{root}.{i}{ext}"
+
+            server = _Server(self._readability_dir,
+                             args.readability_port + i, log_file,
+                             args.readability_startup_timeout,
+                             args.readability_keep_running)
+
+            if not (args.readability_attach and server.attach()):
+                server.launch()
+
+            self._servers.append(server)
+
+        self.startup_times = [x.startup_time for x in self._servers]
+        startup = ", ".join(f"{x:.2f}s" for x in self.startup_times)
+        print(f"Readability.js servers ready in {startup}")
 
     def __del__(self):
-        self._process.send_signal(signal.SIGINT)
-        self._process.wait()
+        for server in self._servers:
+            server.close()
 
     # install the Readability.js node.js server
     def _install_server(self):
@@ -38,34 +161,66 @@ class ArticleParser(object):
             subprocess.run(clone_cmd, cwd=clone_cwd, check=True)
             subprocess.run(npm_cmd, cwd=npm_cwd, check=True)
 
-    # launch the Readablity.js server
-    def _launch_server(self):
-        cmd = ["node", f"{self._readability_dir}/main.js"]
-        cwd = "./"
-        env = os.environ.copy()
-        env["LOGFILE"] = self._log_file
-        env["PORT"] = str(self._port)
-        self._process = subprocess.Popen(cmd, cwd=cwd, env=env)
-        self._wait_for_launch()
-
-    # parse a URL
+    # parse a URL, this is safe to call from multiple threads
     def parse(self, url):
         encoded_url = urllib.parse.quote_plus(url)
-        api_url = f"http://localhost:{self._port}/article/{encoded_url}"
-        return HTTPRequest(2500, 3, self._user_agent).get(api_url)
 
-    # keep reading the log file until the server has finished launching
-    def _wait_for_launch(self):
-        keep_reading_log_file = True
-
-        while(keep_reading_log_file):
-            time.sleep(0.2)
+        # retry once on another server if the first one turns out to be down
+        for _ in range(2):
+            server, generation = self._acquire()
+            api_url = f"http://localhost:{server.port}/article/{encoded_url}"
 
             try:
-                with open(self._log_file, "r") as fp:
-                    log = fp.read()
+                res = self._http.get(api_url)
+            finally:
+                self._release(server)
+
+            # a connection failure or timeout on localhost means the server
+            # crashed or hung rather than the article's website failing
+            if res.status_code != 600:
+                return res
+
+            self._restart(server, generation)
+
+        return res
+
+    # pick the server with the fewest outstanding requests, avoiding servers
+    # that are being restarted or failed
+    def _acquire(self):
+        with self._lock:
+            servers = [x for x in self._servers
+                       if not (x.restarting or x.failed)]
+            server = min(servers or self._servers, key=lambda x: x.outstanding)
+            server.outstanding += 1
+            return server, server.generation
+
+    def _release(self, server):
+        with self._lock:
+            server.outstanding -= 1
+
+    # restart a server unless another thread already did so, the restart
+    # itself happens outside the lock so the other servers keep working. a
+    # server we attached to isn't ours to restart and one that fails to
+    # restart is marked failed, requests go to the other servers
+    def _restart(self, server, generation):
+        with self._lock:
+            if server.generation != generation or server.failed:
+                return
+
+            server.generation += 1
+
+            if server.attached:
+                server.failed = True
+                print(f"Readability.js server on port {server.port} "
+                      "stopped answering")
+                return
+
+            server.restarting = True
 
-                if f"Server launched on port {self._port}" in log:
-                    keep_reading_log_file = False
-            except FileNotFoundError:
-                continue
+        try:
+            server.restart()
+        except (OSError, RuntimeError) as e:
+            server.failed = True
+            print(e)
+        finally:
+            server.restarting = False
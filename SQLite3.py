@@ -1,26 +1,190 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+from Compression import Codec, train_dictionary
+from EntrySchema import compact_entry, dumps, entry_columns
+from FullText import entry_text, parsed_text
+from Metrics import Metrics
+from NearDuplicate import (THRESHOLD, band_keys, pack, signature,
+                           similarity, unpack)
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from urllib.request import pathname2url
+
 import datetime
+import heapq
+import itertools
+import json
+import os
+import random
 import sqlite3
+import time
+
+# query parameters that only track where a visitor came from
+_tracking_params = {"fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid",
+                    "mc_cid", "mc_eid", "_ga"}
+
+# ports left out of the url keys, either is the default of one of the
+# protocols the keys ignore
+_default_ports = (":80", ":443")
+
+
+# get the protocol insensitive key used to look up a url, i.e. the url without
+# its scheme, default port, trailing slashes or tracking parameters and with a
+# lowercase host
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    netloc = parts.netloc.lower()
+
+    for port in _default_ports:
+        if netloc.endswith(port):
+            netloc = netloc[:-len(port)]
+
+    key = netloc + parts.path.rstrip("/")
+
+    if parts.query:
+        query = [(k, v) for k, v in parse_qsl(parts.query, True)
+                 if not k.lower().startswith("utm_") and
+                 k.lower() not in _tracking_params]
+
+        if query:
+            key += "?" + urlencode(query)
+
+    if parts.fragment:
+        key += "#" + parts.fragment
+
+    return key
+
+
+# columns of the articles table that hold fields of the feed entry
+_entry_columns = ("title", "published", "author", "guid")
+
+# the columns that hold the url of a website or feed in other tables
+_url_references = {"websites": (("feeds", "website"),
+                                ("articles", "website")),
+                   "feeds": (("articles", "feed"), ("feed_cache", "feed"),
+                             ("feed_schedule", "feed"),
+                             ("feed_health", "feed"))}
+
+
+# get the sql expression of the url stored in a table of the main db for the
+# url in column, the url itself if it's stored or else the first stored url
+# with its url key. url keys aren't unique, a key may be stored under more
+# than one protocol
+def _stored_url(table, column):
+    return (f"COALESCE((SELECT url FROM main.{table} WHERE url = {column}), "
+            f"(SELECT MIN(url) FROM main.{table} "
+            f"WHERE url_key = normalize_url({column})))")
+
+
+# columns of the articles table, the rowid is an autoincrementing id so that
+# the rowids of archived articles are never given to new ones
+_articles_schema = (
+    "id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT UNIQUE NOT NULL, "
+    "time TIMESTAMP DEFAULT CURRENT_TIMESTAMP, content TEXT NOT NULL, "
+    "feed TEXT, website TEXT NOT NULL, url_key TEXT, title TEXT, "
+    "published TIMESTAMP, author TEXT, guid TEXT, "
+    "FOREIGN KEY(feed) REFERENCES feeds(url), "
+    "FOREIGN KEY(website) REFERENCES websites(url)")
+
+# tables of an attached archive partition
+_partition_tables = (
+    "CREATE TABLE IF NOT EXISTS archive.articles ("
+    "url TEXT PRIMARY KEY NOT NULL, time TIMESTAMP, content BLOB NOT NULL, "
+    "feed TEXT, website TEXT NOT NULL, url_key TEXT, title TEXT, "
+    "published TIMESTAMP, author TEXT, guid TEXT);",
+    "CREATE TABLE IF NOT EXISTS archive.parsed_articles ("
+    "article TEXT NOT NULL, parser TEXT NOT NULL, content BLOB NOT NULL, "
+    "PRIMARY KEY(article, parser));",
+    "CREATE TABLE IF NOT EXISTS archive.compression_dicts ("
+    "id INTEGER PRIMARY KEY NOT NULL, data BLOB NOT NULL, time TIMESTAMP);",
+    "CREATE INDEX IF NOT EXISTS archive.articles_time ON articles(time);",
+    "CREATE INDEX IF NOT EXISTS archive.articles_published "
+    "ON articles(published);")
+
+
+# get the first day of the month after a "YYYY-MM" month
+def _next_month(month):
+    year, month = map(int, month.split("-"))
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+
+
+# number of consecutive rows read from each random rowid when sampling
+_sample_run = 100
+
+
+# split an iterable into lists of at most size items
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+
+        if not chunk:
+            return
+
+        yield chunk
 
 
 class Database(object):
-    # init the db connection
-    def __init__(self, db_filename):
+    # init the db connection, wal trades durability of the last few commits
+    # after a power loss for much cheaper commits. compression is the method
+    # used to store new content ("none", "zlib" or "zstd"), stored content is
+    # always readable whatever method it was written with. with
+    # near_duplicates new articles are fingerprinted and clustered with the
+    # stored articles they are near duplicates of
+    def __init__(self, db_filename, wal=False, compression="none",
+                 metrics=None, near_duplicates=False):
         self._conn = sqlite3.connect(db_filename)
+        self._db_dir = os.path.dirname(os.path.abspath(db_filename))
+        self._codec = Codec(compression)
+        self._near_duplicates = near_duplicates
+        self._metrics = metrics if metrics is not None else Metrics(False)
+        self._conn.create_function("normalize_url", 1, normalize_url)
+
+        # only takes effect for a new db, older ones are converted the first
+        # time they are vacuumed
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
+        if wal:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
 
         if not self._check_if_tables_exist():
             self._create_tables()
 
+        self._migrate_tables()
+        self._load_compression_dicts()
+
     # close the db
     def __del__(self):
         self._conn.commit()
         self._conn.close()
 
-    # check if an article is already in the database
+    # check if an article is already in the database, archived articles are
+    # only found when ignoring the protocol as they are looked up by url key
     def check_if_article_exists(self, article_url, ignore_protocol=False):
-        return self._check_if_item_exists("articles", article_url,
-                                          ignore_protocol)
+        if self._check_if_item_exists("articles", article_url,
+                                      ignore_protocol):
+            return True
+
+        if not ignore_protocol:
+            return False
+
+        c = self._conn.cursor()
+        c.execute("SELECT 1 FROM archived_urls WHERE url_key=?",
+                  (normalize_url(article_url),))
+        return c.fetchone() is not None
+
+    # get the number of stored articles, optionally including archived ones
+    def count_articles(self, include_archived=False):
+        c = self._conn.cursor()
+        c.execute("SELECT COUNT(*) FROM articles")
+        count = c.fetchone()[0]
+
+        if include_archived:
+            c.execute("SELECT COUNT(*) FROM archived_urls")
+            count += c.fetchone()[0]
+
+        return count
 
     # check if a feed is already in the database
     def check_if_feed_exists(self, feed_url, ignore_protocol=False):
@@ -31,9 +195,11 @@ class Database(object):
         c = self._conn.cursor()
 
         if ignore_protocol:
-            url = "%{}".format(url[url.find("://"):])
+            c.execute(f"SELECT 1 FROM {table} WHERE url_key=?",
+                      (normalize_url(url),))
+        else:
+            c.execute(f"SELECT 1 FROM {table} WHERE url=?", (url,))
 
-        c.execute(f"SELECT * FROM {table} WHERE url LIKE ?", (url,))
         return c.fetchone() is not None
 
     # check if parsed article is already in the database
@@ -50,57 +216,904 @@ class Database(object):
 
     # check if tables exist
     def _check_if_tables_exist(self):
-        query0 = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
-        query1 = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
-        query2 = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
-        query3 = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
-
+        query = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
         c = self._conn.cursor()
-        c.execute(query0, ("websites",))
-
-        if c.fetchone() is None:
-            return False
-
-        c.execute(query1, ("feeds",))
-
-        if c.fetchone() is None:
-            return False
 
-        c.execute(query2, ("articles",))
+        for table in ("websites", "feeds", "articles", "parsed_articles",
+                      "feed_cache", "feed_schedule", "compression_dicts",
+                      "checkpoints", "article_fingerprints",
+                      "fingerprint_bands", "feed_health", "host_health",
+                      "archived_urls", "archive_partitions"):
+            c.execute(query, (table,))
 
-        if c.fetchone() is None:
-            return False
+            if c.fetchone() is None:
+                return False
 
-        c.execute(query3, ("parsed_articles",))
-        return c.fetchone() is not None
+        return True
 
     # create tables if they don't exist
     def _create_tables(self):
         query0 = ("CREATE TABLE IF NOT EXISTS websites ("
                   "url TEXT PRIMARY KEY NOT NULL, name TEXT NOT NULL, "
-                  "language CHAR(2) NOT NULL, country CHAR(2) NOT NULL);")
+                  "language CHAR(2) NOT NULL, country CHAR(2) NOT NULL, "
+                  "url_key TEXT);")
         query1 = ("CREATE TABLE IF NOT EXISTS feeds ("
                   "url TEXT PRIMARY KEY NOT NULL, name TEXT NOT NULL, "
-                  "website TEXT NOT NULL, "
-                  "FOREIGN KEY(website) REFERENCES websites(url));")
-        query2 = ("CREATE TABLE IF NOT EXISTS articles ("
-                  "url TEXT PRIMARY KEY NOT NULL, "
-                  "time TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
-                  "content TEXT NOT NULL, feed TEXT, website TEXT NOT NULL, "
-                  "FOREIGN KEY(feed) REFERENCES feeds(url), "
+                  "website TEXT NOT NULL, url_key TEXT, "
                   "FOREIGN KEY(website) REFERENCES websites(url));")
+        query2 = f"CREATE TABLE IF NOT EXISTS articles ({_articles_schema});"
         query3 = ("CREATE TABLE IF NOT EXISTS parsed_articles ("
                   "article TEXT NOT NULL, parser TEXT NOT NULL, "
                   "content TEXT NOT NULL, PRIMARY KEY(article, parser), "
                   "FOREIGN KEY(article) REFERENCES articles(url));")
+        query4 = ("CREATE TABLE IF NOT EXISTS feed_cache ("
+                  "feed TEXT PRIMARY KEY NOT NULL, etag TEXT, "
+                  "last_modified TEXT, hash TEXT, "
+                  "FOREIGN KEY(feed) REFERENCES feeds(url));")
+        query5 = ("CREATE TABLE IF NOT EXISTS feed_schedule ("
+                  "feed TEXT PRIMARY KEY NOT NULL, next_poll TIMESTAMP, "
+                  "interval REAL, "
+                  "FOREIGN KEY(feed) REFERENCES feeds(url));")
+
+        query6 = ("CREATE TABLE IF NOT EXISTS compression_dicts ("
+                  "id INTEGER PRIMARY KEY NOT NULL, data BLOB NOT NULL, "
+                  "time TIMESTAMP DEFAULT CURRENT_TIMESTAMP);")
+        query7 = ("CREATE TABLE IF NOT EXISTS checkpoints ("
+                  "name TEXT PRIMARY KEY NOT NULL, value TEXT NOT NULL);")
+        query8 = ("CREATE TABLE IF NOT EXISTS article_fingerprints ("
+                  "article INTEGER PRIMARY KEY NOT NULL, "
+                  "signature BLOB NOT NULL, cluster INTEGER NOT NULL);")
+        query9 = ("CREATE TABLE IF NOT EXISTS fingerprint_bands ("
+                  "key INTEGER NOT NULL, article INTEGER NOT NULL, "
+                  "PRIMARY KEY(key, article)) WITHOUT ROWID;")
+        query10 = ("CREATE TABLE IF NOT EXISTS feed_health ("
+                   "feed TEXT PRIMARY KEY NOT NULL, "
+                   "failures INTEGER NOT NULL DEFAULT 0, "
+                   "gone INTEGER NOT NULL DEFAULT 0, "
+                   "inactive INTEGER NOT NULL DEFAULT 0, "
+                   "last_status INTEGER, last_error TEXT, "
+                   "last_success TIMESTAMP, last_failure TIMESTAMP, "
+                   "FOREIGN KEY(feed) REFERENCES feeds(url));")
+        query11 = ("CREATE TABLE IF NOT EXISTS host_health ("
+                   "host TEXT PRIMARY KEY NOT NULL, "
+                   "failures INTEGER NOT NULL, open_until TIMESTAMP, "
+                   "last_error TEXT, updated TIMESTAMP);")
+        query12 = ("CREATE TABLE IF NOT EXISTS archived_urls ("
+                   "url_key TEXT PRIMARY KEY NOT NULL, "
+                   "month TEXT NOT NULL) WITHOUT ROWID;")
+        query13 = ("CREATE TABLE IF NOT EXISTS archive_partitions ("
+                   "month TEXT PRIMARY KEY NOT NULL, "
+                   "filename TEXT NOT NULL, articles INTEGER NOT NULL);")
 
         c = self._conn.cursor()
         c.execute(query0)
         c.execute(query1)
         c.execute(query2)
         c.execute(query3)
+        c.execute(query4)
+        c.execute(query5)
+        c.execute(query6)
+        c.execute(query7)
+        c.execute(query8)
+        c.execute(query9)
+        c.execute(query10)
+        c.execute(query11)
+        c.execute(query12)
+        c.execute(query13)
         self._conn.commit()
 
+    # bring tables created by older versions up to date
+    def _migrate_tables(self):
+        self._autoincrement_articles()
+        c = self._conn.cursor()
+
+        for table in ("websites", "feeds", "articles"):
+            c.execute(f"PRAGMA table_info({table})")
+
+            if "url_key" not in [x[1] for x in c.fetchall()]:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN url_key TEXT")
+
+            # backfill the url keys in batches to keep memory use bounded
+            while True:
+                c.execute(f"SELECT rowid, url FROM {table} "
+                          "WHERE url_key IS NULL LIMIT 10000")
+                rows = c.fetchall()
+
+                if not rows:
+                    break
+
+                c.executemany(f"UPDATE {table} SET url_key=? WHERE rowid=?",
+                              [(normalize_url(x[1]), x[0]) for x in rows])
+
+            c.execute(f"CREATE INDEX IF NOT EXISTS {table}_url_key "
+                      f"ON {table}(url_key)")
+
+        c.execute("PRAGMA table_info(host_health)")
+
+        if "updated" not in [x[1] for x in c.fetchall()]:
+            c.execute("ALTER TABLE host_health ADD COLUMN updated TIMESTAMP")
+
+        c.execute("PRAGMA table_info(articles)")
+        columns = [x[1] for x in c.fetchall()]
+
+        for column, column_type in zip(_entry_columns,
+                                       ("TEXT", "TIMESTAMP", "TEXT", "TEXT")):
+            if column not in columns:
+                c.execute(f"ALTER TABLE articles ADD COLUMN {column} "
+                          f"{column_type}")
+
+        c.execute("CREATE INDEX IF NOT EXISTS articles_time "
+                  "ON articles(time)")
+        c.execute("CREATE INDEX IF NOT EXISTS articles_published "
+                  "ON articles(published)")
+        c.execute("CREATE INDEX IF NOT EXISTS articles_feed_time "
+                  "ON articles(feed, time)")
+        c.execute("CREATE INDEX IF NOT EXISTS feed_schedule_next_poll "
+                  "ON feed_schedule(next_poll)")
+        c.execute("CREATE INDEX IF NOT EXISTS article_fingerprints_cluster "
+                  "ON article_fingerprints(cluster)")
+
+        # the full text index of the articles has the rowids of the articles,
+        # it is left out if sqlite was built without fts5
+        try:
+            c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts "
+                      "USING fts5(title, summary, body)")
+            self._full_text = True
+        except sqlite3.OperationalError:
+            self._full_text = False
+
+        self._conn.commit()
+
+    # rebuild an articles table created by an older version, which reuses the
+    # rowids of deleted articles, with rowids that are never reused. archived
+    # articles keep their rowids so the new rowids start after the largest
+    # one stored in the db or in any of its archive partitions
+    def _autoincrement_articles(self):
+        c = self._conn.cursor()
+        c.execute("SELECT sql FROM sqlite_master "
+                  "WHERE type='table' AND name='articles'")
+
+        if "AUTOINCREMENT" in c.fetchone()[0]:
+            return
+
+        last_rowids = [0]
+        c.execute("SELECT filename FROM archive_partitions")
+
+        for x in c.fetchall():
+            filename = os.path.join(self._db_dir, x[0])
+
+            if os.path.exists(filename):
+                conn = sqlite3.connect(
+                    f"file:{pathname2url(filename)}?mode=ro", uri=True)
+                last_rowids.append(conn.execute(
+                    "SELECT MAX(rowid) FROM articles").fetchone()[0] or 0)
+                conn.close()
+
+        c.execute("PRAGMA table_info(articles)")
+        columns = ", ".join(x[1] for x in c.fetchall())
+
+        try:
+            c.execute("DROP TABLE IF EXISTS articles_autoincrement")
+            c.execute("CREATE TABLE articles_autoincrement ("
+                      f"{_articles_schema})")
+            c.execute(f"INSERT INTO articles_autoincrement (id, {columns}) "
+                      f"SELECT rowid, {columns} FROM articles")
+            c.execute("DROP TABLE articles")
+            c.execute("ALTER TABLE articles_autoincrement RENAME TO articles")
+            c.execute("DELETE FROM sqlite_sequence WHERE name='articles'")
+            c.execute("INSERT INTO sqlite_sequence (name, seq) SELECT "
+                      "'articles', MAX(?, COALESCE(MAX(rowid), 0)) "
+                      "FROM articles", (max(last_rowids),))
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+
+    # register the stored zstd dictionaries with the codec
+    def _load_compression_dicts(self):
+        c = self._conn.cursor()
+        c.execute("SELECT id, data FROM compression_dicts "
+                  "ORDER BY time, rowid")
+
+        for x in c.fetchall():
+            self._codec.add_dictionary(x[0], x[1])
+
+    # train a zstd dictionary on a sample of the stored article content and
+    # use it to compress new content, returns the dictionary id or None if
+    # zstandard isn't installed
+    def train_compression_dictionary(self, sample_size=10000,
+                                     dict_size=112640):
+        c = self._conn.cursor()
+        c.execute("SELECT MIN(rowid), MAX(rowid) FROM articles")
+        first, last = c.fetchone()
+        samples = {}
+
+        # read runs of consecutive rows from random rowids rather than
+        # sorting the whole table randomly
+        if first is not None:
+            if last - first < sample_size:
+                runs, run_size = [first], sample_size
+            else:
+                runs = [random.randint(first, last)
+                        for _ in range(-(-sample_size // _sample_run))]
+                run_size = _sample_run
+
+            for rowid in runs:
+                c.execute("SELECT rowid, content FROM articles "
+                          "WHERE rowid >= ? ORDER BY rowid LIMIT ?",
+                          (rowid, run_size))
+                samples.update(c.fetchall())
+
+        samples = [self._codec.decompress(x) for x in samples.values()]
+
+        if not samples:
+            return None
+
+        trained = train_dictionary(samples, dict_size)
+
+        if trained is None:
+            return None
+
+        c.execute("INSERT OR REPLACE INTO compression_dicts (id, data) "
+                  "VALUES (?, ?)", trained)
+        self._conn.commit()
+        self._codec.add_dictionary(*trained)
+        return trained[0]
+
+    # compress content that was stored uncompressed, committing every batch so
+    # it can run alongside a crawl and be interrupted at any point. returns
+    # the number of rows compressed, raises ValueError if the database has no
+    # compression method
+    def compress_existing_content(self, batch_size=1000, pause=0):
+        if self._codec.method == "none":
+            raise ValueError("No compression method to compress content with")
+
+        c = self._conn.cursor()
+        compressed = 0
+
+        for table in ("articles", "parsed_articles"):
+            last_rowid = 0
+
+            while True:
+                c.execute(f"SELECT rowid, content FROM {table} "
+                          "WHERE rowid > ? AND typeof(content) = 'text' "
+                          "ORDER BY rowid LIMIT ?", (last_rowid, batch_size))
+                rows = c.fetchall()
+
+                if not rows:
+                    break
+
+                c.executemany(f"UPDATE {table} SET content=? WHERE rowid=?",
+                              [(self._codec.compress(x[1]), x[0])
+                               for x in rows])
+                self._conn.commit()
+                compressed += len(rows)
+                last_rowid = rows[-1][0]
+
+                if pause > 0:
+                    time.sleep(pause)
+
+        return compressed
+
+    # move the fields of entries stored with the full schema into the article
+    # columns and drop the redundant keys from their content, committing every
+    # batch. progress is checkpointed so an interrupted run carries on where
+    # it stopped and a later run only looks at newer articles. rewritten
+    # content is compressed with the database's compression method, or the
+    # one it was stored with when the database has none. returns the number
+    # of rows rewritten
+    def compact_existing_articles(self, batch_size=1000, pause=0):
+        checkpoint = "compact-entries"
+        last_rowid = int(self.get_checkpoint(checkpoint) or 0)
+        c = self._conn.cursor()
+        compacted = 0
+
+        while True:
+            c.execute("SELECT rowid, content FROM articles WHERE rowid > ? "
+                      "ORDER BY rowid LIMIT ?", (last_rowid, batch_size))
+            rows = c.fetchall()
+
+            if not rows:
+                break
+
+            updates = []
+
+            for rowid, content in rows:
+                try:
+                    entry = json.loads(self._codec.decompress(content))
+                except ValueError:
+                    continue
+
+                if not isinstance(entry, dict):
+                    continue
+
+                compact = compact_entry(entry)
+
+                if compact == entry:
+                    continue
+
+                columns = entry_columns(entry)
+                updates.append(tuple(columns[x] for x in _entry_columns) +
+                               (self._compress_like(content, dumps(compact)),
+                                rowid))
+
+            # keep values already in the columns if the content lacks them
+            c.executemany("UPDATE articles SET title=COALESCE(?, title), "
+                          "published=COALESCE(?, published), "
+                          "author=COALESCE(?, author), "
+                          "guid=COALESCE(?, guid), content=? WHERE rowid=?",
+                          updates)
+            last_rowid = rows[-1][0]
+            c.execute("INSERT OR REPLACE INTO checkpoints (name, value) "
+                      "VALUES (?, ?)", (checkpoint, str(last_rowid)))
+            self._conn.commit()
+            compacted += len(updates)
+
+            if pause > 0:
+                time.sleep(pause)
+
+        return compacted
+
+    # compress content that replaces a stored value, with the database's
+    # compression method or without one in the format of the stored value
+    def _compress_like(self, value, text):
+        if self._codec.method == "none":
+            return self._codec.compress_like(value, text)
+
+        return self._codec.compress(text)
+
+    # make this database a shard that crawls the given feeds of the source
+    # database, copying the feeds with their websites, cache validators,
+    # schedules and health as well as the host health and compression
+    # dictionaries. feeds that moved to another shard are removed
+    def seed_shard(self, source_filename, feed_urls):
+        c = self._conn.cursor()
+        c.execute("ATTACH DATABASE ? AS source", (source_filename,))
+
+        try:
+            c.execute("CREATE TEMP TABLE IF NOT EXISTS shard_feeds ("
+                      "url TEXT PRIMARY KEY NOT NULL)")
+            c.execute("DELETE FROM shard_feeds")
+            c.executemany("INSERT OR IGNORE INTO shard_feeds (url) "
+                          "VALUES (?)", ((x,) for x in feed_urls))
+            c.execute("DELETE FROM main.feeds "
+                      "WHERE url NOT IN (SELECT url FROM shard_feeds)")
+            c.execute("INSERT OR REPLACE INTO main.websites (url, name, "
+                      "language, country, url_key) SELECT url, name, "
+                      "language, country, url_key FROM source.websites "
+                      "WHERE url IN (SELECT website FROM source.feeds "
+                      "WHERE url IN (SELECT url FROM shard_feeds))")
+            c.execute("INSERT OR REPLACE INTO main.feeds (url, name, website, "
+                      "url_key) SELECT url, name, website, url_key "
+                      "FROM source.feeds "
+                      "WHERE url IN (SELECT url FROM shard_feeds)")
+
+            # the shard's own validators, schedules and health are newer until
+            # merged
+            c.execute("INSERT OR IGNORE INTO main.feed_cache (feed, etag, "
+                      "last_modified, hash) SELECT feed, etag, "
+                      "last_modified, hash FROM source.feed_cache "
+                      "WHERE feed IN (SELECT url FROM shard_feeds)")
+            c.execute("INSERT OR IGNORE INTO main.feed_schedule (feed, "
+                      "next_poll, interval) SELECT feed, next_poll, interval "
+                      "FROM source.feed_schedule "
+                      "WHERE feed IN (SELECT url FROM shard_feeds)")
+            c.execute("INSERT OR IGNORE INTO main.feed_health (feed, "
+                      "failures, gone, inactive, last_status, last_error, "
+                      "last_success, last_failure) SELECT feed, failures, "
+                      "gone, inactive, last_status, last_error, "
+                      "last_success, last_failure FROM source.feed_health "
+                      "WHERE feed IN (SELECT url FROM shard_feeds)")
+
+            # hosts are shared by all shards, the newest state of each wins
+            self._copy_host_health(c, "source", "main")
+            c.execute("INSERT OR IGNORE INTO main.compression_dicts (id, "
+                      "data, time) SELECT id, data, time "
+                      "FROM source.compression_dicts")
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            c.execute("DETACH DATABASE source")
+
+        self._load_compression_dicts()
+
+    # merge the articles and parsed articles of a shard into this database in
+    # one transaction. articles are matched on their url keys so ones already
+    # stored or archived, possibly under another protocol, are skipped, and
+    # the feed, website and article urls the shard refers to are mapped to
+    # this database's urls in case their protocol changed since the shard was
+    # seeded or while it was crawling. the merged articles are deleted from
+    # the shard in the same transaction so merging a shard again only merges
+    # what it stored since, their url keys stay behind like archived ones so
+    # the shard doesn't store them again. returns a tuple with the number of
+    # merged and skipped articles
+    def merge_shard(self, shard_filename):
+        c = self._conn.cursor()
+        c.execute("ATTACH DATABASE ? AS shard", (shard_filename,))
+
+        try:
+            # articles the shard stores while it's merged wait for the next
+            # merge
+            c.execute("SELECT COUNT(*), MAX(rowid) FROM shard.articles")
+            total, shard_rowid = c.fetchone()
+            shard_rowid = shard_rowid or 0
+            c.execute("SELECT MAX(rowid) FROM main.articles")
+            last_rowid = c.fetchone()[0] or 0
+
+            # stored content may have been compressed with these
+            c.execute("INSERT OR IGNORE INTO main.compression_dicts (id, "
+                      "data, time) SELECT id, data, time "
+                      "FROM shard.compression_dicts")
+            c.execute("INSERT INTO main.articles (url, time, content, feed, "
+                      "website, url_key, title, published, author, guid) "
+                      "SELECT a.url, a.time, a.content, "
+                      f"COALESCE({_stored_url('feeds', 'a.feed')}, a.feed), "
+                      f"COALESCE({_stored_url('websites', 'a.website')}, "
+                      "a.website), a.url_key, a.title, a.published, "
+                      "a.author, a.guid FROM shard.articles a "
+                      "WHERE a.rowid <= ? AND NOT EXISTS (SELECT 1 "
+                      "FROM main.articles m WHERE m.url_key = a.url_key) "
+                      "AND NOT EXISTS (SELECT 1 FROM main.archived_urls r "
+                      "WHERE r.url_key = a.url_key) ORDER BY a.rowid",
+                      (shard_rowid,))
+            merged = c.rowcount
+            c.execute("INSERT OR IGNORE INTO main.parsed_articles (article, "
+                      "parser, content) SELECT * FROM (SELECT "
+                      f"{_stored_url('articles', 'a.url')} AS article, "
+                      "p.parser, p.content FROM shard.parsed_articles p "
+                      "JOIN shard.articles a ON a.url = p.article "
+                      "WHERE a.rowid <= ?) WHERE article IS NOT NULL",
+                      (shard_rowid,))
+            self._index_article_range(c, last_rowid)
+
+            # the shard's validators, schedules and health are the most recent
+            # ones
+            for table, columns in (
+                    ("feed_cache", "etag, last_modified, hash"),
+                    ("feed_schedule", "next_poll, interval"),
+                    ("feed_health", "failures, gone, inactive, "
+                                    "last_status, last_error, last_success, "
+                                    "last_failure")):
+                c.execute(f"INSERT OR REPLACE INTO main.{table} (feed, "
+                          f"{columns}) SELECT * FROM (SELECT "
+                          f"{_stored_url('feeds', 'x.feed')} AS feed, "
+                          f"{columns} FROM shard.{table} x ORDER BY x.rowid) "
+                          "WHERE feed IS NOT NULL")
+            self._copy_host_health(c, "shard", "main")
+            self._empty_shard(c, shard_rowid)
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            c.execute("DETACH DATABASE shard")
+
+        self._load_compression_dicts()
+        return merged, total - merged
+
+    # copy the host health rows of one attached database to another that are
+    # newer than the other's rows for the same hosts. rows without an update
+    # time were written before they had one and never replace a row
+    @staticmethod
+    def _copy_host_health(c, source, target):
+        c.execute(f"INSERT OR REPLACE INTO {target}.host_health (host, "
+                  "failures, open_until, last_error, updated) SELECT host, "
+                  "failures, open_until, last_error, updated "
+                  f"FROM {source}.host_health x WHERE NOT EXISTS ("
+                  f"SELECT 1 FROM {target}.host_health y WHERE y.host = "
+                  "x.host AND (x.updated IS NULL OR y.updated >= x.updated))")
+
+    # delete the articles of the attached shard up to a rowid, with their
+    # parsed articles and index entries
+    def _empty_shard(self, c, last_rowid):
+        c.execute("INSERT OR IGNORE INTO shard.archived_urls (url_key, "
+                  "month) SELECT url_key, substr(time, 1, 7) "
+                  "FROM shard.articles WHERE rowid <= ?", (last_rowid,))
+        c.execute("DELETE FROM shard.parsed_articles WHERE article IN ("
+                  "SELECT url FROM shard.articles WHERE rowid <= ?)",
+                  (last_rowid,))
+        c.execute("SELECT 1 FROM shard.sqlite_master "
+                  "WHERE type='table' AND name='articles_fts'")
+
+        if c.fetchone() is not None:
+            c.execute("DELETE FROM shard.articles_fts WHERE rowid <= ?",
+                      (last_rowid,))
+
+        c.execute("DELETE FROM shard.article_fingerprints WHERE article <= ?",
+                  (last_rowid,))
+        c.execute("DELETE FROM shard.fingerprint_bands WHERE article <= ?",
+                  (last_rowid,))
+        c.execute("DELETE FROM shard.articles WHERE rowid <= ?",
+                  (last_rowid,))
+
+    # move the articles stored more than older_than days ago, with their
+    # parsed articles, to a partition db per month in archive_dir. partition
+    # content is compressed with the given method ("zlib" or "zstd") unless
+    # it already is. the url keys of the archived articles stay behind so
+    # they aren't stored again. a month is copied and deleted in one
+    # transaction and copying skips rows that are already in the partition,
+    # so an interrupted run can simply be repeated. returns the number of
+    # archived articles of each month
+    def archive_articles(self, archive_dir, older_than=90,
+                         compression="zstd"):
+        assert compression in ("zlib", "zstd")
+
+        codec = Codec(compression)
+        self._conn.create_function("archive_compress", 1, lambda x: (
+            x if isinstance(x, bytes) else codec.compress(x)))
+        os.makedirs(archive_dir, exist_ok=True)
+
+        # databases can only be attached outside of a transaction
+        self._conn.commit()
+        c = self._conn.cursor()
+        c.execute("SELECT datetime('now', ?)", (f"-{int(older_than)} days",))
+        cutoff = c.fetchone()[0]
+        c.execute("SELECT DISTINCT substr(time, 1, 7) FROM articles "
+                  "WHERE time < ?", (cutoff,))
+        archived = {}
+
+        for month in sorted(x[0] for x in c.fetchall()):
+            filename = os.path.join(archive_dir, f"articles-{month}.db")
+            archived[month] = self._archive_month(c, month, filename, cutoff)
+
+        return archived
+
+    def _archive_month(self, c, month, filename, cutoff):
+        c.execute("ATTACH DATABASE ? AS archive", (filename,))
+
+        try:
+            for query in _partition_tables:
+                c.execute(query)
+
+            c.execute("CREATE TEMP TABLE IF NOT EXISTS archive_rows ("
+                      "rowid INTEGER PRIMARY KEY NOT NULL)")
+            c.execute("DELETE FROM archive_rows")
+            c.execute("INSERT INTO archive_rows SELECT rowid FROM articles "
+                      "WHERE time >= ? AND time < ? AND time < ?",
+                      (f"{month}-01", _next_month(month), cutoff))
+            count = c.rowcount
+
+            # content may have been compressed with these
+            c.execute("INSERT OR IGNORE INTO archive.compression_dicts (id, "
+                      "data, time) SELECT id, data, time "
+                      "FROM main.compression_dicts")
+            c.execute("INSERT INTO archive.articles (rowid, url, "
+                      "time, content, feed, website, url_key, title, "
+                      "published, author, guid) SELECT rowid, url, time, "
+                      "archive_compress(content), feed, website, url_key, "
+                      "title, published, author, guid FROM main.articles "
+                      "WHERE rowid IN (SELECT rowid FROM archive_rows)")
+            assert c.rowcount == count
+            c.execute("INSERT OR IGNORE INTO archive.parsed_articles ("
+                      "article, parser, content) SELECT p.article, p.parser, "
+                      "archive_compress(p.content) FROM archive_rows r "
+                      "JOIN main.articles a ON a.rowid = r.rowid "
+                      "JOIN main.parsed_articles p ON p.article = a.url")
+            c.execute("INSERT OR IGNORE INTO archived_urls (url_key, month) "
+                      "SELECT url_key, ? FROM main.articles "
+                      "WHERE rowid IN (SELECT rowid FROM archive_rows)",
+                      (month,))
+            self._unindex_archived_articles(c)
+            c.execute("DELETE FROM main.parsed_articles WHERE article IN ("
+                      "SELECT a.url FROM archive_rows r "
+                      "JOIN main.articles a ON a.rowid = r.rowid)")
+            c.execute("DELETE FROM main.articles "
+                      "WHERE rowid IN (SELECT rowid FROM archive_rows)")
+            c.execute("SELECT COUNT(*) FROM archive.articles")
+            total = c.fetchone()[0]
+
+            # partitions are found relative to the db, which may be moved
+            filename = os.path.relpath(os.path.abspath(filename),
+                                       self._db_dir)
+            c.execute("INSERT OR REPLACE INTO archive_partitions (month, "
+                      "filename, articles) VALUES (?, ?, ?)",
+                      (month, filename, total))
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            c.execute("DETACH DATABASE archive")
+
+        return count
+
+    # remove the articles in temp.archive_rows from the full text index and
+    # the near duplicate fingerprints. bands are deleted by their keys, which
+    # are computed from the signatures, as they aren't indexed by article
+    def _unindex_archived_articles(self, c):
+        if self._full_text:
+            c.execute("DELETE FROM articles_fts "
+                      "WHERE rowid IN (SELECT rowid FROM archive_rows)")
+
+        c.execute("SELECT article, signature FROM article_fingerprints "
+                  "WHERE article IN (SELECT rowid FROM archive_rows)")
+        c.executemany("DELETE FROM fingerprint_bands "
+                      "WHERE key=? AND article=?",
+                      [(key, x[0]) for x in c.fetchall()
+                       for key in band_keys(unpack(x[1]))])
+        c.execute("DELETE FROM article_fingerprints "
+                  "WHERE article IN (SELECT rowid FROM archive_rows)")
+
+    # give free pages of the db file back to the file system, at most pages
+    # of them or all by default. a db created before incremental vacuuming
+    # was turned on is vacuumed in full once to turn it on. returns the
+    # number of freed pages
+    def incremental_vacuum(self, pages=0):
+        self._conn.commit()
+        c = self._conn.cursor()
+        c.execute("PRAGMA freelist_count")
+        free_pages = c.fetchone()[0]
+        c.execute("PRAGMA auto_vacuum")
+
+        if c.fetchone()[0] == 2:
+            # execute only takes the first step of the vacuum, which frees a
+            # single page, a script is run to completion
+            self._conn.executescript(
+                f"PRAGMA incremental_vacuum({int(pages)})")
+        else:
+            c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            c.execute("VACUUM")
+
+        c.execute("PRAGMA freelist_count")
+        return free_pages - c.fetchone()[0]
+
+    # add articles to the full text index, or update the title and summary of
+    # indexed ones, from (rowid, title, content) rows with uncompressed
+    # content. new articles are fingerprinted as well
+    def _index_articles(self, c, rows, new=True):
+        if not (self._full_text or new and self._near_duplicates):
+            return
+
+        for rowid, title, content in rows:
+            title, summary = entry_text(content, title)
+
+            if new and self._near_duplicates:
+                self._fingerprint_article(c, rowid, f"{title} {summary}")
+
+            if not self._full_text:
+                continue
+
+            if not new:
+                c.execute("UPDATE articles_fts SET title=?, summary=? "
+                          "WHERE rowid=?", (title, summary, rowid))
+
+                if c.rowcount == 1:
+                    continue
+
+            c.execute("INSERT OR REPLACE INTO articles_fts (rowid, title, "
+                      "summary) VALUES (?, ?, ?)", (rowid, title, summary))
+
+    # set the body of indexed articles to the text of their parsed content,
+    # from (article url, uncompressed content) rows
+    def _index_parsed_articles(self, c, rows):
+        if not self._full_text:
+            return
+
+        c.executemany("UPDATE articles_fts SET body=? WHERE rowid=("
+                      "SELECT rowid FROM articles WHERE url=?)",
+                      ((parsed_text(x[1]), x[0]) for x in rows))
+
+    # index the articles with rowids in (after_rowid, last_rowid] together with
+    # their parsed content
+    def _index_article_range(self, c, after_rowid, last_rowid=None):
+        if not (self._full_text or self._near_duplicates):
+            return
+
+        if last_rowid is None:
+            c.execute("SELECT MAX(rowid) FROM articles")
+            last_rowid = c.fetchone()[0] or 0
+
+        c.execute("SELECT rowid, title, content FROM articles "
+                  "WHERE rowid > ? AND rowid <= ?", (after_rowid, last_rowid))
+        self._index_articles(c, [(x[0], x[1], self._codec.decompress(x[2]))
+                                 for x in c.fetchall()])
+        c.execute("SELECT p.article, p.content FROM parsed_articles p "
+                  "JOIN articles a ON a.url = p.article "
+                  "WHERE a.rowid > ? AND a.rowid <= ?",
+                  (after_rowid, last_rowid))
+        self._index_parsed_articles(c, [(x[0], self._codec.decompress(x[1]))
+                                        for x in c.fetchall()])
+
+    # store the minhash signature of an article and put it in the cluster of
+    # its most similar stored near duplicate, or a new cluster named after its
+    # rowid. only the newest articles sharing an lsh bucket with it are
+    # compared, about limit of them split over its buckets. returns the
+    # cluster or None if the text is too short
+    def _fingerprint_article(self, c, rowid, text, limit=200):
+        sig = signature(text)
+
+        if sig is None:
+            return None
+
+        keys = band_keys(sig)
+
+        # the newest articles of each bucket, read backwards from the primary
+        # key so a hot bucket isn't sorted as a whole
+        per_key = -(-limit // len(keys))
+        buckets = " UNION ".join(["SELECT article FROM (SELECT article "
+                                  "FROM fingerprint_bands WHERE key = ? "
+                                  "ORDER BY article DESC LIMIT ?)"] *
+                                 len(keys))
+        c.execute("SELECT f.article, f.signature, f.cluster FROM "
+                  f"article_fingerprints f WHERE f.article IN ({buckets})",
+                  [y for x in keys for y in (x, per_key)])
+        cluster = rowid
+        best = THRESHOLD
+
+        for article, other, other_cluster in c.fetchall():
+            score = similarity(sig, unpack(other))
+
+            if score >= best and article != rowid:
+                best = score
+                cluster = other_cluster
+
+        c.execute("INSERT OR REPLACE INTO article_fingerprints (article, "
+                  "signature, cluster) VALUES (?, ?, ?)",
+                  (rowid, pack(sig), cluster))
+        c.executemany("INSERT OR IGNORE INTO fingerprint_bands (key, "
+                      "article) VALUES (?, ?)", ((x, rowid) for x in keys))
+
+        if cluster != rowid:
+            self._metrics.incr("near_duplicates")
+
+        return cluster
+
+    # fingerprint every stored article from scratch in the order they were
+    # stored, committing every batch. articles with a short summary are
+    # fingerprinted with their parsed text. returns the number of articles
+    # that are near duplicates of an earlier one
+    def rebuild_fingerprints(self, batch_size=1000):
+        c = self._conn.cursor()
+        c.execute("DELETE FROM article_fingerprints")
+        c.execute("DELETE FROM fingerprint_bands")
+        last_rowid = 0
+        duplicates = 0
+
+        while True:
+            c.execute("SELECT a.rowid, a.title, a.content, ("
+                      "SELECT p.content FROM parsed_articles p "
+                      "WHERE p.article = a.url LIMIT 1) FROM articles a "
+                      "WHERE a.rowid > ? ORDER BY a.rowid LIMIT ?",
+                      (last_rowid, batch_size))
+            rows = c.fetchall()
+
+            if not rows:
+                break
+
+            for rowid, title, content, parsed in rows:
+                title, summary = entry_text(self._codec.decompress(content),
+                                            title)
+                text = f"{title} {summary}"
+
+                if signature(text) is None and parsed is not None:
+                    text += " " + parsed_text(self._codec.decompress(parsed))
+
+                cluster = self._fingerprint_article(c, rowid, text)
+                duplicates += cluster is not None and cluster != rowid
+
+            self._conn.commit()
+            last_rowid = rows[-1][0]
+
+        return duplicates
+
+    # get the urls of the other articles in the near duplicate cluster of an
+    # article, oldest first
+    def get_near_duplicates(self, article_url):
+        c = self._conn.cursor()
+        c.execute("SELECT b.url FROM articles a "
+                  "JOIN article_fingerprints f ON f.article = a.rowid "
+                  "JOIN article_fingerprints g ON g.cluster = f.cluster "
+                  "JOIN articles b ON b.rowid = g.article "
+                  "WHERE a.url = ? AND b.rowid != a.rowid ORDER BY b.rowid",
+                  (article_url,))
+        return [x[0] for x in c.fetchall()]
+
+    # rebuild the full text index from scratch, committing every batch.
+    # returns the number of indexed articles or None without fts5
+    def rebuild_full_text_index(self, batch_size=1000):
+        if not self._full_text:
+            return None
+
+        c = self._conn.cursor()
+        c.execute("DELETE FROM articles_fts")
+        last_rowid = 0
+        indexed = 0
+
+        while True:
+            c.execute("SELECT rowid FROM articles WHERE rowid > ? "
+                      "ORDER BY rowid LIMIT ?", (last_rowid, batch_size))
+            rowids = [x[0] for x in c.fetchall()]
+
+            if not rowids:
+                break
+
+            self._index_article_range(c, last_rowid, rowids[-1])
+            self._conn.commit()
+            indexed += len(rowids)
+            last_rowid = rowids[-1]
+
+        self._conn.commit()
+        return indexed
+
+    # search the title, summary and parsed text of the articles stored in a
+    # time range, best matches first. query uses the fts5 query syntax (e.g.
+    # 'title:election AND "general strike"'), website, language and country
+    # are optional filters and results are paged with limit and offset.
+    # raises sqlite3.OperationalError on a malformed query
+    def search_articles(self, query, fst="0000-00-00 00:00:00",
+                        lst="9999-12-31 23:59:59", website=None,
+                        language=None, country=None, limit=20, offset=0):
+        if not self._full_text:
+            raise RuntimeError("sqlite was built without fts5")
+
+        filters = []
+        params = [query, fst, lst]
+
+        if website is not None:
+            filters.append("AND w.url_key = ? ")
+            params.append(normalize_url(website))
+
+        if language is not None:
+            filters.append("AND w.language = ? ")
+            params.append(language)
+
+        if country is not None:
+            filters.append("AND w.country = ? ")
+            params.append(country)
+
+        # matches in the title count more than in the summary or the body
+        c = self._conn.cursor()
+        c.execute("SELECT a.rowid, a.url, a.time, a.published, "
+                  "articles_fts.title, a.feed, a.website, w.language, "
+                  "w.country, bm25(articles_fts, 4.0, 2.0, 1.0) AS score, "
+                  "snippet(articles_fts, -1, '[', ']', '...', 16) "
+                  "FROM articles_fts "
+                  "JOIN articles a ON a.rowid = articles_fts.rowid "
+                  "JOIN websites w ON w.url = a.website "
+                  "WHERE articles_fts MATCH ? AND a.time >= ? AND "
+                  f"a.time <= ? {''.join(filters)}"
+                  "ORDER BY score LIMIT ? OFFSET ?",
+                  params + [limit, offset])
+        return [{"rowid": x[0], "url": x[1], "time": x[2], "published": x[3],
+                 "title": x[4], "feed": x[5], "website": x[6],
+                 "language": x[7], "country": x[8], "score": x[9],
+                 "snippet": x[10]} for x in c.fetchall()]
+
+    # get the stored and uncompressed size of the content of each table
+    def get_content_stats(self):
+        c = self._conn.cursor()
+        stats = {}
+
+        for table in ("articles", "parsed_articles"):
+            rows = compressed = stored = original = 0
+            c.execute(f"SELECT content FROM {table}")
+
+            while True:
+                chunk = c.fetchmany(1000)
+
+                if not chunk:
+                    break
+
+                for x in chunk:
+                    content = self._codec.decompress(x[0])
+                    rows += 1
+                    original += len(content.encode("utf-8"))
+
+                    if isinstance(x[0], bytes):
+                        compressed += 1
+                        stored += len(x[0])
+                    else:
+                        stored += len(x[0].encode("utf-8"))
+
+            ratio = original / stored if stored > 0 else 1.0
+            stats[table] = {"rows": rows, "compressed_rows": compressed,
+                            "stored_bytes": stored,
+                            "original_bytes": original, "ratio": ratio}
+
+        return stats
+
     # get a list of feed urls
     def get_all_feed_urls(self):
         c = self._conn.cursor()
@@ -108,6 +1121,76 @@ class Database(object):
         all_feeds = c.fetchall()
         return [x[0] for x in all_feeds]
 
+    # get the urls of the feeds worth crawling, i.e. the active feeds except
+    # the failing ones that are backing off until their next poll
+    def get_active_feed_urls(self):
+        c = self._conn.cursor()
+        c.execute("SELECT f.url FROM feeds f "
+                  "LEFT JOIN feed_health h ON h.feed = f.url "
+                  "LEFT JOIN feed_schedule s ON s.feed = f.url "
+                  "WHERE h.feed IS NULL OR (h.inactive = 0 AND "
+                  "(h.failures = 0 OR s.next_poll IS NULL OR "
+                  "s.next_poll <= datetime('now')))")
+        return [x[0] for x in c.fetchall()]
+
+    # get the urls of the active feeds that are due to be polled, feeds that
+    # were never polled are always due
+    def get_due_feed_urls(self):
+        c = self._conn.cursor()
+        c.execute("SELECT f.url FROM feeds f "
+                  "LEFT JOIN feed_schedule s ON s.feed = f.url "
+                  "LEFT JOIN feed_health h ON h.feed = f.url "
+                  "WHERE (h.inactive IS NULL OR h.inactive = 0) AND "
+                  "(s.next_poll IS NULL OR s.next_poll <= datetime('now')) "
+                  "ORDER BY s.next_poll")
+        return [x[0] for x in c.fetchall()]
+
+    # get the earliest time at which an active scheduled feed is due
+    def get_next_poll_time(self):
+        c = self._conn.cursor()
+        c.execute("SELECT MIN(s.next_poll) FROM feed_schedule s "
+                  "LEFT JOIN feed_health h ON h.feed = s.feed "
+                  "WHERE h.inactive IS NULL OR h.inactive = 0")
+        return c.fetchone()[0]
+
+    # get the circuit breaker state of the hosts as (host, failures, open
+    # until in seconds since the epoch or None, last error) tuples
+    def get_host_health(self):
+        c = self._conn.cursor()
+        c.execute("SELECT host, failures, "
+                  "CAST(strftime('%s', open_until) AS INTEGER), last_error "
+                  "FROM host_health")
+        return c.fetchall()
+
+    # get the failing hosts and the failing or inactive feeds, most failures
+    # first
+    def get_health_report(self):
+        c = self._conn.cursor()
+        c.execute("SELECT host, failures, open_until, last_error "
+                  "FROM host_health WHERE failures > 0 "
+                  "ORDER BY failures DESC, host")
+        hosts = [{"host": x[0], "failures": x[1], "open_until": x[2],
+                  "last_error": x[3]} for x in c.fetchall()]
+        c.execute("SELECT h.feed, h.failures, h.gone, h.inactive, "
+                  "h.last_status, h.last_error, h.last_success, "
+                  "h.last_failure, s.next_poll FROM feed_health h "
+                  "LEFT JOIN feed_schedule s ON s.feed = h.feed "
+                  "WHERE h.failures > 0 OR h.inactive = 1 "
+                  "ORDER BY h.inactive DESC, h.failures DESC, h.feed")
+        feeds = [{"feed": x[0], "failures": x[1], "gone": x[2],
+                  "inactive": bool(x[3]), "last_status": x[4],
+                  "last_error": x[5], "last_success": x[6],
+                  "last_failure": x[7], "next_poll": x[8]}
+                 for x in c.fetchall()]
+        return {"hosts": hosts, "feeds": feeds}
+
+    # get the insert times of the most recent articles of a feed
+    def get_recent_article_times(self, feed_url, limit=20):
+        c = self._conn.cursor()
+        c.execute("SELECT time FROM articles WHERE feed=? "
+                  "ORDER BY time DESC LIMIT ?", (feed_url, limit))
+        return [x[0] for x in c.fetchall()]
+
     # get all feeds
     def get_all_feeds(self):
         c = self._conn.cursor()
@@ -130,14 +1213,126 @@ class Database(object):
         return {x[0]: {"name": x[1], "language": x[2], "country": x[3]}
                 for x in all_websites}
 
-    # get all articles
+    # iterate over the url keys of all stored and archived articles without
+    # loading them at once
+    def iter_article_url_keys(self, chunk_size=10000):
+        c = self._conn.cursor()
+        c.execute("SELECT url_key FROM articles UNION ALL "
+                  "SELECT url_key FROM archived_urls")
+
+        while True:
+            rows = c.fetchmany(chunk_size)
+
+            if not rows:
+                return
+
+            for x in rows:
+                yield x[0]
+
+    # get all articles, including archived ones
     def get_articles_in_time_range(self, fst, lst):
+        return {x["url"]: {"time": x["time"], "content": x["content"],
+                           "feed": x["feed"], "website": x["website"],
+                           "title": x["title"], "published": x["published"],
+                           "author": x["author"], "guid": x["guid"]}
+                for x in self.iter_articles(fst, lst)}
+
+    # iterate over the articles in a time range ordered by (time, rowid),
+    # reading chunk_size rows at a time. after is a (time, rowid) cursor of the
+    # last article already seen, so an export can be resumed from it. with by
+    # set to "published" the range and order are those of the entries'
+    # publishing times instead of the times they were stored at. the archive
+    # partitions that may hold articles in the range are read as well and
+    # merged in order, archived articles keep their rowids
+    def iter_articles(self, fst, lst, chunk_size=1000, after=None, by="time"):
+        assert by in ("time", "published")
+
+        if after is None:
+            after = (fst, 0)
+
+        sources = [self._iter_partition_articles(x, fst, lst, chunk_size,
+                                                 after, by)
+                   for x in self._get_archive_partitions(fst, lst, by)]
+        sources.append(self._iter_article_rows(self._conn, fst, lst,
+                                               chunk_size, after, by))
+
+        if len(sources) == 1:
+            yield from sources[0]
+            return
+
+        yield from heapq.merge(*sources, key=lambda x: (x[by], x["rowid"]))
+
+    # get the filenames of the archive partitions that may hold articles in a
+    # time range, partitions are by month of the time articles were stored at
+    # so all of them may hold articles published in the range
+    def _get_archive_partitions(self, fst, lst, by):
+        c = self._conn.cursor()
+
+        if by == "time":
+            c.execute("SELECT filename FROM archive_partitions "
+                      "WHERE month >= ? AND month <= ? ORDER BY month",
+                      (fst[:7], lst[:7]))
+        else:
+            c.execute("SELECT filename FROM archive_partitions "
+                      "ORDER BY month")
+
+        return [os.path.join(self._db_dir, x[0]) for x in c.fetchall()]
+
+    def _iter_partition_articles(self, filename, fst, lst, chunk_size, after,
+                                 by):
+        conn = sqlite3.connect(f"file:{pathname2url(filename)}?mode=ro",
+                               uri=True)
+
+        try:
+            yield from self._iter_article_rows(conn, fst, lst, chunk_size,
+                                               after, by)
+        finally:
+            conn.close()
+
+    def _iter_article_rows(self, conn, fst, lst, chunk_size, after, by):
+        c = conn.cursor()
+        last_time, last_rowid = after
+
+        while True:
+            # start the index range scan at the cursor rather than at fst
+            c.execute("SELECT rowid, url, time, content, feed, website, "
+                      "title, published, author, guid "
+                      f"FROM articles WHERE {by} >= ? AND {by} <= ? AND "
+                      f"({by} > ? OR rowid > ?) ORDER BY {by}, rowid "
+                      "LIMIT ?", (max(fst, last_time), lst, last_time,
+                                  last_rowid, chunk_size))
+            rows = c.fetchall()
+
+            for x in rows:
+                yield {"rowid": x[0], "url": x[1], "time": x[2],
+                       "content": self._codec.decompress(x[3]),
+                       "feed": x[4], "website": x[5], "title": x[6],
+                       "published": x[7], "author": x[8], "guid": x[9]}
+
+            if len(rows) < chunk_size:
+                return
+
+            last_time = rows[-1][2] if by == "time" else rows[-1][7]
+            last_rowid = rows[-1][0]
+
+    # get the cache validators from the last successful fetch of a feed
+    def get_feed_cache(self, feed_url):
+        c = self._conn.cursor()
+        c.execute("SELECT etag, last_modified, hash FROM feed_cache "
+                  "WHERE feed = ?", (feed_url,))
+        x = c.fetchone()
+
+        if x:
+            return {"etag": x[0], "last_modified": x[1], "hash": x[2]}
+
+        return None
+
+    # get the value of a named checkpoint or None if it was never set
+    def get_checkpoint(self, name):
         c = self._conn.cursor()
-        c.execute("SELECT url, time, content, feed, website FROM articles "
-                  "WHERE time >= ? AND time <= ?", (fst, lst))
-        all_articles = c.fetchall()
-        return {x[0]: {"time": x[1], "content": x[2], "feed": x[3], "website": x[4]}
-                for x in all_articles}
+        c.execute("SELECT value FROM checkpoints WHERE name=?", (name,))
+        x = c.fetchone()
+        return x[0] if x else None
 
     def get_feed_details(self, feed_url):
         c = self._conn.cursor()
@@ -157,10 +1352,31 @@ class Database(object):
         x = c.fetchone()
 
         if x:
-            return {"article": x[0], "parser": x[1], "content": x[2]}
+            return {"article": x[0], "parser": x[1],
+                    "content": self._codec.decompress(x[2])}
 
         return None
 
+    # get (rowid, url) of up to limit articles after a rowid that haven't been
+    # parsed by a parser yet, in rowid order. skip_duplicates leaves out the
+    # articles that are near duplicates of an earlier one
+    def get_unparsed_articles(self, parser, after_rowid=0, limit=1000,
+                              skip_duplicates=False):
+        duplicates = ""
+
+        if skip_duplicates:
+            duplicates = ("AND NOT EXISTS (SELECT 1 FROM article_fingerprints "
+                          "f WHERE f.article = a.rowid AND "
+                          "f.cluster != a.rowid) ")
+
+        c = self._conn.cursor()
+        c.execute("SELECT a.rowid, a.url FROM articles a "
+                  "LEFT JOIN parsed_articles p "
+                  "ON p.article = a.url AND p.parser = ? "
+                  f"WHERE p.article IS NULL AND a.rowid > ? {duplicates}"
+                  "ORDER BY a.rowid LIMIT ?", (parser, after_rowid, limit))
+        return c.fetchall()
+
     def get_website_details(self, website_url):
         c = self._conn.cursor()
         c.execute("SELECT url, name, language, country FROM websites "
@@ -179,6 +1395,109 @@ class Database(object):
         c.execute("SELECT website FROM feeds WHERE url=?", (feed_url,))
         return c.fetchone()[0]
 
+    # import feeds and their websites in one transaction with set based
+    # upserts, each feed is a dict with the keys of an --add-feeds file. the
+    # feeds are staged in a temp table chunk_size at a time so they can be
+    # streamed, the last row of a feed or website wins. stored urls that only
+    # differ from an imported one in protocol are changed to it along with
+    # the rows that refer to them. returns the number of inserted, updated and
+    # unchanged websites and feeds, and how many of the updated ones moved to
+    # another protocol
+    def import_feeds(self, feeds, chunk_size=10000):
+        c = self._conn.cursor()
+        c.execute("CREATE TEMP TABLE import_rows ("
+                  "url TEXT NOT NULL, name TEXT NOT NULL, "
+                  "website TEXT NOT NULL, website_name TEXT NOT NULL, "
+                  "language TEXT NOT NULL, country TEXT NOT NULL, "
+                  "url_key TEXT NOT NULL, website_key TEXT NOT NULL)")
+
+        try:
+            for chunk in _chunks(feeds, chunk_size):
+                c.executemany("INSERT INTO import_rows "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              ((x["url"], x["name"], x["website_url"],
+                                x["website_name"], x["website_language"],
+                                x["website_country"], normalize_url(x["url"]),
+                                normalize_url(x["website_url"]))
+                               for x in chunk))
+
+            c.execute("CREATE TEMP TABLE import_websites ("
+                      "url_key TEXT PRIMARY KEY NOT NULL, url TEXT NOT NULL, "
+                      "name TEXT NOT NULL, language TEXT NOT NULL, "
+                      "country TEXT NOT NULL)")
+            c.execute("INSERT INTO import_websites (url_key, url, name, "
+                      "language, country) SELECT website_key, website, "
+                      "website_name, language, country FROM import_rows "
+                      "WHERE rowid IN (SELECT MAX(rowid) FROM import_rows "
+                      "GROUP BY website_key)")
+            c.execute("CREATE TEMP TABLE import_feeds ("
+                      "url_key TEXT PRIMARY KEY NOT NULL, url TEXT NOT NULL, "
+                      "name TEXT NOT NULL, website TEXT NOT NULL)")
+            c.execute("INSERT INTO import_feeds (url_key, url, name, "
+                      "website) SELECT r.url_key, r.url, r.name, w.url "
+                      "FROM import_rows r JOIN import_websites w "
+                      "ON w.url_key = r.website_key WHERE r.rowid IN ("
+                      "SELECT MAX(rowid) FROM import_rows GROUP BY url_key)")
+            c.execute("CREATE TEMP TABLE import_moves ("
+                      "old_url TEXT PRIMARY KEY NOT NULL, "
+                      "new_url TEXT NOT NULL)")
+            counts = {"websites": self._import_table(
+                          c, "websites", ("name", "language", "country")),
+                      "feeds": self._import_table(c, "feeds",
+                                                  ("name", "website"))}
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            for table in ("import_rows", "import_websites", "import_feeds",
+                          "import_moves"):
+                c.execute(f"DROP TABLE IF EXISTS temp.{table}")
+
+        return counts
+
+    # upsert the staged rows of temp.import_{table} into a table, returns the
+    # number of inserted, updated, unchanged and moved rows
+    def _import_table(self, c, table, columns):
+        staged = f"temp.import_{table}"
+        same = " AND ".join(f"t.{x} IS i.{x}" for x in columns)
+        c.execute(f"SELECT COUNT(*), COALESCE(SUM(EXISTS (SELECT 1 "
+                  f"FROM {table} t WHERE t.url_key = i.url_key)), 0), "
+                  f"COALESCE(SUM(EXISTS (SELECT 1 FROM {table} t "
+                  f"WHERE t.url = i.url AND {same})), 0) FROM {staged} i")
+        total, stored, unchanged = c.fetchone()
+
+        # the protocol changed (e.g. http to https) if the key of an imported
+        # url is stored under another url
+        c.execute("DELETE FROM import_moves")
+        c.execute(f"INSERT INTO import_moves (old_url, new_url) "
+                  f"SELECT MIN(t.url), i.url FROM {staged} i "
+                  f"JOIN {table} t ON t.url_key = i.url_key "
+                  f"WHERE NOT EXISTS (SELECT 1 FROM {table} x "
+                  f"WHERE x.url = i.url) GROUP BY i.url")
+        moved = c.rowcount
+
+        if moved > 0:
+            for ref_table, column in ((table, "url"),) + _url_references[
+                    table]:
+                c.execute(f"UPDATE {ref_table} SET {column} = ("
+                          f"SELECT new_url FROM import_moves "
+                          f"WHERE old_url = {ref_table}.{column}) "
+                          f"WHERE {column} IN (SELECT old_url "
+                          f"FROM import_moves)")
+
+        # the where clause keeps sqlite from reading ON as a join constraint
+        names = ", ".join(columns)
+        updates = ", ".join(f"{x}=excluded.{x}" for x in columns)
+        changed = " OR ".join(f"{x} IS NOT excluded.{x}" for x in columns)
+        c.execute(f"INSERT INTO {table} (url, {names}, url_key) "
+                  f"SELECT url, {names}, url_key FROM {staged} WHERE 1 "
+                  f"ON CONFLICT(url) DO UPDATE SET {updates} "
+                  f"WHERE {changed}")
+
+        return {"inserted": total - stored, "updated": stored - unchanged,
+                "unchanged": unchanged, "moved": moved}
+
     # insert an article into the database, return the number of affected rows
     def insert_article(self, article_url, feed_url, website_url, content,
                        time = None):
@@ -189,28 +1508,100 @@ class Database(object):
                 feed_url = ''
 
             if time is None:
-                c.execute("INSERT INTO articles (url, feed, website, content) "
-                          "VALUES (?, ?, ?, ?)", (article_url, feed_url,
-                                                  website_url, content))
+                c.execute("INSERT INTO articles (url, feed, website, content, "
+                          "url_key) VALUES (?, ?, ?, ?, ?)",
+                          (article_url, feed_url, website_url,
+                           self._codec.compress(content),
+                           normalize_url(article_url)))
             else:
                 c.execute("INSERT INTO articles (url, feed, website, content, "
-                          "time) VALUES (?, ?, ?, ?, ?)", (article_url,
-                                                           feed_url,
-                                                           website_url,
-                                                           content, time))
+                          "time, url_key) VALUES (?, ?, ?, ?, ?, ?)",
+                          (article_url, feed_url, website_url,
+                           self._codec.compress(content), time,
+                           normalize_url(article_url)))
 
             assert c.rowcount == 1
+            self._index_articles(c, [(c.lastrowid, None, content)])
             self._conn.commit()
             return 1
 
         return 0
 
+    # insert a batch of articles in a single transaction, each article is a
+    # dict with url, feed, website and content keys and optional time, title,
+    # published, author and guid keys. articles that are stored or archived
+    # are skipped. returns a tuple with the number of inserted and skipped
+    # articles
+    def insert_articles(self, articles, chunk_size=500):
+        c = self._conn.cursor()
+        seen = set()
+        inserted = 0
+        skipped = 0
+
+        # a failed chunk undoes the whole batch rather than leaving the
+        # chunks before it in an open transaction
+        try:
+            # keep each lookup below sqlite's limit on the number of variables
+            for chunk in _chunks(articles, chunk_size):
+                keys = [normalize_url(x["url"]) for x in chunk]
+
+                with self._metrics.timer("db_dedup"):
+                    for table in ("articles", "archived_urls"):
+                        c.execute(f"SELECT url_key FROM {table} WHERE "
+                                  f"url_key IN ({', '.join('?' * len(keys))})",
+                                  keys)
+                        seen.update(x[0] for x in c.fetchall())
+
+                rows = []
+                texts = {}
+
+                for article, key in zip(chunk, keys):
+                    if key in seen:
+                        skipped += 1
+                        continue
+
+                    seen.add(key)
+                    texts[key] = (article.get("title"), article["content"])
+                    rows.append((article["url"], article.get("feed") or '',
+                                 article["website"],
+                                 self._codec.compress(article["content"]),
+                                 article.get("time"), key) +
+                                tuple(article.get(x) for x in _entry_columns))
+
+                with self._metrics.timer("db_insert"):
+                    c.executemany("INSERT INTO articles (url, feed, "
+                                  "website, content, time, url_key, title, "
+                                  "published, author, guid) VALUES (?, ?, ?, "
+                                  "?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, "
+                                  "?, ?, ?)", rows)
+
+                # look up the rowids of the new articles to index them
+                if (self._full_text or self._near_duplicates) and texts:
+                    with self._metrics.timer("db_index"):
+                        c.execute("SELECT rowid, url_key FROM articles "
+                                  "WHERE url_key IN "
+                                  f"({', '.join('?' * len(texts))})",
+                                  list(texts))
+                        self._index_articles(c, [(x[0],) + texts[x[1]]
+                                                 for x in c.fetchall()])
+
+                inserted += len(rows)
+
+            with self._metrics.timer("db_commit"):
+                self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+
+        return inserted, skipped
+
     # insert an rss feed into the database, return the number of affected rows
     def insert_feed(self, feed_url, website_url, name):
         if not self.check_if_feed_exists(feed_url, True):
             c = self._conn.cursor()
-            c.execute("INSERT INTO feeds (url, website, name) "
-                      "VALUES (?, ?, ?)", (feed_url, website_url, name))
+            c.execute("INSERT INTO feeds (url, website, name, url_key) "
+                      "VALUES (?, ?, ?, ?)", (feed_url, website_url, name,
+                                              normalize_url(feed_url)))
             assert c.rowcount == 1
             self._conn.commit()
             return 1
@@ -223,20 +1614,46 @@ class Database(object):
         if not self.check_if_parsed_article_exists(article_url, parser):
             c = self._conn.cursor()
             c.execute("INSERT INTO parsed_articles (article, parser, content) "
-                      "VALUES (?, ?, ?)", (article_url, parser, content))
+                      "VALUES (?, ?, ?)", (article_url, parser,
+                                           self._codec.compress(content)))
             assert c.rowcount == 1
+            self._index_parsed_articles(c, [(article_url, content)])
             self._conn.commit()
             return 1
 
         return 0
 
+    # insert a batch of (article url, parser, content) parsed articles in one
+    # transaction, skipping the ones that already exist. checkpoint is an
+    # optional (name, value) pair saved in the same transaction. returns the
+    # number of inserted rows
+    def insert_parsed_articles(self, parsed_articles, checkpoint=None):
+        parsed_articles = list(parsed_articles)
+        c = self._conn.cursor()
+        changes = self._conn.total_changes
+        c.executemany("INSERT OR IGNORE INTO parsed_articles (article, "
+                      "parser, content) VALUES (?, ?, ?)",
+                      ((x[0], x[1], self._codec.compress(x[2]))
+                       for x in parsed_articles))
+        inserted = self._conn.total_changes - changes
+        self._index_parsed_articles(c, ((x[0], x[2])
+                                        for x in parsed_articles))
+
+        if checkpoint is not None:
+            c.execute("INSERT OR REPLACE INTO checkpoints (name, value) "
+                      "VALUES (?, ?)", checkpoint)
+
+        self._conn.commit()
+        return inserted
+
     # insert a website into the database, return the number of affected rows
     def insert_website(self, website_url, name, language, country):
         if not self.check_if_website_exists(website_url, True):
             c = self._conn.cursor()
-            c.execute("INSERT INTO websites (url, name, language, country) "
-                      "VALUES (?, ?, ?, ?)", (website_url, name, language,
-                                              country))
+            c.execute("INSERT INTO websites (url, name, language, country, "
+                      "url_key) VALUES (?, ?, ?, ?, ?)",
+                      (website_url, name, language, country,
+                       normalize_url(website_url)))
             assert c.rowcount == 1
             self._conn.commit()
             return 1
@@ -257,9 +1674,13 @@ class Database(object):
             # no changes to protocol so just update article details
             c = self._conn.cursor()
             c.execute("UPDATE articles SET feed=?, website=?, content=? "
-                      "WHERE url=?", (feed_url, website_url, content,
+                      "WHERE url=?", (feed_url, website_url,
+                                      self._codec.compress(content),
                                       article_url))
             assert c.rowcount == 1
+            c.execute("SELECT rowid, title FROM articles WHERE url=?",
+                      (article_url,))
+            self._index_articles(c, [c.fetchone() + (content,)], False)
             self._conn.commit()
             return 1
 
@@ -267,16 +1688,27 @@ class Database(object):
         # in the parsed_articles table as well
         c = self._conn.cursor()
 
-        # get old url
-        tmp_url = "%{}".format(article_url[article_url.find("://"):])
-        c.execute("SELECT url FROM articles WHERE url LIKE ?", (tmp_url,))
-        old_url = c.fetchone()[0]
+        # get old url, the article may only be known from its archived url key
+        # and archived articles aren't updated
+        c.execute("SELECT url FROM articles WHERE url_key=?",
+                  (normalize_url(article_url),))
+        row = c.fetchone()
+
+        if row is None:
+            return 0
+
+        old_url = row[0]
 
         # update article details
-        c.execute("UPDATE articles SET url=?, feed=?, website=?, content=? "
-                  "WHERE url=?", (article_url, feed_url, website_url, content,
-                                  old_url))
+        c.execute("UPDATE articles SET url=?, feed=?, website=?, content=?, "
+                  "url_key=? WHERE url=?", (article_url, feed_url, website_url,
+                                            self._codec.compress(content),
+                                            normalize_url(article_url),
+                                            old_url))
         assert c.rowcount == 1
+        c.execute("SELECT rowid, title FROM articles WHERE url=?",
+                  (article_url,))
+        self._index_articles(c, [c.fetchone() + (content,)], False)
         self._conn.commit()
 
         # update foreign key in parsed_articles table
@@ -297,32 +1729,142 @@ class Database(object):
             c = self._conn.cursor()
 
             # get old url
-            tmp_url = "%{}".format(feed_url[feed_url.find("://"):])
-            c.execute("SELECT url FROM feeds WHERE url LIKE ?", (tmp_url,))
-            old_url = c.fetchone()[0]
+            c.execute("SELECT url FROM feeds WHERE url_key=?",
+                      (normalize_url(feed_url),))
+            row = c.fetchone()
+
+            if row is None:
+                return 0
+
+            old_url = row[0]
 
             # update feed details
-            c.execute("UPDATE feeds SET url=?, website=?, name=? "
-                      "WHERE url=?", (feed_url, website_url, name, old_url))
+            c.execute("UPDATE feeds SET url=?, website=?, name=?, url_key=? "
+                      "WHERE url=?", (feed_url, website_url, name,
+                                      normalize_url(feed_url), old_url))
             assert c.rowcount == 1
             self._conn.commit()
 
-            # update foreign key
+            # update foreign keys
             c.execute("UPDATE articles SET feed=? WHERE feed=?", (feed_url,
                                                                   old_url))
             rowcount = 1 + c.rowcount
+            c.execute("UPDATE feed_cache SET feed=? WHERE feed=?", (feed_url,
+                                                                    old_url))
+            rowcount += c.rowcount
+            c.execute("UPDATE feed_schedule SET feed=? WHERE feed=?",
+                      (feed_url, old_url))
+            rowcount += c.rowcount
+            c.execute("UPDATE feed_health SET feed=? WHERE feed=?",
+                      (feed_url, old_url))
+            rowcount += c.rowcount
             self._conn.commit()
 
             return rowcount
 
+    # insert or update the cache validators of a feed
+    def update_feed_cache(self, feed_url, etag, last_modified, body_hash):
+        c = self._conn.cursor()
+        c.execute("INSERT OR REPLACE INTO feed_cache (feed, etag, "
+                  "last_modified, hash) VALUES (?, ?, ?, ?)",
+                  (feed_url, etag, last_modified, body_hash))
+        assert c.rowcount == 1
+        self._conn.commit()
+        return 1
+
+    # schedule the next poll of a feed interval seconds from now
+    def update_feed_schedule(self, feed_url, interval):
+        c = self._conn.cursor()
+        c.execute("INSERT OR REPLACE INTO feed_schedule (feed, next_poll, "
+                  "interval) VALUES (?, datetime('now', ?), ?)",
+                  (feed_url, f"+{int(interval)} seconds", interval))
+        assert c.rowcount == 1
+        self._conn.commit()
+        return 1
+
+    # record a successful fetch of a feed, which resets its failures
+    def update_feed_success(self, feed_url, status_code):
+        c = self._conn.cursor()
+        c.execute("UPDATE feed_health SET failures=0, gone=0, inactive=0, "
+                  "last_status=?, last_error=NULL, "
+                  "last_success=CURRENT_TIMESTAMP WHERE feed=?",
+                  (status_code, feed_url))
+
+        if c.rowcount == 0:
+            c.execute("INSERT INTO feed_health (feed, last_status, "
+                      "last_success) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                      (feed_url, status_code))
+
+        self._conn.commit()
+        return 1
+
+    # record a failed fetch of a feed, a feed becomes inactive once it has
+    # been gone (404 or 410) gone_after times in a row. returns a tuple with
+    # the number of consecutive failures and whether the feed is inactive
+    def update_feed_failure(self, feed_url, status_code, error, gone_after=3):
+        gone = int(status_code in (404, 410))
+        c = self._conn.cursor()
+        c.execute("UPDATE feed_health SET failures=failures + 1, "
+                  "gone=CASE WHEN ? THEN gone + 1 ELSE 0 END, "
+                  "last_status=?, last_error=?, "
+                  "last_failure=CURRENT_TIMESTAMP WHERE feed=?",
+                  (gone, status_code, error, feed_url))
+
+        if c.rowcount == 0:
+            c.execute("INSERT INTO feed_health (feed, failures, gone, "
+                      "last_status, last_error, last_failure) "
+                      "VALUES (?, 1, ?, ?, ?, CURRENT_TIMESTAMP)",
+                      (feed_url, gone, status_code, error))
+
+        c.execute("UPDATE feed_health SET inactive=1 WHERE feed=? AND gone>=?",
+                  (feed_url, gone_after))
+        c.execute("SELECT failures, inactive FROM feed_health WHERE feed=?",
+                  (feed_url,))
+        failures, inactive = c.fetchone()
+        self._conn.commit()
+        return failures, bool(inactive)
+
+    # save the circuit breaker state of hosts from (host, failures, open until
+    # in seconds since the epoch or None, last error) tuples
+    def update_host_health(self, hosts):
+        c = self._conn.cursor()
+        c.executemany("INSERT OR REPLACE INTO host_health (host, failures, "
+                      "open_until, last_error, updated) "
+                      "VALUES (?, ?, datetime(?, 'unixepoch'), ?, "
+                      "strftime('%Y-%m-%d %H:%M:%f', 'now'))", hosts)
+        self._conn.commit()
+
+    # make the inactive feeds active again, e.g. after fixing their urls.
+    # returns the number of reactivated feeds
+    def reactivate_feeds(self):
+        c = self._conn.cursor()
+        c.execute("UPDATE feed_health SET failures=0, gone=0, inactive=0 "
+                  "WHERE inactive=1")
+        reactivated = c.rowcount
+        self._conn.commit()
+        return reactivated
+
+    # forget the health and poll schedules of all feeds and hosts, so every
+    # feed is polled by the next crawl
+    def reset_health(self):
+        c = self._conn.cursor()
+
+        for table in ("feed_health", "feed_schedule", "host_health"):
+            c.execute(f"DELETE FROM {table}")
+
+        self._conn.commit()
+
     # insert of update a parsed article, returns the number of affected rows
     def update_parsed_article(self, article_url, parser, content):
         if self.insert_parsed_article(article_url, parser, content) == 1:
             return 1
 
+        c = self._conn.cursor()
         c.execute("UPDATE parsed_articles SET content=? WHERE article=? AND "
-                  "parser=?", (content, article_url, parser))
+                  "parser=?", (self._codec.compress(content), article_url,
+                               parser))
         assert c.rowcount == 1
+        self._index_parsed_articles(c, [(article_url, content)])
         self._conn.commit()
         return 1
 
@@ -346,14 +1888,21 @@ class Database(object):
         c = self._conn.cursor()
 
         # get old url
-        tmp_url = "%{}".format(website_url[website_url.find("://"):])
-        c.execute("SELECT url FROM websites WHERE url LIKE ?", (tmp_url,))
-        old_url = c.fetchone()[0]
+        c.execute("SELECT url FROM websites WHERE url_key=?",
+                  (normalize_url(website_url),))
+        row = c.fetchone()
+
+        if row is None:
+            return 0
+
+        old_url = row[0]
 
         # update website details
-        c.execute("UPDATE websites SET url=?, name=?, language=?, country=? "
-                  "WHERE url=?", (website_url, name, language, country,
-                                  old_url))
+        c.execute("UPDATE websites SET url=?, name=?, language=?, country=?, "
+                  "url_key=? WHERE url=?", (website_url, name, language,
+                                            country,
+                                            normalize_url(website_url),
+                                            old_url))
         assert c.rowcount == 1
         self._conn.commit()
 
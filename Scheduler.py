@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import calendar
+import http.client
+import time
+
+
+# statuses of a feed that was fetched successfully and of one that wasn't
+# fetched at all because its host's circuit breaker is open
+_ok_statuses = (200, 304)
+_circuit_open = 602
+
+
+# decides when each feed should be polled next based on how often it
+# publishes, the schedule is stored in the database so it survives restarts.
+# failing feeds back off exponentially and feeds that are gone become inactive
+class Scheduler(object):
+    # intervals are in seconds, gone_after is the number of 404 or 410
+    # responses in a row after which a feed is no longer polled
+    def __init__(self, db, min_interval=900, max_interval=86400,
+                 sample_size=20, max_backoff=604800, gone_after=3):
+        assert 0 < min_interval <= max_interval
+        assert min_interval <= max_backoff and gone_after > 0
+
+        self._db = db
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._sample_size = sample_size
+        self._max_backoff = max_backoff
+        self._gone_after = gone_after
+
+    # crawler callback that records the health of a fetched feed and
+    # schedules its next poll
+    def reschedule(self, result, inserted):
+        if result.status_code in _ok_statuses:
+            self._db.update_feed_success(result.url, result.status_code)
+            interval = self.estimate_interval(result.url, result.entries)
+        elif result.status_code == _circuit_open:
+            # the host failed, not the feed, try again once it may be back
+            interval = self._min_interval
+        else:
+            failures, inactive = self._db.update_feed_failure(
+                result.url, result.status_code,
+                self._error(result.status_code, result.text),
+                self._gone_after)
+
+            if inactive:
+                print(f"\tInactive, gone {self._gone_after} times in a row")
+
+            interval = self.backoff_interval(failures)
+
+        self._db.update_feed_schedule(result.url, interval)
+
+    # double the time until the next poll with every failure in a row
+    def backoff_interval(self, failures):
+        interval = self._min_interval * 2 ** min(failures - 1, 32)
+        return min(interval, self._max_backoff)
+
+    # poll about twice per expected post, a feed that has gone quiet for
+    # longer than its usual gap is treated as posting at that slower rate
+    def estimate_interval(self, feed_url, entries=None):
+        timestamps = self._entry_timestamps(entries)
+
+        # fall back to the times the feed's articles were stored at
+        if len(timestamps) < 2:
+            timestamps = self._article_timestamps(feed_url)
+
+        if len(timestamps) < 2:
+            return self._max_interval
+
+        timestamps = sorted(timestamps, reverse=True)[:self._sample_size]
+        gap = (timestamps[0] - timestamps[-1]) / (len(timestamps) - 1)
+        gap = max(gap, time.time() - timestamps[0])
+        return min(max(gap / 2, self._min_interval), self._max_interval)
+
+    # get the number of seconds until the next scheduled feed is due
+    def seconds_until_next_poll(self):
+        next_poll = self._parse_time(self._db.get_next_poll_time())
+
+        if next_poll is None:
+            return 0
+
+        return max(0, next_poll - time.time())
+
+    # describe a failure by the reason of the http status rather than the
+    # body of the error page, statuses from 600 are failures of the client
+    @staticmethod
+    def _error(status_code, text):
+        if status_code >= 600:
+            return text
+
+        return http.client.responses.get(status_code, f"HTTP {status_code}")
+
+    @staticmethod
+    def _entry_timestamps(entries):
+        timestamps = []
+
+        for entry in entries or []:
+            parsed = entry.get("published_parsed") or entry.get(
+                "updated_parsed")
+
+            if parsed:
+                timestamps.append(calendar.timegm(parsed))
+
+        return timestamps
+
+    def _article_timestamps(self, feed_url):
+        times = self._db.get_recent_article_times(feed_url, self._sample_size)
+        timestamps = [self._parse_time(x) for x in times]
+        return [x for x in timestamps if x is not None]
+
+    # convert a sqlite timestamp (in utc) to seconds since the epoch
+    @staticmethod
+    def _parse_time(value):
+        try:
+            return calendar.timegm(time.strptime(value, "%Y-%m-%d %H:%M:%S"))
+        except (TypeError, ValueError):
+            return None
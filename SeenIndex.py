@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import Counter
+from SQLite3 import normalize_url
+
+import hashlib
+import math
+import sys
+
+
+# in-memory index of the article urls already in the database so that most
+# "have we seen this entry" checks don't need a sqlite round trip. the exact
+# mode keeps a set of url digests, the bloom mode keeps a bloom filter and only
+# asks the database about possible hits
+class SeenIndex(object):
+    def __init__(self, db, mode="exact", error_rate=0.01):
+        assert mode in ("exact", "bloom")
+
+        self._db = db
+        self._mode = mode
+        self._entries = 0
+        self.stats = Counter()
+
+        if mode == "exact":
+            self._digests = set()
+        else:
+            # leave room for the articles added while the process is running
+            capacity = max(2 * db.count_articles(True), 100000)
+            self._num_bits = int(math.ceil(-capacity * math.log(error_rate) /
+                                           math.log(2) ** 2))
+            self._num_hashes = max(1, int(round(self._num_bits / capacity *
+                                                math.log(2))))
+            self._bits = bytearray((self._num_bits + 7) // 8)
+
+        for key in db.iter_article_url_keys():
+            self._add_key(key)
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    # get the bloom filter bit positions of a digest using double hashing
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self._num_bits
+                for i in range(self._num_hashes)]
+
+    def _add_key(self, key):
+        digest = self._digest(key)
+        self._entries += 1
+
+        if self._mode == "exact":
+            self._digests.add(digest)
+        else:
+            for pos in self._positions(digest):
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    # add an article url to the index
+    def add(self, url):
+        self._add_key(normalize_url(url))
+
+    # check the index without touching the database, false means the url is
+    # definitely new while true means it is (exact) or may be (bloom) known.
+    # this is safe to call from worker threads
+    def might_contain(self, url):
+        digest = self._digest(normalize_url(url))
+
+        if self._mode == "exact":
+            return digest in self._digests
+
+        return all(self._bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(digest))
+
+    # check if an article url is already stored, only possible hits in bloom
+    # mode fall through to the database. must be called from the thread that
+    # owns the database connection
+    def check(self, url):
+        self.stats["lookups"] += 1
+
+        if not self.might_contain(url):
+            self.stats["avoided_db_lookups"] += 1
+            return False
+
+        if self._mode == "exact":
+            self.stats["avoided_db_lookups"] += 1
+            return True
+
+        self.stats["db_lookups"] += 1
+
+        if self._db.check_if_article_exists(url, True):
+            return True
+
+        self.stats["false_positives"] += 1
+        return False
+
+    # get an estimate of the memory used by the index in bytes
+    def memory_usage(self):
+        if self._mode == "bloom":
+            return sys.getsizeof(self._bits)
+
+        digest_size = sys.getsizeof(self._digest(""))
+        return sys.getsizeof(self._digests) + digest_size * len(self._digests)
+
+    def metrics(self):
+        return {"mode": self._mode, "entries": self._entries,
+                "memory_bytes": self.memory_usage(),
+                "lookups": self.stats["lookups"],
+                "avoided_db_lookups": self.stats["avoided_db_lookups"],
+                "db_lookups": self.stats["db_lookups"],
+                "false_positives": self.stats["false_positives"]}
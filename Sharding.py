@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from urllib.parse import urlsplit
+
+import bisect
+import glob
+import hashlib
+import os
+
+
+# consistent hash ring over the shards, so changing the number of shards only
+# moves about 1/n of the feeds to another shard
+class HashRing(object):
+    def __init__(self, shard_count, replicas=64):
+        assert shard_count > 0
+
+        self._ring = sorted((self._hash(f"{shard}:{i}"), shard)
+                            for shard in range(shard_count)
+                            for i in range(replicas))
+        self._hashes = [x[0] for x in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    # get the shard a feed belongs to. all the feeds of a host share a shard
+    # so the per-host limits hold across shards, and a feed keeps its shard
+    # when its protocol changes
+    def shard_for(self, feed_url):
+        key = self._hash(urlsplit(feed_url.strip()).hostname or "")
+        index = bisect.bisect(self._hashes, key)
+        return self._ring[index % len(self._ring)][1]
+
+
+# get the feeds of a shard
+def shard_feed_urls(feed_urls, shard_count, shard_index):
+    ring = HashRing(shard_count)
+    return [x for x in feed_urls if ring.shard_for(x) == shard_index]
+
+
+def shard_filename(shard_dir, shard_index):
+    return os.path.join(shard_dir, f"shard-{shard_index}.db")
+
+
+# get the shard databases in a directory in shard order
+def find_shards(shard_dir):
+    filenames = glob.glob(os.path.join(shard_dir, "shard-[0-9]*.db"))
+    return sorted(filenames, key=lambda x: int(
+        os.path.basename(x)[len("shard-"):-len(".db")]))
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from feedparser import FeedParserDict
+
+import io
+import re
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+try:
+    from feedparser import _parse_date
+except ImportError:
+    from feedparser.datetimes import _parse_date
+
+try:
+    from feedparser import _sanitizeHTML as _sanitize_html
+except ImportError:
+    from feedparser.sanitizer import _sanitize_html
+
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_CONTENT = "{http://purl.org/rss/1.0/modules/content/}"
+_DC = "{http://purl.org/dc/elements/1.1/}"
+_RSS1 = "{http://purl.org/rss/1.0/}"
+_XHTML = "{http://www.w3.org/1999/xhtml}"
+_ENTRY_TAGS = ("item", _RSS1 + "item", _ATOM + "entry")
+
+# feedparser's pattern of an email address in an author string
+_email_re = re.compile(r"(([a-zA-Z0-9_\-.+]+)@((\[[0-9]{1,3}\.[0-9]{1,3}\."
+                       r"[0-9]{1,3}\.)|(([a-zA-Z0-9\-]+\.)+))([a-zA-Z]{2,4}|"
+                       r"[0-9]{1,3})(\]?))(\?subject=\S+)?")
+
+
+# raised when a feed can't be parsed incrementally and should be handed to
+# feedparser instead
+class StreamParseError(Exception):
+    pass
+
+
+# incrementally parse an RSS/Atom document, yielding its entries one at a time
+# in document order so the caller can stop early. entries have the same keys
+# and layout as feedparser's for the fields we store, their html is sanitized
+# by feedparser's sanitizer but unlike feedparser relative links aren't
+# resolved
+def iter_entries(data):
+    if etree is None:
+        raise StreamParseError("lxml isn't installed")
+
+    context = etree.iterparse(io.BytesIO(data), events=("end",),
+                              tag=_ENTRY_TAGS, resolve_entities=False,
+                              no_network=True)
+
+    try:
+        for _, element in context:
+            if element.tag == _ATOM + "entry":
+                entry = _atom_entry(element)
+            else:
+                entry = _rss_entry(element)
+
+            # free the entries we are done with
+            element.clear()
+
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+            if entry.get("link"):
+                yield entry
+    except etree.XMLSyntaxError as e:
+        raise StreamParseError(str(e))
+
+
+def _text(element):
+    return "".join(element.itertext()).strip()
+
+
+# get a text construct like feedparser's, html is sanitized
+def _detail(value, content_type):
+    if content_type in ("text/html", "application/xhtml+xml"):
+        value = _sanitize_html(value, "utf-8", content_type)
+
+    return FeedParserDict(type=content_type, language=None, base="",
+                          value=value)
+
+
+# add an author like feedparser, author and author_detail are the last one
+# and author is "name (email)" when both are known. an author's uri is also
+# copied to the entry's href
+def _add_author(entry, name=None, email=None, href=None):
+    detail = FeedParserDict((k, v) for k, v in (("name", name),
+                                                ("email", email),
+                                                ("href", href)) if v)
+
+    if name and email:
+        entry["author"] = f"{name} ({email})"
+    else:
+        entry["author"] = name or email
+
+    entry["author_detail"] = detail
+    entry.setdefault("authors", []).append(detail)
+
+    if href:
+        entry["href"] = href
+
+
+# add an rss author, which is a single string that may hold an email address.
+# like feedparser the author is the string as is and the details have it
+# split into name and email
+def _add_rss_author(entry, value):
+    name, email = value, None
+    match = _email_re.search(value)
+
+    if match:
+        email = match.group(0)
+
+        for x in (email, "()", "<>", "&lt;&gt;"):
+            name = name.replace(x, "")
+
+        name = name.strip()
+        name = name[1:] if name.startswith("(") else name
+        name = name[:-1] if name.endswith(")") else name
+        name = name.strip()
+
+    _add_author(entry, name, email)
+    entry["author"] = value
+
+
+def _set_date(entry, key, value):
+    entry[key] = value
+    entry[f"{key}_parsed"] = _parse_date(value)
+
+
+def _rss_entry(element):
+    entry = FeedParserDict()
+
+    for child in element:
+        if not isinstance(child.tag, str):
+            continue
+
+        tag = child.tag.replace(_RSS1, "")
+        value = _text(child)
+
+        if tag == "title":
+            entry["title_detail"] = _detail(value, "text/plain")
+            entry["title"] = entry["title_detail"]["value"]
+        elif tag == "link":
+            entry["links"] = [FeedParserDict(rel="alternate", type="text/html",
+                                             href=value)]
+            entry["link"] = value
+        elif tag == "description":
+            entry["summary_detail"] = _detail(value, "text/html")
+            entry["summary"] = entry["summary_detail"]["value"]
+        elif tag == _CONTENT + "encoded":
+            entry["content"] = [_detail(value, "text/html")]
+        elif tag in ("author", _DC + "creator"):
+            _add_rss_author(entry, value)
+        elif tag == "pubDate":
+            _set_date(entry, "published", value)
+        elif tag == _DC + "date":
+            _set_date(entry, "updated", value)
+        elif tag == "guid":
+            entry["id"] = value
+            entry["guidislink"] = child.get("isPermaLink", "true") == "true"
+
+    # like feedparser, a permalink guid is only the link of an entry without
+    # one
+    if "guidislink" in entry:
+        entry["guidislink"] = entry["guidislink"] and "link" not in entry
+
+        if entry["guidislink"]:
+            entry["link"] = entry["id"]
+
+    _summarize_content(entry)
+    return entry
+
+
+def _atom_entry(element):
+    entry = FeedParserDict()
+    links = []
+
+    for child in element:
+        if not isinstance(child.tag, str):
+            continue
+
+        tag = child.tag.replace(_ATOM, "")
+
+        if tag == "title":
+            entry["title_detail"] = _detail(_atom_value(child),
+                                            _content_type(child))
+            entry["title"] = entry["title_detail"]["value"]
+        elif tag == "link":
+            links.append(FeedParserDict(rel=child.get("rel", "alternate"),
+                                        type=child.get("type", "text/html"),
+                                        href=child.get("href", "")))
+        elif tag == "summary":
+            entry["summary_detail"] = _detail(_atom_value(child),
+                                              _content_type(child))
+            entry["summary"] = entry["summary_detail"]["value"]
+        elif tag == "content":
+            entry["content"] = [_detail(_atom_value(child),
+                                        _content_type(child))]
+        elif tag == "author":
+            _add_author(entry, *(_child_text(child, x)
+                                 for x in ("name", "email", "uri")))
+        elif tag in ("published", "updated"):
+            _set_date(entry, tag, _text(child))
+        elif tag == "id":
+            entry["id"] = _text(child)
+            entry["guidislink"] = False
+
+    if links:
+        entry["links"] = links
+        alternate = [x for x in links if x["rel"] == "alternate"]
+        entry["link"] = (alternate or links)[0]["href"]
+
+    _summarize_content(entry)
+    return entry
+
+
+# feedparser uses the content of an entry without a summary as its summary
+def _summarize_content(entry):
+    if "summary" not in entry and entry.get("content"):
+        entry["summary"] = entry["content"][0]["value"]
+
+
+def _child_text(element, name):
+    child = element.find(_ATOM + name)
+    return None if child is None else _text(child)
+
+
+# map an atom text construct type to the mime type feedparser reports
+def _content_type(element):
+    content_type = element.get("type", "text")
+    return {"text": "text/plain", "html": "text/html",
+            "xhtml": "application/xhtml+xml"}.get(content_type, content_type)
+
+
+def _atom_value(element):
+    if element.get("type") != "xhtml":
+        return _text(element)
+
+    # xhtml content is the markup inside its wrapper div
+    if len(element) == 1 and element[0].tag == _XHTML + "div":
+        element = element[0]
+
+    markup = (element.text or "") + "".join(
+        etree.tostring(x, encoding="unicode", with_tail=True) for x in element)
+    return markup.replace(f' xmlns="{_XHTML[1:-1]}"', "").strip()
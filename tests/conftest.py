@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+# the modules live in the root of the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from SQLite3 import Database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "articles.db"))
+
+
+# add a website with a feed, returns the feed url
+def add_feed(db, feed_url="http://example.com/feed",
+             website_url="http://example.com"):
+    db.insert_website(website_url, "Example", "en", "gb")
+    db.insert_feed(feed_url, website_url, "Feed")
+    return feed_url
+
+
+def article(url, feed="http://example.com/feed",
+            website="http://example.com", content='{"summary": "text"}',
+            **kwargs):
+    return dict(url=url, feed=feed, website=website, content=content,
+                **kwargs)
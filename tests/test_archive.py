@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import sqlite3
+
+from conftest import add_feed, article
+from Export import export_articles
+from SQLite3 import Database
+
+_times = ["2020-01-05 10:00:00", "2020-01-20 10:00:00",
+          "2020-02-01 00:00:00"]
+
+
+def _archived_db(tmp_path):
+    db = Database(str(tmp_path / "articles.db"), compression="zlib")
+    add_feed(db)
+    db.insert_articles([article(f"http://example.com/{i}", time=x,
+                                content=json.dumps({"summary": f"text {i}"}))
+                        for i, x in enumerate(_times)] +
+                       [article("http://example.com/new")])
+    db.insert_parsed_article("http://example.com/0", "python", "parsed")
+    return db
+
+
+def test_archive_export_reinsert(tmp_path):
+    db = _archived_db(tmp_path)
+    archive_dir = str(tmp_path / "archive")
+
+    assert db.archive_articles(archive_dir, 90, "zlib") == {"2020-01": 2,
+                                                            "2020-02": 1}
+    assert sorted(os.listdir(archive_dir)) == ["articles-2020-01.db",
+                                               "articles-2020-02.db"]
+    assert db.count_articles() == 1
+    assert db.count_articles(True) == 4
+    assert db.check_if_article_exists("https://example.com/1", True)
+    assert db.archive_articles(archive_dir, 90, "zlib") == {}
+
+    out = io.StringIO()
+    count, cursor = export_articles(db, out, "2000-01-01 00:00:00",
+                                    "2999-12-31 23:59:59", chunk_size=2)
+    exported = [json.loads(x) for x in out.getvalue().splitlines()]
+
+    assert count == 4
+    assert [x["url"] for x in exported[:3]] == [
+        f"http://example.com/{i}" for i in range(3)]
+    assert [x["time"] for x in exported[:3]] == _times
+    assert json.loads(exported[1]["content"]) == {"summary": "text 1"}
+    assert cursor.startswith(exported[-1]["time"])
+
+    # exported articles are never stored again, archived or not
+    assert db.insert_articles(exported) == (0, 4)
+    assert db.count_articles(True) == 4
+
+
+def test_partition_holds_parsed_articles(tmp_path):
+    db = _archived_db(tmp_path)
+    archive_dir = str(tmp_path / "archive")
+    db.archive_articles(archive_dir, 90, "zlib")
+
+    assert db.get_parsed_article("http://example.com/0") is None
+
+    conn = sqlite3.connect(os.path.join(archive_dir, "articles-2020-01.db"))
+    c = conn.execute("SELECT article, parser FROM parsed_articles")
+    assert c.fetchall() == [("http://example.com/0", "python")]
+    conn.close()
+
+
+def test_archived_articles_are_not_updated(tmp_path):
+    db = _archived_db(tmp_path)
+    db.archive_articles(str(tmp_path / "archive"), 90, "zlib")
+
+    for url in ("http://example.com/0", "https://example.com/0"):
+        assert db.update_article(url, "http://example.com/feed",
+                                 "http://example.com", "{}") == 0
+
+    assert db.count_articles() == 1
+    assert db.count_articles(True) == 4
+
+
+def _archive_old_article(db, archive_dir, url, time):
+    db.insert_articles([article(url, time=time)])
+    assert db.archive_articles(archive_dir, 90, "zlib") == {"2020-01": 1}
+
+
+def test_archived_rowids_are_not_reused(tmp_path):
+    db = _archived_db(tmp_path)
+    archive_dir = str(tmp_path / "archive")
+    db.archive_articles(archive_dir, 90, "zlib")
+
+    # the newest article is archived each time
+    _archive_old_article(db, archive_dir, "http://example.com/3",
+                         "2020-01-10 10:00:00")
+    _archive_old_article(db, archive_dir, "http://example.com/4",
+                         "2020-01-11 10:00:00")
+
+    assert db.count_articles(True) == 6
+    rowids = [x["rowid"] for x in db.iter_articles("2000-01-01 00:00:00",
+                                                   "2999-12-31 23:59:59")]
+    assert len(rowids) == len(set(rowids)) == 6
+
+
+def test_old_articles_table_is_rebuilt(tmp_path):
+    filename = str(tmp_path / "articles.db")
+    db = _archived_db(tmp_path)
+    archive_dir = str(tmp_path / "archive")
+    db.archive_articles(archive_dir, 90, "zlib")
+    _archive_old_article(db, archive_dir, "http://example.com/3",
+                         "2020-01-10 10:00:00")
+    del db
+
+    # put back the articles table of older versions, which reuses rowids
+    conn = sqlite3.connect(filename)
+    conn.executescript(
+        "CREATE TABLE old_articles (url TEXT PRIMARY KEY NOT NULL, "
+        "time TIMESTAMP DEFAULT CURRENT_TIMESTAMP, content TEXT NOT NULL, "
+        "feed TEXT, website TEXT NOT NULL, url_key TEXT, title TEXT, "
+        "published TIMESTAMP, author TEXT, guid TEXT); "
+        "INSERT INTO old_articles (rowid, url, time, content, feed, website, "
+        "url_key) SELECT rowid, url, time, content, feed, website, url_key "
+        "FROM articles; DROP TABLE articles; "
+        "ALTER TABLE old_articles RENAME TO articles;")
+    conn.close()
+
+    db = Database(filename, compression="zlib")
+    assert db.search_articles("text") != []
+    assert db.insert_articles([article("http://example.com/5")]) == (1, 0)
+
+    c = db._conn.execute("SELECT rowid, url FROM articles ORDER BY rowid")
+    assert c.fetchall() == [(4, "http://example.com/new"),
+                            (6, "http://example.com/5")]
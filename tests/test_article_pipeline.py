@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+from ArticlePipeline import ArticlePipeline
+from conftest import add_feed, article
+
+Response = namedtuple("Response", ["status_code", "text"])
+
+
+class _Parser(object):
+    def parse(self, url):
+        if url.endswith("/broken"):
+            raise ValueError("no body")
+
+        if url.endswith("/missing"):
+            return Response(404, "")
+
+        return Response(200, f"parsed {url}")
+
+
+def test_failed_parses_are_counted(db):
+    add_feed(db)
+    urls = ["http://example.com/a", "http://example.com/broken",
+            "http://example.com/missing", "http://example.com/b"]
+    db.insert_articles([article(x) for x in urls])
+
+    pipeline = ArticlePipeline(db, _Parser(), "test", workers=2)
+
+    assert pipeline.run() == (2, 2)
+    assert db.get_parsed_article("http://example.com/a") is not None
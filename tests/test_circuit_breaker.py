@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import HTTPRequest
+from HTTPRequest import CircuitBreaker
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(HTTPRequest, "time", clock)
+    return clock
+
+
+def test_circuit_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker(threshold=3, reset_timeout=60)
+
+    for _ in range(2):
+        breaker.record_failure("a.example", "503")
+
+    assert breaker.allow("a.example")
+
+    breaker.record_failure("a.example", "503")
+
+    assert not breaker.allow("a.example")
+    assert breaker.allow("b.example")
+
+
+def test_half_open_circuit_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+    breaker.record_failure("a.example", "503")
+    clock.now += 61
+
+    assert breaker.allow("a.example")
+    assert not breaker.allow("a.example")
+
+    # a failed probe doubles the timeout
+    breaker.record_failure("a.example", "503")
+    clock.now += 61
+    assert not breaker.allow("a.example")
+    clock.now += 60
+    assert breaker.allow("a.example")
+
+    breaker.record_success("a.example")
+    assert breaker.allow("a.example")
+    assert breaker.allow("a.example")
+
+
+def test_snapshot_has_only_updated_hosts(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+    breaker.load([("a.example", 1, 1060, "503"), ("b.example", 0, None, None)])
+    breaker.record_failure("c.example", "timeout")
+    breaker.record_success("b.example")
+
+    assert breaker.snapshot() == [("c.example", 1, 1060.0, "timeout")]
+    assert breaker.snapshot() == []
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import SQLite3
+from conftest import add_feed, article
+from SQLite3 import Database
+
+
+def test_compress_existing_content(tmp_path):
+    filename = str(tmp_path / "articles.db")
+    db = Database(filename)
+    add_feed(db)
+    db.insert_articles([article(f"http://example.com/{i}") for i in range(3)])
+
+    with pytest.raises(ValueError):
+        db.compress_existing_content()
+
+    db = Database(filename, compression="zlib")
+    assert db.compress_existing_content() == 3
+    assert db.compress_existing_content() == 0
+
+
+@pytest.mark.parametrize("sample_size, sampled", [(100, 50), (10, None)])
+def test_dictionary_samples(db, monkeypatch, sample_size, sampled):
+    samples = []
+    monkeypatch.setattr(SQLite3, "train_dictionary",
+                        lambda x, dict_size: samples.extend(x))
+    add_feed(db)
+    db.insert_articles([article(f"http://example.com/{i}",
+                                content=f'{{"summary": "{i}"}}')
+                        for i in range(50)])
+
+    assert db.train_compression_dictionary(sample_size) is None
+    assert len(set(samples)) == len(samples)
+
+    if sampled is None:
+        assert 1 <= len(samples) <= 50
+    else:
+        assert len(samples) == sampled
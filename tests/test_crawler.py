@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from conftest import add_feed
+from Crawler import Crawler
+from FeedParser import FeedParser
+
+
+class _FeedParser(FeedParser):
+    def __init__(self):
+        super().__init__(None)
+        self.stored = []
+
+    def get_feed_cache(self, feed_url):
+        return None
+
+    def fetch_feed(self, feed_url, cache=None):
+        if feed_url.endswith("/broken"):
+            raise KeyError("link")
+
+        return super().error_result(feed_url, RuntimeError("unused"))
+
+    def store_feed(self, result):
+        self.stored.append(result)
+        return 0
+
+
+def test_crawl_survives_a_failing_fetch():
+    feed_parser = _FeedParser()
+    urls = ["http://a.example/broken", "http://a.example/ok",
+            "http://b.example/ok"]
+
+    assert Crawler(feed_parser, 2, 1).crawl(urls) == 3
+
+    results = {x.url: x for x in feed_parser.stored}
+    assert set(results) == set(urls)
+    assert results["http://a.example/broken"].status_code == 604
+    assert "KeyError" in results["http://a.example/broken"].text
+
+
+_rss = (b'<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel>'
+        b"<title>Feed</title>" +
+        b"".join(f"<item><title>{i}</title><link>http://example.com/{i}"
+                 f"</link></item>".encode("utf-8") for i in range(5)) +
+        b"</channel></rss>")
+
+
+class _Response(object):
+    status_code = 200
+    content = _rss
+    text = _rss.decode("utf-8")
+    headers = {}
+
+
+class _HTTP(object):
+    def get(self, url, headers=None):
+        return _Response()
+
+
+class _Seen(object):
+    def might_contain(self, url):
+        return True
+
+    def check(self, url):
+        return True
+
+    def add(self, url):
+        pass
+
+
+def test_stream_stats_are_counted_when_stored(db):
+    feed_url = add_feed(db)
+    feed_parser = FeedParser(db, seen=_Seen(), http=_HTTP(), stream=True,
+                             stop_after_known=2)
+    result = feed_parser.fetch_feed(feed_url)
+
+    assert result.stream == "stopped_early"
+    assert len(result.entries) == 2
+    assert not feed_parser.stats
+
+    feed_parser.store_feed(result)
+    assert feed_parser.stats == {"stopped_early": 1}
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+import pytest
+
+from conftest import add_feed, article
+from EntrySchema import compact_entry, dumps
+from SQLite3 import Database
+
+_entry = {"title": "A", "title_detail": {"value": "A"}, "link": "http://a",
+          "links": [{"rel": "alternate", "href": "http://a"},
+                    {"rel": "enclosure", "href": "http://a.mp3"}],
+          "id": "http://a", "guidislink": False, "author": "Ann",
+          "authors": [{"name": "Ann"}, {"name": "Bob"}],
+          "author_detail": {"name": "Ann", "email": "ann@example.com"},
+          "published": "Tue, 01 Jan 2019 09:00:00 +0900",
+          "published_parsed": list(time.gmtime(1546300800)),
+          "summary": "text"}
+
+
+def test_compact_entry_keeps_what_the_columns_lose():
+    compact = compact_entry(_entry)
+
+    assert compact == {"links": [{"rel": "enclosure",
+                                  "href": "http://a.mp3"}],
+                       "authors": _entry["authors"],
+                       "author_detail": _entry["author_detail"],
+                       "published": _entry["published"], "summary": "text"}
+
+
+@pytest.mark.parametrize("method", ["zlib", "zstd"])
+def test_compacting_keeps_the_stored_compression(tmp_path, method):
+    filename = str(tmp_path / "articles.db")
+    db = Database(filename, compression=method)
+    add_feed(db)
+
+    if method == "zstd":
+        db.insert_articles([article(f"http://example.com/{i}",
+                                    content=dumps(dict(_entry,
+                                                       summary=f"text {i}")))
+                            for i in range(20)])
+        db.train_compression_dictionary()
+
+    db.insert_articles([article("http://example.com/a",
+                                content=dumps(_entry))])
+    c = db._conn.execute("SELECT content FROM articles "
+                         "WHERE url='http://example.com/a'")
+    stored = c.fetchone()[0]
+    assert stored[0] == (3 if method == "zstd" else 1)
+    del db
+
+    db = Database(filename)
+    assert db.compact_existing_articles() > 0
+
+    c = db._conn.execute("SELECT content FROM articles "
+                         "WHERE url='http://example.com/a'")
+    content = c.fetchone()[0]
+    assert isinstance(content, bytes)
+    # the format byte, and the dictionary id of zstd content
+    prefix = 5 if method == "zstd" else 1
+    assert content[:prefix] == stored[:prefix]
+    assert json.loads(db._codec.decompress(content)) == compact_entry(_entry)
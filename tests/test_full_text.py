@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import json
+
+from conftest import add_feed, article
+
+
+def _content(summary):
+    return json.dumps({"summary": summary})
+
+
+def _urls(results):
+    return [x["url"] for x in results]
+
+
+def _add_articles(db):
+    add_feed(db)
+    db.insert_articles([
+        article("http://example.com/body", title="Weather report",
+                content=_content("rain on monday")),
+        article("http://example.com/title", title="Election results",
+                content=_content("the votes were counted")),
+        article("http://example.com/summary", title="Local news",
+                content=_content("<p>the <b>election</b> campaign</p>"),
+                time="2020-01-05 10:00:00")])
+    db.insert_parsed_article("http://example.com/body", "python",
+                             json.dumps({"content": "<p>an election "
+                                                    "day forecast</p>"}))
+
+
+def test_search_finds_new_articles_and_parsed_text(db):
+    _add_articles(db)
+
+    assert _urls(db.search_articles("monday")) == ["http://example.com/body"]
+    assert _urls(db.search_articles("campaign")) == [
+        "http://example.com/summary"]
+    assert _urls(db.search_articles("forecast")) == [
+        "http://example.com/body"]
+    assert db.search_articles("snow") == []
+
+    # updated articles are searched by their new summary
+    db.update_article("http://example.com/title", "http://example.com/feed",
+                      "http://example.com", _content("a recount"))
+    assert _urls(db.search_articles("recount")) == [
+        "http://example.com/title"]
+    assert db.search_articles("counted") == []
+
+
+def test_search_ranks_title_matches_first(db):
+    _add_articles(db)
+    results = db.search_articles("election")
+
+    assert _urls(results) == ["http://example.com/title",
+                              "http://example.com/summary",
+                              "http://example.com/body"]
+    assert [x["score"] for x in results] == sorted(x["score"]
+                                                   for x in results)
+    assert _urls(db.search_articles("election", "2020-02-01 00:00:00")) == [
+        "http://example.com/title", "http://example.com/body"]
+    assert _urls(db.search_articles("election", limit=1, offset=1)) == [
+        "http://example.com/summary"]
+
+
+def test_archived_articles_are_unindexed(db, tmp_path):
+    _add_articles(db)
+    assert db.archive_articles(str(tmp_path / "archive"), 90,
+                               "zlib") == {"2020-01": 1}
+
+    assert db.search_articles("campaign") == []
+    assert _urls(db.search_articles("election")) == [
+        "http://example.com/title", "http://example.com/body"]
+
+
+def test_rebuild_gives_the_same_results(db):
+    _add_articles(db)
+    queries = ["election", "monday", "forecast", "title:election"]
+    before = [db.search_articles(x) for x in queries]
+
+    assert db.rebuild_full_text_index(batch_size=2) == 3
+    assert [db.search_articles(x) for x in queries] == before
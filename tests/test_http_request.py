@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import gzip
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import feedparser
+import pytest
+
+from HTTPRequest import HTTPRequest
+
+_rss = (b'<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel>'
+        b"<title>Feed</title><item><title>A</title>"
+        b"<link>http://example.com/a</link></item></channel></rss>")
+
+_encoders = {"gzip": gzip.compress, "deflate": zlib.compress}
+
+try:
+    import brotli
+    _encoders["br"] = brotli.compress
+except ImportError:
+    pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        encodings = [x.strip() for x in
+                     self.headers.get("Accept-Encoding", "").split(",")]
+        self.server.accepted.append(encodings)
+        encoding = self.path.strip("/")
+
+        # a server only uses an encoding the client asked for
+        if encoding not in encodings:
+            encoding = "identity"
+
+        body = _encoders.get(encoding, lambda x: x)(_rss)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    server.accepted = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "br"])
+def test_encoded_response_is_decoded(server, encoding):
+    url = f"http://127.0.0.1:{server.server_port}/{encoding}"
+    res = HTTPRequest(0, 1).get(url)
+
+    # br is only asked for when it can be decoded
+    assert "br" not in server.accepted[-1] or "br" in _encoders
+    assert res.status_code == 200
+    assert res.content == _rss
+    assert feedparser.parse(res.text).entries[0].link == "http://example.com/a"
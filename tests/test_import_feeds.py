@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import json
+
+import pytest
+
+from conftest import add_feed, article
+from Import import _iter_json_array, feed_keys, read_feeds
+
+
+def _feed(url, name, website_url, website_name="A"):
+    return dict(zip(feed_keys, (url, name, website_url, website_name, "en",
+                                "gb")))
+
+
+def test_import_counts(db):
+    add_feed(db, "http://a.com/feed", "http://a.com")
+    db.insert_feed("http://a.com/old", "http://a.com", "Old")
+    db.insert_articles([article("http://a.com/1", feed="http://a.com/old",
+                                website="http://a.com")])
+    db._conn.execute("UPDATE websites SET name='A'")
+    db._conn.execute("UPDATE feeds SET name='Feed' "
+                     "WHERE url='http://a.com/feed'")
+
+    counts = db.import_feeds([_feed("http://a.com/feed", "Feed",
+                                    "http://a.com"),
+                              _feed("https://a.com/old", "Old",
+                                    "http://a.com"),
+                              _feed("http://b.com/feed", "B", "http://b.com",
+                                    "B"),
+                              _feed("http://b.com/feed", "B2",
+                                    "http://b.com", "B")])
+
+    assert counts == {"websites": {"inserted": 1, "updated": 0,
+                                   "unchanged": 1, "moved": 0},
+                      "feeds": {"inserted": 1, "updated": 1, "unchanged": 1,
+                                "moved": 1}}
+    assert sorted(db.get_all_feed_urls()) == [
+        "http://a.com/feed", "http://b.com/feed", "https://a.com/old"]
+    assert db.get_feed_details("http://b.com/feed")["name"] == "B2"
+
+    c = db._conn.execute("SELECT feed FROM articles")
+    assert c.fetchone()[0] == "https://a.com/old"
+
+
+def test_import_again_is_unchanged(db):
+    feeds = [_feed(f"http://a.com/{i}", f"Feed {i}", "http://a.com")
+             for i in range(5)]
+    db.import_feeds(feeds)
+
+    assert db.import_feeds(feeds)["feeds"] == {
+        "inserted": 0, "updated": 0, "unchanged": 5, "moved": 0}
+
+
+def test_json_array_values_span_chunks():
+    feeds = [_feed(f"http://a.com/{i}", f"Feed {i}", "http://a.com")
+             for i in range(20)]
+    text = json.dumps(feeds, indent=1)
+
+    assert list(_iter_json_array(io.StringIO(text), chunk_size=7)) == feeds
+    assert list(_iter_json_array(io.StringIO("[ ]"))) == []
+
+    with pytest.raises(ValueError):
+        list(_iter_json_array(io.StringIO('{"url": "x"}')))
+
+
+def test_read_feeds_formats(tmp_path):
+    feeds = [_feed(f"http://a.com/{i}", f"Feed {i}", "http://a.com")
+             for i in range(3)]
+    filename = str(tmp_path / "feeds.jsonl.gz")
+
+    with gzip.open(filename, "wt", encoding="utf-8") as f:
+        f.write("".join(json.dumps(x) + "\n" for x in feeds))
+
+    assert list(read_feeds(filename)) == feeds
+
+    filename = str(tmp_path / "feeds.csv")
+
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(",".join(feed_keys) + "\n")
+        f.write("http://a.com/0,Feed 0,http://a.com,A,en\n")
+
+    with pytest.raises(ValueError):
+        list(read_feeds(filename))
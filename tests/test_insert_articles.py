@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from conftest import add_feed, article
+
+
+def test_skips_stored_article_with_other_protocol(db):
+    add_feed(db)
+    assert db.insert_articles([article("http://example.com/a")]) == (1, 0)
+    assert db.insert_articles([article("https://example.com/a/")]) == (0, 1)
+    assert db.count_articles() == 1
+
+
+def test_skips_duplicates_within_a_batch(db):
+    add_feed(db)
+    articles = [article("http://example.com/a"),
+                article("https://example.com/a?utm_source=rss"),
+                article("http://example.com/b")]
+
+    assert db.insert_articles(articles, chunk_size=1) == (2, 1)
+    assert db.count_articles() == 2
+
+
+def test_skips_archived_articles(db):
+    add_feed(db)
+    db._conn.execute("INSERT INTO archived_urls (url_key, month) "
+                     "VALUES ('example.com/a', '2020-01')")
+
+    assert db.insert_articles([article("https://example.com/a"),
+                               article("https://example.com/b")]) == (1, 1)
+    assert not db.check_if_article_exists("https://example.com/a")
+
+
+def test_failed_batch_is_rolled_back(db):
+    add_feed(db)
+    articles = [article("http://example.com/a"),
+                {"url": "http://example.com/b"}]
+
+    with pytest.raises(KeyError):
+        db.insert_articles(articles, chunk_size=1)
+
+    assert db.count_articles() == 0
+    assert not db._conn.in_transaction
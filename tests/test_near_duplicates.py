@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import json
+
+from conftest import add_feed, article
+from SQLite3 import Database
+
+_text = ("the council approved the new budget for schools and water on "
+         "tuesday after a long debate about energy prices and growth")
+
+
+def _content(text):
+    return json.dumps({"summary": text})
+
+
+def test_near_duplicates_are_clustered(tmp_path):
+    db = Database(str(tmp_path / "articles.db"), near_duplicates=True)
+    add_feed(db)
+    unrelated = [article(f"http://example.com/other/{i}",
+                         content=_content(f"story {i} about the league "
+                                          f"season number {i} and police "
+                                          f"report {i * 7} with a record"))
+                 for i in range(300)]
+    db.insert_articles([article("http://example.com/a",
+                                content=_content(_text))] + unrelated)
+    db.insert_articles([article("http://example.com/b",
+                                content=_content(_text + " evening"))])
+
+    assert db.get_near_duplicates("http://example.com/b") == [
+        "http://example.com/a"]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from SQLite3 import normalize_url
+
+
+@pytest.mark.parametrize("url, key", [
+    ("http://example.com/a", "example.com/a"),
+    ("https://example.com/a", "example.com/a"),
+    ("http://EXAMPLE.com/Path", "example.com/Path"),
+    ("  http://example.com/a  ", "example.com/a"),
+    ("http://example.com:80/a", "example.com/a"),
+    ("https://example.com:443/a", "example.com/a"),
+    ("http://example.com:8080/a", "example.com:8080/a"),
+    ("http://example.com/a/", "example.com/a"),
+    ("http://example.com/a///", "example.com/a"),
+    ("http://example.com/", "example.com"),
+    ("http://example.com/a?utm_source=x&id=1", "example.com/a?id=1"),
+    ("http://example.com/a?UTM_Medium=x&fbclid=y&gclid=z", "example.com/a"),
+    ("http://example.com/a?b=2&a=1", "example.com/a?b=2&a=1"),
+    ("http://example.com/a?q=", "example.com/a?q="),
+    ("http://example.com/a#top", "example.com/a#top"),
+    ("http://example.com/a/?id=1#top", "example.com/a?id=1#top"),
+])
+def test_normalize_url(url, key):
+    assert normalize_url(url) == key
+
+
+def test_missing_url_keys_are_backfilled(tmp_path):
+    from SQLite3 import Database
+
+    filename = str(tmp_path / "articles.db")
+    db = Database(filename)
+    db.insert_website("http://example.com:80", "Example", "en", "gb")
+    db._conn.execute("UPDATE websites SET url_key=NULL")
+    db._conn.commit()
+    del db
+
+    db = Database(filename)
+    assert db.check_if_website_exists("https://example.com", True)
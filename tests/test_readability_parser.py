@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+import threading
+
+from ReadabilityParser import ArticleParser, _Server
+
+
+# a process that ignores SIGINT, like a server stuck finishing requests
+def _stubborn_process():
+    return subprocess.Popen([sys.executable, "-c",
+                             "import signal, time; "
+                             "signal.signal(signal.SIGINT, signal.SIG_IGN); "
+                             "print('ready', flush=True); time.sleep(60)"],
+                            stdout=subprocess.PIPE)
+
+
+def test_stop_kills_a_server_that_ignores_sigint():
+    server = _Server("", 0, "", stop_timeout=0.2)
+    server._process = _stubborn_process()
+    server._process.stdout.readline()
+
+    server.stop()
+
+    assert server._process.returncode is not None
+    server._process.stdout.close()
+
+
+class _Response(object):
+    status_code = 600
+
+
+class _HTTP(object):
+    def get(self, url):
+        return _Response()
+
+
+class _BrokenServer(_Server):
+    def restart(self):
+        self.restarted = True
+        raise RuntimeError("port in use")
+
+
+def _parser(*servers):
+    parser = ArticleParser.__new__(ArticleParser)
+    parser._http = _HTTP()
+    parser._lock = threading.Lock()
+    parser._servers = list(servers)
+    return parser
+
+
+def test_attached_server_isnt_restarted():
+    server = _BrokenServer("", 1, "")
+    server.attached = True
+    parser = _parser(server)
+
+    assert parser.parse("http://example.com/a").status_code == 600
+    assert server.failed
+    assert not hasattr(server, "restarted")
+
+
+def test_failed_restart_returns_the_failure():
+    servers = [_BrokenServer("", 1, ""), _BrokenServer("", 2, "")]
+    parser = _parser(*servers)
+
+    assert parser.parse("http://example.com/a").status_code == 600
+    assert all(x.failed and x.restarted for x in servers)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from conftest import add_feed
+from FeedParser import FeedResult
+from Scheduler import Scheduler
+
+
+def _entries(*ages):
+    now = time.time()
+    return [{"published_parsed": time.gmtime(now - x)} for x in ages]
+
+
+def _schedule(db, feed_url):
+    c = db._conn.execute("SELECT interval FROM feed_schedule WHERE feed=?",
+                         (feed_url,))
+    return c.fetchone()[0]
+
+
+@pytest.mark.parametrize("ages, interval", [
+    # a post every 10 minutes is polled at the minimum interval
+    ((0, 600, 1200, 1800), 900),
+    # a post every 4 hours is polled every 2 hours
+    ((0, 14400, 28800), 7200),
+    # a post a week is polled at the maximum interval
+    ((0, 604800, 1209600), 86400),
+    # a feed that went quiet for longer than its usual gap slows down
+    ((36000, 36600, 37200), 18000),
+    # too few entries to tell
+    ((0,), 86400)])
+def test_estimate_interval_is_clamped(db, ages, interval):
+    scheduler = Scheduler(db, 900, 86400)
+
+    assert scheduler.estimate_interval("http://example.com/feed",
+                                       _entries(*ages)) == pytest.approx(
+                                           interval, abs=2)
+
+
+def test_backoff_doubles_up_to_the_maximum(db):
+    scheduler = Scheduler(db, 900, 86400, max_backoff=7200)
+
+    assert [scheduler.backoff_interval(x) for x in range(1, 6)] == [
+        900, 1800, 3600, 7200, 7200]
+    assert scheduler.backoff_interval(1000) == 7200
+
+
+def test_failures_back_off_and_gone_feeds_become_inactive(db):
+    feed_url = add_feed(db)
+    scheduler = Scheduler(db, 900, 86400, gone_after=2)
+
+    scheduler.reschedule(FeedResult(feed_url, 500, "", None, None, None), 0)
+    assert _schedule(db, feed_url) == 900
+    scheduler.reschedule(FeedResult(feed_url, 404, "", None, None, None), 0)
+    assert _schedule(db, feed_url) == 1800
+    assert db.get_active_feed_urls() == []
+
+    scheduler.reschedule(FeedResult(feed_url, 410, "", None, None, None), 0)
+    assert _schedule(db, feed_url) == 3600
+    assert db.get_due_feed_urls() == []
+    assert db.get_next_poll_time() is None
+
+    db.reactivate_feeds()
+    scheduler.reschedule(FeedResult(feed_url, 200, None, _entries(0, 14400),
+                                    None, None), 1)
+    c = db._conn.execute("SELECT failures, gone, inactive FROM feed_health")
+    assert c.fetchone() == (0, 0, 0)
+    assert _schedule(db, feed_url) == pytest.approx(7200, abs=2)
+
+
+def test_open_circuit_isnt_a_feed_failure(db):
+    feed_url = add_feed(db)
+    scheduler = Scheduler(db, 900, 86400)
+
+    for _ in range(3):
+        scheduler.reschedule(FeedResult(feed_url, 602, "Circuit open", None,
+                                        None, None), 0)
+
+    assert _schedule(db, feed_url) == 900
+    c = db._conn.execute("SELECT COUNT(*) FROM feed_health")
+    assert c.fetchone()[0] == 0
+
+
+def test_due_feeds_are_ordered_by_next_poll(db):
+    urls = [add_feed(db, f"http://example.com/{i}") for i in range(4)]
+    polls = ["2020-01-03 00:00:00", "2020-01-01 00:00:00", None,
+             "2999-01-01 00:00:00"]
+
+    for url, next_poll in zip(urls, polls):
+        if next_poll is not None:
+            db._conn.execute("INSERT INTO feed_schedule (feed, next_poll, "
+                             "interval) VALUES (?, ?, 900)", (url, next_poll))
+
+    db._conn.commit()
+
+    # feeds that were never polled come first
+    assert db.get_due_feed_urls() == [urls[2], urls[1], urls[0]]
+    assert db.get_next_poll_time() == "2020-01-01 00:00:00"
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import time
+
+from conftest import add_feed, article
+from SQLite3 import Database
+from Sharding import HashRing, shard_feed_urls, shard_filename
+
+
+def test_a_host_is_in_one_shard():
+    feed_urls = [f"{scheme}://host{i % 40}.example.com:{port}/feed/{i}"
+                 for i in range(400)
+                 for scheme, port in (("http", 80), ("https", 8443))]
+    shards = [shard_feed_urls(feed_urls, 4, i) for i in range(4)]
+    hosts = [{x.split("/")[2].split(":")[0] for x in shard}
+             for shard in shards]
+
+    assert sum(len(x) for x in shards) == len(feed_urls)
+    assert sum(len(x) for x in hosts) == 40
+    assert all(hosts)
+
+
+def test_shard_for_ignores_case_and_protocol():
+    ring = HashRing(8)
+
+    assert (ring.shard_for("http://Example.com/a") ==
+            ring.shard_for("https://example.com:443/b"))
+
+
+def _crawl_shard(tmp_path, main_filename, urls):
+    shard = Database(shard_filename(str(tmp_path), 0))
+    shard.seed_shard(main_filename, ["http://example.com/feed"])
+    shard.insert_articles([article(x) for x in urls])
+    return shard
+
+
+def test_merging_a_shard_twice_is_a_no_op(tmp_path):
+    main_filename = str(tmp_path / "main.db")
+    db = Database(main_filename)
+    add_feed(db)
+    db.insert_articles([article("http://example.com/a")])
+
+    shard = _crawl_shard(tmp_path, main_filename,
+                         ["https://example.com/a", "http://example.com/b",
+                          "http://example.com/c"])
+    filename = shard_filename(str(tmp_path), 0)
+
+    assert db.merge_shard(filename) == (2, 1)
+    assert db.merge_shard(filename) == (0, 0)
+    assert db.count_articles() == 3
+    assert shard.count_articles() == 0
+
+    # the shard keeps crawling into the emptied db and still knows about the
+    # articles it merged
+    shard.insert_articles([article("http://example.com/d"),
+                           article("http://example.com/b")])
+    assert shard.count_articles() == 1
+
+    assert db.merge_shard(filename) == (1, 0)
+    assert db.count_articles() == 4
+
+
+def test_merge_maps_to_one_stored_url_per_key(tmp_path):
+    main_filename = str(tmp_path / "main.db")
+    db = Database(main_filename)
+    add_feed(db)
+    # the same feed stored under both protocols
+    db._conn.execute("INSERT INTO feeds (url, name, website, url_key) "
+                     "SELECT 'https://example.com/feed/', name, website, "
+                     "url_key FROM feeds")
+    db._conn.commit()
+
+    shard = _crawl_shard(tmp_path, main_filename,
+                         ["http://example.com/a", "http://example.com/b"])
+    shard.update_feed_cache("https://example.com/feed/", "etag", None, None)
+    filename = shard_filename(str(tmp_path), 0)
+
+    assert db.merge_shard(filename) == (2, 0)
+    assert db.count_articles() == 2
+    c = db._conn.execute("SELECT DISTINCT feed FROM articles")
+    assert c.fetchall() == [("http://example.com/feed",)]
+    c = db._conn.execute("SELECT feed, etag FROM feed_cache")
+    assert c.fetchall() == [("https://example.com/feed/", "etag")]
+
+
+def test_merge_keeps_the_newest_host_health(tmp_path):
+    main_filename = str(tmp_path / "main.db")
+    db = Database(main_filename)
+    add_feed(db)
+    db.update_host_health([("example.com", 1, None, "503")])
+    shards = []
+
+    for i in range(2):
+        shard = Database(shard_filename(str(tmp_path), i))
+        shard.seed_shard(main_filename, ["http://example.com/feed"])
+        shards.append(shard)
+
+    # the first shard saw the host fail again, the second didn't touch it.
+    # update times have millisecond precision
+    time.sleep(0.01)
+    shards[0].update_host_health([("example.com", 5, 2000000000, "504")])
+
+    for i in range(2):
+        db.merge_shard(shard_filename(str(tmp_path), i))
+
+    assert db.get_host_health() == [("example.com", 5, 2000000000, "504")]
+
+    # a shard seeded afterwards starts from the merged state
+    shards[1].seed_shard(main_filename, ["http://example.com/feed"])
+    assert shards[1].get_host_health() == db.get_host_health()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import feedparser
+import pytest
+
+from EntrySchema import serialize_entry
+from StreamParser import iter_entries
+
+_feeds = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feeds")
+
+
+def _read(name):
+    with open(os.path.join(_feeds, name), "rb") as f:
+        return f.read()
+
+
+# the stream parser stores the same articles as feedparser whatever the
+# schema
+@pytest.mark.parametrize("name", ["rss.xml", "atom.xml"])
+@pytest.mark.parametrize("schema", ["full", "compact"])
+def test_stored_fields_match_feedparser(name, schema):
+    data = _read(name)
+    expected = feedparser.parse(data).entries
+    entries = list(iter_entries(data))
+
+    assert len(entries) == len(expected)
+
+    for entry, other in zip(entries, expected):
+        article = serialize_entry(entry, schema)
+        other_article = serialize_entry(other, schema)
+
+        assert entry.link == other.link
+        assert json.loads(article.pop("content")) == json.loads(
+            other_article.pop("content"))
+        assert article == other_article
+
+
+def test_html_is_sanitized():
+    entries = list(iter_entries(_read("rss.xml"))) + list(
+        iter_entries(_read("atom.xml")))
+    values = [x.get("summary", "") for x in entries] + [
+        y["value"] for x in entries for y in x.get("content", [])]
+
+    assert not [x for x in values if "<script" in x or "onclick" in x]
+
+
+@pytest.mark.parametrize("author, name, email", [
+    ("ann@example.com (Ann)", "Ann", "ann@example.com"),
+    ("Ann &lt;ann@example.com&gt;", "Ann", "ann@example.com"),
+    ("Ann", "Ann", None)])
+def test_rss_author_details(author, name, email):
+    data = ('<rss version="2.0"><channel><item>'
+            f"<link>http://example.com/a</link><author>{author}</author>"
+            "</item></channel></rss>").encode("utf-8")
+    entry = next(iter_entries(data))
+
+    assert entry.author_detail.get("name") == name
+    assert entry.author_detail.get("email") == email
+    assert entry.author == feedparser.parse(data).entries[0].author